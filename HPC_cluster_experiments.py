@@ -15,21 +15,89 @@ Features:
 """
 
 import os
+import re
+import copy
 import json
+import math
+import time
+import queue
+import argparse
 import logging
+import shutil
+import threading
+import glob
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from typing import Dict, List, Optional, Any, Tuple, Callable, Iterable, Iterator, TYPE_CHECKING
+from dataclasses import dataclass, asdict, field
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
 import warnings
+from llm_cassette import LLMCassette
+from memory_diagnostics import MemoryMonitor, format_report
 warnings.filterwarnings("ignore")
 
+# torch and transformers take seconds to import: they are imported where first used, so
+# bookkeeping runs (cassette replay, merges, --help) never pay for them
+if TYPE_CHECKING:
+    import torch
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Static start of every ASF system prompt; the session context follows it
+ASF_INSTRUCTIONS = """You are the Agentic Startup Factory (ASF), an AI assistant that helps ideators refine startup ideas through structured considerations. You guide users through 8 core consideration categories to develop comprehensive startup concepts.
+
+Your role is to:
+1. Ask insightful questions to help develop ideas
+2. Provide constructive feedback and suggestions
+3. Guide users toward completing all 8 considerations
+4. Maintain focus on practical, actionable advice
+5. Encourage ethical business practices and community collaboration
+6. Suggest when considerations need more detail (minimum 100 words each)
+
+Current session context:
+"""
+
+# Structured section a turn may end with, in the same format the web app's OpenAI service parses
+UPDATES_START = "=== CONSIDERATION UPDATES ==="
+UPDATES_END = "=== END CONSIDERATION UPDATES ==="
+UPDATES_INSTRUCTIONS = f"""
+
+After your conversational response, include updates for any considerations this turn developed, in this exact format:
+
+{UPDATES_START}
+[consideration_id]: [content]
+{UPDATES_END}
+"""
+
+def parse_consideration_updates(response: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Split a response into its conversational text and its consideration updates section
+    
+    Args:
+        response: Raw model response
+        
+    Returns:
+        (response without the updates section, {consideration_id: content})
+    """
+    start = response.find(UPDATES_START)
+    if start == -1:
+        return response, {}
+    end = response.find(UPDATES_END, start)
+    section = response[start + len(UPDATES_START):end if end != -1 else len(response)]
+    updates = {}
+    for line in section.strip().split('\n'):
+        if ':' in line:
+            consideration_id, content = line.split(':', 1)
+            if consideration_id.strip() and content.strip():
+                updates[consideration_id.strip()] = content.strip()
+    rest = response[end + len(UPDATES_END):] if end != -1 else ""
+    return (response[:start].strip() + rest.strip()), updates
+
 @dataclass
 class ConsiderationCategory:
     """Data structure for consideration categories"""
@@ -53,92 +121,1052 @@ class SessionData:
     chat_history: List[ChatMessage]
     last_updated: str
 
+@dataclass
+class CPUSettings:
+    """CPU inference tuning for cluster nodes without GPUs"""
+    quantize_int8: bool = False  # int8 dynamic quantization of every nn.Linear (lossy, so opt-in)
+    intra_op_threads: int = 0  # 0: torch default, or the pinned NUMA node's core count
+    inter_op_threads: int = 0  # 0: torch default
+    numa_node: Optional[int] = None  # pin the process (and so its allocations) to this node's cores
+    quantized_cache_dir: Optional[str] = None  # reuse quantized models saved here
+    
+    @classmethod
+    def from_env(cls) -> Optional["CPUSettings"]:
+        """Settings from FORGE_CPU_* variables, or None when none are set"""
+        env = {name: os.environ.get(f"FORGE_CPU_{name.upper()}") for name in
+               ("int8", "threads", "interop_threads", "numa_node", "quantized_cache_dir")}
+        if not any(env.values()):
+            return None
+        return cls(
+            # Lossy, so only on request: FORGE_CPU_THREADS alone must not change model outputs
+            quantize_int8=(env["int8"] or "").lower() in ("1", "true", "yes"),
+            intra_op_threads=int(env["threads"] or 0),
+            inter_op_threads=int(env["interop_threads"] or 0),
+            numa_node=int(env["numa_node"]) if env["numa_node"] else None,
+            quantized_cache_dir=env["quantized_cache_dir"]
+        )
+    
+    def quantized_path(self, model_name: str) -> Optional[str]:
+        """Cache file for a model's quantized weights; pickled modules are only valid for these library versions"""
+        if not self.quantized_cache_dir:
+            return None
+        import torch
+        import transformers
+        name = re.sub(r"[^\w.-]", "_", model_name.strip("/"))
+        return os.path.join(self.quantized_cache_dir,
+                            f"{name}-int8-torch{torch.__version__}-transformers{transformers.__version__}.pt")
+
+def numa_node_cpus(node: int) -> List[int]:
+    """CPU ids of a NUMA node, from its sysfs cpulist (e.g. "0-15,32-47")"""
+    with open(f"/sys/devices/system/node/node{node}/cpulist") as f:
+        cpus = []
+        for part in f.read().strip().split(","):
+            first, _, last = part.partition("-")
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def stage_model_dir(source: str, target: str):
+    """Copy a model directory (e.g. on the shared filesystem) to target unless an identical copy is already there
+    
+    Files are compared by size and mtime. Each is copied under a temporary name
+    and renamed, so concurrent jobs on one node never load a partial file.
+    """
+    os.makedirs(target, exist_ok=True)
+    for name in sorted(os.listdir(source)):
+        source_path = os.path.join(source, name)
+        if not os.path.isfile(source_path):
+            continue
+        target_path = os.path.join(target, name)
+        source_stat = os.stat(source_path)
+        if os.path.exists(target_path):
+            target_stat = os.stat(target_path)
+            if (target_stat.st_size == source_stat.st_size
+                    and int(target_stat.st_mtime) == int(source_stat.st_mtime)):
+                continue
+        temporary_path = f"{target_path}.{os.getpid()}.tmp"
+        shutil.copy2(source_path, temporary_path)
+        os.replace(temporary_path, target_path)
+        logger.info(f"Staged {name} ({source_stat.st_size / 2**20:.0f} MiB) to {target}")
+
+def process_uptime() -> Optional[float]:
+    """Seconds since this process started (Linux), None elsewhere"""
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupTimer:
+    """Wall time of each startup phase (heavy imports, model staging, loading, quantization, prefix encoding)"""
+    
+    def __init__(self):
+        self.phases: "OrderedDict[str, float]" = OrderedDict()
+    
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+    
+    def report(self) -> str:
+        lines = [f"  {name:<32} {seconds:>7.2f}s" for name, seconds in self.phases.items()]
+        uptime = process_uptime()
+        if uptime is not None:
+            lines.append(f"  {'total since process start':<32} {uptime:>7.2f}s")
+        return "\n".join(lines)
+
+# Phases are per process: imports and model loads happen once however many services there are
+startup = StartupTimer()
+
+# Tags of the prompt format (see _format_messages_for_deepseek); a reply that emits one has finished its turn
+ROLE_TAGS = ["<|system|>", "<|user|>", "<|assistant|>", "<|end|>"]
+
+@dataclass
+class StopRules:
+    """Where a local generation ends before max_new_tokens"""
+    stop: List[str] = field(default_factory=list)  # cut before these
+    closing_markers: List[str] = field(default_factory=list)  # cut after these (end of a structured section)
+    role_tags: bool = True  # cut before any ROLE_TAGS
+    
+    def strings(self) -> List[str]:
+        """Every string whose appearance ends generation"""
+        return self.stop + self.closing_markers + (ROLE_TAGS if self.role_tags else [])
+    
+    def cut(self, text: str) -> Tuple[str, bool]:
+        """Text up to the first stop string (exclusive) or closing marker (inclusive), and whether one matched"""
+        first, end = len(text) + 1, None
+        for stop_string in self.stop + (ROLE_TAGS if self.role_tags else []):
+            index = text.find(stop_string)
+            if 0 <= index < first:
+                first, end = index, index
+        for marker in self.closing_markers:
+            index = text.find(marker)
+            if 0 <= index < first:
+                first, end = index, index + len(marker)
+        return (text, False) if end is None else (text[:end], True)
+
+@dataclass
+class GenerationRequest:
+    """One prompt waiting to be generated as part of a batch"""
+    prompt: str
+    max_new_tokens: int
+    stop: StopRules = field(default_factory=StopRules)
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[str] = None
+    new_tokens: int = 0
+    prompt_tokens: int = 0
+    error: Optional[BaseException] = None
+
+@dataclass
+class StreamTiming:
+    """Latency of one streamed response"""
+    time_to_first_token_ms: float = 0.0
+    inter_token_ms: float = 0.0  # mean gap between consecutive generated tokens
+    tokens: int = 0
+    total_ms: float = 0.0
+
+# Stopping criteria and streamers are duck-typed for generate() (a __call__ returning a
+# per-row bool tensor; put()/end()) rather than subclassing transformers' base classes,
+# so defining them does not import transformers
+
+class PerRowMaxNewTokens:
+    """Finishes each row of a batch at its own max_new_tokens (generate() only knows one limit)"""
+    
+    def __init__(self, prompt_length: int, max_new_tokens: List[int]):
+        import torch
+        self.prompt_length = prompt_length
+        self.max_new_tokens = torch.tensor(max_new_tokens)
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = input_ids.shape[1] - self.prompt_length
+        return (generated >= self.max_new_tokens).to(input_ids.device)
+
+class StopStrings:
+    """Finishes each row of a batch once its generated text matches its StopRules
+    
+    Each step decodes only the tokens added since the last step plus a few before
+    them (enough to span the longest stop string), never the whole sequence.
+    Assisted generation can add several tokens in one step, and checks each step
+    twice: first the unverified draft tokens, then the accepted ones, which may be
+    fewer and end in a token the main model chose instead. Decoding therefore
+    starts from the shorter of the two previous checks, which for an accepted step
+    is where the previous accepted sequence ended.
+    """
+    
+    def __init__(self, tokenizer, prompt_length: int, rules: List[StopRules]):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.checked_lengths = [prompt_length, prompt_length]  # the last two checks
+        self.strings = [rule.strings() for rule in rules]
+        # A token decodes to at least one character; the margin covers tokens that straddle the match
+        self.window = max((len(string) for strings in self.strings for string in strings), default=0) + 2
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        length = input_ids.shape[1]
+        start = max(self.prompt_length, min(self.checked_lengths + [length]) + 1 - self.window)
+        self.checked_lengths = [self.checked_lengths[1], length]
+        if start >= input_ids.shape[1]:
+            return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        tails = self.tokenizer.batch_decode(input_ids[:, start:])
+        done = [any(string in tail for string in strings) for tail, strings in zip(tails, self.strings)]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+class CancelGeneration:
+    """Ends generate() at the next step once the event is set (the stream's reader stopped)"""
+    
+    def __init__(self, cancelled: threading.Event):
+        self.cancelled = cancelled
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+class TimedTextStreamer:
+    """A TextIteratorStreamer that also records when each generated token arrived"""
+    
+    def __init__(self, tokenizer, **kwargs):
+        from transformers import TextIteratorStreamer
+        self.streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, **kwargs)
+        self.token_times: List[float] = []
+    
+    def put(self, value):
+        if not self.streamer.next_tokens_are_prompt:
+            # Assisted generation puts every token accepted in a step at once
+            self.token_times.extend([time.perf_counter()] * value.numel())
+        self.streamer.put(value)
+    
+    def end(self):
+        self.streamer.end()
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.streamer)
+
+class AssistedDecodingStats:
+    """Draft token acceptance in assisted generation, counted from forward calls of both models
+    
+    Each verification step is one forward of the main model and yields the draft
+    tokens it accepted plus one token of its own, so accepted = generated - main
+    forwards. Each drafted token is one forward of the draft model. Counters are
+    per thread, so concurrent generations do not mix.
+    """
+    
+    def __init__(self):
+        self._calls = threading.local()
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        """Zero the totals"""
+        with self._lock:
+            self.generations = 0
+            self.tokens = 0
+            self.verify_steps = 0
+            self.drafted = 0
+            self.accepted = 0
+            self.seconds = 0.0
+    
+    def attach(self, model, draft_model):
+        model.register_forward_hook(lambda *args: self._count("target"))
+        draft_model.register_forward_hook(lambda *args: self._count("draft"))
+    
+    def _count(self, name: str):
+        setattr(self._calls, name, getattr(self._calls, name, 0) + 1)
+    
+    def begin(self):
+        """Start counting an assisted generate() call on this thread"""
+        self._calls.target = self._calls.draft = 0
+        self._calls.start = time.perf_counter()
+    
+    def end(self, new_tokens: int):
+        """Account the generate() call started by begin(), which produced new_tokens tokens"""
+        seconds = time.perf_counter() - self._calls.start
+        with self._lock:
+            self.generations += 1
+            self.tokens += new_tokens
+            self.verify_steps += self._calls.target
+            self.drafted += self._calls.draft
+            self.accepted += min(max(0, new_tokens - self._calls.target), self._calls.draft)
+            self.seconds += seconds
+    
+    def summary(self) -> Dict[str, float]:
+        """Acceptance rate, tokens per main-model forward and effective tokens/s so far"""
+        with self._lock:
+            return {
+                "generations": self.generations,
+                "tokens": self.tokens,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "acceptance_rate": self.accepted / self.drafted if self.drafted else 0.0,
+                "tokens_per_step": self.tokens / self.verify_steps if self.verify_steps else 0.0,
+                "tokens_per_second": self.tokens / self.seconds if self.seconds else 0.0,
+            }
+
+class TokenStream:
+    """Text chunks of one response, as the model decodes them
+    
+    Iterating yields chunks while generate() runs in a background thread.
+    Text that could be the start of a stop string or closing marker is held
+    back until it is ruled out. Leaving the loop early stops generation at its
+    next step.
+    `timing` and `text` are complete once iteration ends.
+    """
+    
+    def __init__(self, chunks: Iterable[str] = (), stop: Optional[StopRules] = None,
+                 on_complete: Optional[Callable[[str], None]] = None):
+        self.chunks = chunks
+        self.stop = stop or StopRules(role_tags=False)
+        self.on_complete = on_complete
+        self.cancelled = threading.Event()
+        self.started = time.perf_counter()
+        self.timing = StreamTiming()
+        self.text = ""
+        self.error: Optional[BaseException] = None
+        self._streamer: Optional[TimedTextStreamer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._first_chunk_at: Optional[float] = None
+    
+    def start(self, streamer: TimedTextStreamer, generate: Callable[[], None]):
+        """Run generate() (which feeds streamer) in a background thread"""
+        self.chunks = self._streamer = streamer
+        self._thread = threading.Thread(target=self._run, args=(generate,), name="token-stream", daemon=True)
+        self._thread.start()
+    
+    def _run(self, generate: Callable[[], None]):
+        try:
+            generate()
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            self.error = e
+            self._streamer.end()
+    
+    def __iter__(self) -> Iterator[str]:
+        held_back = max((len(stop_string) for stop_string in self.stop.strings()), default=1) - 1
+        emitted = 0
+        try:
+            for chunk in self.chunks:
+                if self._first_chunk_at is None:
+                    self._first_chunk_at = time.perf_counter()
+                self.text += chunk
+                if not emitted:
+                    self.text = self.text.lstrip()
+                self.text, matched = self.stop.cut(self.text)
+                if matched:
+                    self.cancelled.set()
+                end = len(self.text) if matched else len(self.text) - held_back
+                if end > emitted:
+                    yield self.text[emitted:end]
+                    emitted = end
+                if matched:
+                    break
+            if self.error and not self.text:
+                self.text = "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
+            if emitted < len(self.text):
+                yield self.text[emitted:]
+        finally:
+            self._finish()
+    
+    def _finish(self):
+        self.cancelled.set()
+        if self._thread:
+            self._thread.join()
+        self.text = self.text.rstrip()
+        times = self._streamer.token_times if self._streamer else []
+        first = times[0] if times else self._first_chunk_at
+        self.timing = StreamTiming(
+            time_to_first_token_ms=(first - self.started) * 1000 if first else 0.0,
+            inter_token_ms=(times[-1] - times[0]) * 1000 / (len(times) - 1) if len(times) > 1 else 0.0,
+            tokens=len(times),
+            total_ms=(time.perf_counter() - self.started) * 1000
+        )
+        if self.on_complete:
+            self.on_complete(self.text)
+
+class DynamicBatcher:
+    """Collects concurrent generation requests into batched generate() calls
+    
+    The first request to arrive opens a batch; requests arriving within
+    batch_window_ms join it, up to max_batch_size. Prompts are left-padded into
+    one generate() call and every caller gets its own result back. Throughput
+    is recorded per batch size.
+    """
+    
+    def __init__(self, llm_service: "LocalLLMService", max_batch_size: int = 8, batch_window_ms: float = 20.0):
+        self.llm_service = llm_service
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.pending: "queue.Queue[GenerationRequest]" = queue.Queue()
+        self.batch_stats: Dict[int, Dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._thread.start()
+    
+    def submit(self, prompt: str, max_new_tokens: int, stop: Optional[StopRules] = None) -> Tuple[str, int, int]:
+        """Queue a prompt and block until its batch has been generated; returns (text, new tokens, prompt tokens)"""
+        request = GenerationRequest(prompt=prompt, max_new_tokens=max_new_tokens, stop=stop or StopRules())
+        self.pending.put(request)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.result, request.new_tokens, request.prompt_tokens
+    
+    def _run(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+    
+    def _run_batch(self, batch: List[GenerationRequest]):
+        start = time.perf_counter()
+        try:
+            outputs = self.llm_service._generate_batch([r.prompt for r in batch],
+                                                       [r.max_new_tokens for r in batch],
+                                                       [r.stop for r in batch])
+            for request, (text, new_tokens, prompt_tokens) in zip(batch, outputs):
+                request.result = text
+                request.new_tokens = new_tokens
+                request.prompt_tokens = prompt_tokens
+            self._record(len(batch), sum(r.new_tokens for r in batch), time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Batched generation of {len(batch)} prompts failed: {e}")
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+    
+    def _record(self, batch_size: int, new_tokens: int, seconds: float):
+        with self._stats_lock:
+            entry = self.batch_stats.setdefault(batch_size, {"batches": 0, "tokens": 0, "seconds": 0.0})
+            entry["batches"] += 1
+            entry["tokens"] += new_tokens
+            entry["seconds"] += seconds
+        logger.info(f"Batch of {batch_size}: {new_tokens} tokens in {seconds:.2f}s "
+                    f"({new_tokens / seconds if seconds else 0.0:.1f} tokens/s)")
+    
+    def stats(self) -> Dict[int, Dict[str, float]]:
+        """Batches, generated tokens and tokens per second for each batch size seen"""
+        with self._stats_lock:
+            return {
+                size: {**entry, "tokens_per_second": entry["tokens"] / entry["seconds"] if entry["seconds"] else 0.0}
+                for size, entry in sorted(self.batch_stats.items())
+            }
+
+def cache_nbytes(cache) -> int:
+    """Memory held by the key/value tensors of a KV cache"""
+    total = 0
+    for layer in range(len(cache)):
+        key, value = cache[layer]
+        total += key.nelement() * key.element_size() + value.nelement() * value.element_size()
+    return total
+
+def common_prefix_length(a: "torch.Tensor", b: "torch.Tensor") -> int:
+    """Number of leading token ids two 1-D tensors share"""
+    n = min(len(a), len(b))
+    mismatches = (a[:n] != b[:n]).nonzero()
+    return int(mismatches[0]) if len(mismatches) else n
+
+class PrefixKVCache:
+    """KV cache of the prompt prefix every request starts with (the static ASF instructions)
+    
+    Encoded once; each generation that has nothing better cached starts from a
+    copy of it, cropped to the tokens its prompt actually shares with the prefix.
+    """
+    
+    def __init__(self, token_ids: "torch.Tensor", cache: Any):
+        self.token_ids = token_ids
+        self.cache = cache
+        self.length = len(token_ids)
+        self.hits = 0
+    
+    def copy_for(self, input_ids: "torch.Tensor") -> Tuple[Optional[Any], int]:
+        """A private copy of the prefix cache cropped to the prefix input_ids shares; (None, 0) if none"""
+        reused = min(common_prefix_length(self.token_ids, input_ids), len(input_ids) - 1)
+        if reused <= 0:
+            return None, 0
+        cache = copy.deepcopy(self.cache)
+        if reused < self.length:
+            cache.crop(reused)
+        self.hits += 1
+        return cache, reused
+
+class SessionKVCache:
+    """Per-session past_key_values, reused so a new turn only prefills its new tokens
+    
+    Each entry holds the KV cache left by the session's last generate() call and
+    the token ids it covers. The next prompt reuses the longest common token
+    prefix (the cache is cropped to it): normally everything up to the new user
+    message. When the prompt diverges early (e.g. the session context in the
+    system prompt changed) less is reused, and nothing at all when even the
+    first token differs. Sessions are evicted least recently used first once
+    the caches together exceed max_bytes or there are more than max_sessions.
+    """
+    
+    def __init__(self, max_bytes: int, max_sessions: int = 32):
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[str, Tuple[torch.Tensor, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        self.evictions = 0
+    
+    def take(self, session_id: str, input_ids: "torch.Tensor") -> Tuple[Optional[Any], int]:
+        """Remove a session's cache, cropped to the prefix it shares with input_ids; (None, 0) on a miss"""
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+        reused = 0
+        cache = None
+        if entry is not None:
+            cached_ids, cache, _ = entry
+            # At least one token must be left to run through the model
+            reused = min(common_prefix_length(cached_ids, input_ids), len(input_ids) - 1)
+            if reused <= 0:
+                cache = None
+                reused = 0
+            elif reused < cache.get_seq_length():
+                cache.crop(reused)
+        with self._lock:
+            if cache is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.reused_tokens += reused
+            self.prefilled_tokens += len(input_ids) - reused
+        return cache, reused
+    
+    def put(self, session_id: str, token_ids: "torch.Tensor", cache: Any):
+        """Store a session's cache covering token_ids, evicting least recently used sessions as needed"""
+        size = cache_nbytes(cache)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[session_id] = (token_ids, cache, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes or len(self._entries) > self.max_sessions:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate, memory use and prefill tokens saved"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._entries),
+                "megabytes": self.total_bytes / 2**20,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+                "evictions": self.evictions
+            }
+
 class LocalLLMService:
     """Local LLM service using DeepSeek reasoning model"""
     
-    def __init__(self, model_name: str = "deepseek-ai/deepseek-coder-6.7b-instruct"):
+    def __init__(self, model_name: str = "deepseek-ai/deepseek-coder-6.7b-instruct",
+                 cassette: Optional[LLMCassette] = None, max_batch_size: int = 1,
+                 batch_window_ms: float = 20.0, kv_cache_max_mb: float = 4096,
+                 kv_cache_max_sessions: int = 32, stop_at_role_tags: bool = True,
+                 cpu: Optional[CPUSettings] = None, lazy_load: bool = True,
+                 model_cache_dir: Optional[str] = None, draft_model_name: Optional[str] = None,
+                 draft_tokens: int = 5):
         """
         Initialize the local LLM service
         
         Args:
             model_name: HuggingFace model name for DeepSeek
+            cassette: Optional record/replay cassette; in replay mode no model is loaded
+            max_batch_size: Batch concurrent generate_response() calls up to this size (1 disables batching)
+            batch_window_ms: How long the first request of a batch waits for others to join
+            kv_cache_max_mb: Memory budget for per-session KV caches (0 disables reuse across turns)
+            kv_cache_max_sessions: Most sessions whose KV cache is kept
+            stop_at_role_tags: End generation when the model starts another turn (<|end|>, <|user|>, ...)
+            cpu: CPU quantization, threading and pinning (ignored on GPU)
+            lazy_load: Import torch and load the model on the first generation rather than now
+            model_cache_dir: Node-local directory to stage a local model directory into (or download hub models to)
+            draft_model_name: Small model with the same tokenizer that drafts tokens for the main model to verify
+                (assisted generation; single-prompt generations only)
+            draft_tokens: Tokens drafted per step to start with; adjusted as drafts are accepted or rejected
         """
         self.model_name = model_name
         self.tokenizer = None
         self.model = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.cassette = cassette
+        self.batcher = None
+        self.kv_cache = SessionKVCache(int(kv_cache_max_mb * 2**20), kv_cache_max_sessions) if kv_cache_max_mb else None
+        self.prefix_cache = None
+        self.stop_at_role_tags = stop_at_role_tags
+        self.cpu = cpu
+        self.model_cache_dir = model_cache_dir
+        self.draft_model_name = draft_model_name
+        self.draft_tokens = draft_tokens
+        self.draft_model = None
+        self.assisted_stats = AssistedDecodingStats()
+        self.device: Optional[str] = None
+        self.prefix_instructions: Optional[str] = None
+        # Optional callable(session_id, model, usage, latency) that accounts every generation
+        self.usage_recorder = None
+        self._load_lock = threading.Lock()
         
-        logger.info(f"Initializing DeepSeek model: {model_name}")
-        logger.info(f"Using device: {self.device}")
+        if cassette and cassette.replaying:
+            logger.info(f"Replaying LLM responses from cassette: {cassette.path}")
+            return
         
-        try:
-            self._load_model()
-        except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            raise
+        if max_batch_size > 1:
+            self.batcher = DynamicBatcher(self, max_batch_size, batch_window_ms)
+            logger.info(f"Dynamic batching enabled (up to {max_batch_size} prompts, {batch_window_ms}ms window)")
+        
+        if not lazy_load:
+            self.load_model()
+    
+    def load_model(self):
+        """Load the tokenizer and model now instead of on the first generation (no-op once loaded)"""
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            try:
+                self._load_model()
+            except Exception as e:
+                logger.error(f"Failed to load model: {e}")
+                raise
+        logger.info(f"Startup timings:\n{startup.report()}")
     
     def _load_model(self):
         """Load the DeepSeek model and tokenizer"""
+        with startup.phase("import torch + transformers"):
+            import torch
+            from transformers import AutoTokenizer
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        logger.info(f"Initializing DeepSeek model: {self.model_name}")
+        logger.info(f"Using device: {self.device}")
+        
+        cpu_mode = self.cpu is not None and self.device == "cpu"
+        if cpu_mode:
+            self._apply_cpu_settings()
+        source = self._model_source(self.model_name)
+        
         logger.info("Loading tokenizer...")
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            self.model_name,
-            trust_remote_code=True,
-            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-        )
+        with startup.phase("load tokenizer"):
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                source,
+                trust_remote_code=True,
+                cache_dir=self.model_cache_dir,
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
+            )
         
         # Set pad token if not present
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Batched prompts are left-padded so every row continues from its last real token
+        self.tokenizer.padding_side = "left"
         
-        logger.info("Loading model...")
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.model_name,
-            trust_remote_code=True,
-            torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-            device_map="auto" if self.device == "cuda" else None,
-            low_cpu_mem_usage=True
-        )
+        if cpu_mode and self.cpu.quantize_int8:
+            model = self._load_quantized_model(source)
+        else:
+            model = self._load_pretrained(source)
         
+        if self.prefix_instructions:
+            self._encode_prefix(model)
+        if self.draft_model_name:
+            self.draft_model = self._load_draft_model(model, cpu_mode)
+        self.model = model
         logger.info("Model loaded successfully!")
     
-    def generate_response(self, messages: List[Dict[str, str]], max_tokens: int = 800) -> str:
+    def _model_source(self, model_name: str) -> str:
+        """Where to load from: a node-local copy of a local model directory, or the model name itself"""
+        if not self.model_cache_dir or not os.path.isdir(model_name):
+            return model_name
+        target = os.path.join(self.model_cache_dir, re.sub(r"[^\w.-]", "_", model_name.strip("/")))
+        with startup.phase("stage model to node-local disk"):
+            stage_model_dir(model_name, target)
+        return target
+    
+    def _load_pretrained(self, source: str, phase: str = "load model"):
+        import torch
+        from transformers import AutoModelForCausalLM
+        logger.info(f"Loading model from {source}...")
+        # safetensors checkpoints are memory-mapped: pages come from the node's page cache
+        # as they are touched, and jobs on the same node share them
+        with startup.phase(phase):
+            return AutoModelForCausalLM.from_pretrained(
+                source,
+                trust_remote_code=True,
+                cache_dir=self.model_cache_dir,
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                device_map="auto" if self.device == "cuda" else None,
+                low_cpu_mem_usage=True
+            )
+    
+    def _load_draft_model(self, model, cpu_mode: bool):
+        """The draft model for assisted generation, quantized like the main model in CPU int8 mode"""
+        import torch
+        draft_model = self._load_pretrained(self._model_source(self.draft_model_name), "load draft model")
+        # Drafts are verified token by token, so both models must share one vocabulary
+        if draft_model.config.vocab_size != model.config.vocab_size:
+            raise ValueError(f"Draft model {self.draft_model_name} has a vocabulary of {draft_model.config.vocab_size} "
+                             f"tokens, {self.model_name} has {model.config.vocab_size}")
+        if cpu_mode and self.cpu.quantize_int8:
+            with startup.phase("quantize draft int8"):
+                draft_model = torch.ao.quantization.quantize_dynamic(draft_model, {torch.nn.Linear},
+                                                                     dtype=torch.qint8, inplace=True)
+        # The heuristic schedule drafts two more tokens after a fully accepted step, one fewer otherwise
+        draft_model.generation_config.num_assistant_tokens = self.draft_tokens
+        draft_model.generation_config.num_assistant_tokens_schedule = "heuristic"
+        self.assisted_stats.attach(model, draft_model)
+        logger.info(f"Assisted generation with draft model {self.draft_model_name}")
+        return draft_model
+    
+    def _assisted(self, batch_size: int) -> Dict[str, Any]:
+        """generate() arguments for assisted generation, which transformers supports for one prompt at a time"""
+        if self.draft_model is None or batch_size != 1:
+            return {}
+        return {"assistant_model": self.draft_model}
+    
+    def _apply_cpu_settings(self):
+        """Pin to a NUMA node and size torch's thread pools before any weights are allocated"""
+        import torch
+        cpus = None
+        if self.cpu.numa_node is not None:
+            # Linux allocates on the node of the CPU that first touches a page, so pinning
+            # before the load keeps the weights in the node's local memory
+            cpus = numa_node_cpus(self.cpu.numa_node)
+            os.sched_setaffinity(0, cpus)
+            logger.info(f"Pinned to NUMA node {self.cpu.numa_node} ({len(cpus)} CPUs)")
+        intra_op_threads = self.cpu.intra_op_threads or (len(cpus) if cpus else 0)
+        if intra_op_threads:
+            torch.set_num_threads(intra_op_threads)
+        if self.cpu.inter_op_threads:
+            try:
+                torch.set_num_interop_threads(self.cpu.inter_op_threads)
+            except RuntimeError as e:
+                # Only possible before the first inter-op parallel work in the process
+                logger.warning(f"Could not set inter-op threads: {e}")
+        logger.info(f"CPU threads: {torch.get_num_threads()} intra-op, {torch.get_num_interop_threads()} inter-op")
+    
+    def _load_quantized_model(self, source: str):
+        """The model with int8 dynamically quantized linear layers, from the disk cache when present"""
+        import torch
+        path = self.cpu.quantized_path(self.model_name)
+        if path and os.path.exists(path):
+            logger.info(f"Loading int8 model from {path}...")
+            with startup.phase("load int8 model (mmap)"):
+                # Our own cache file, pickled by torch.save(model) below
+                return torch.load(path, weights_only=False, mmap=True)
+        
+        model = self._load_pretrained(source)
+        logger.info("Quantizing linear layers to int8...")
+        with startup.phase("quantize int8"):
+            # In place, so each fp32 weight is freed as its layer is swapped
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            torch.save(model, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            logger.info(f"Saved int8 model to {path}")
+        return model
+    
+    def generate_response(self, messages: List[Dict[str, str]], max_tokens: int = 800,
+                          stop: Optional[List[str]] = None, session_id: Optional[str] = None,
+                          closing_markers: Optional[List[str]] = None, raise_errors: bool = False) -> str:
         """
         Generate response using the local model
         
         Args:
             messages: List of message dictionaries with 'role' and 'content'
             max_tokens: Maximum tokens to generate
+            stop: Optional strings at which generation stops; the response is cut off before them
+            session_id: Conversation the messages belong to; its KV cache is reused across turns
+            closing_markers: Optional markers that end a structured response; it is cut off after them
+            raise_errors: Raise generation errors instead of returning an apology as the response
             
         Returns:
             Generated response text
         """
         try:
-            # Convert messages to DeepSeek format
-            prompt = self._format_messages_for_deepseek(messages)
-            
-            # Tokenize input
-            inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=4096)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            if self.cassette:
+                request = {"model": self.model_name, "messages": messages, "max_tokens": max_tokens}
+                if stop:
+                    request["stop"] = stop
+                if closing_markers:
+                    request["closing_markers"] = closing_markers
+                return self.cassette.call(request, lambda: self._generate(messages, max_tokens, stop, session_id,
+                                                                          closing_markers))
+            return self._generate(messages, max_tokens, stop, session_id, closing_markers)
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            if raise_errors:
+                raise
+            return "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
+    
+    def _generate(self, messages: List[Dict[str, str]], max_tokens: int, stop: Optional[List[str]] = None,
+                  session_id: Optional[str] = None, closing_markers: Optional[List[str]] = None) -> str:
+        """
+        Run the local model on a conversation
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            max_tokens: Maximum tokens to generate
+            stop: Optional strings at which generation stops
+            session_id: Conversation the messages belong to (enables KV cache reuse)
+            closing_markers: Optional markers that end a structured response
             
-            # Generate response
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    temperature=0.7,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id
-                )
+        Returns:
+            Generated response text
+        """
+        self.load_model()
+        
+        # Convert messages to DeepSeek format
+        prompt = self._format_messages_for_deepseek(messages)
+        rules = self._stop_rules(stop, closing_markers)
+        
+        start = time.perf_counter()
+        
+        # Concurrent callers share batched generate() calls when batching is enabled
+        if self.batcher:
+            text, new_tokens, prompt_tokens = self.batcher.submit(prompt, max_tokens, rules)
+        elif (session_id and self.kv_cache) or self.prefix_cache:
+            text, new_tokens, prompt_tokens = self._generate_with_cache(prompt, session_id, max_tokens, rules)
+        else:
+            text, new_tokens, prompt_tokens = self._generate_batch([prompt], [max_tokens], [rules])[0]
+        self._record_usage(session_id, prompt_tokens, new_tokens, time.perf_counter() - start)
+        return text
+    
+    def _record_usage(self, session_id: Optional[str], prompt_tokens: int, completion_tokens: int, latency: float):
+        if self.usage_recorder:
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            self.usage_recorder(session_id, self.model_name, usage, latency)
+    
+    def _stop_rules(self, stop: Optional[List[str]], closing_markers: Optional[List[str]]) -> StopRules:
+        return StopRules(stop=list(stop or []), closing_markers=list(closing_markers or []),
+                         role_tags=self.stop_at_role_tags)
+    
+    def _stopping_criteria(self, prompt_length: int, stops: List[StopRules]) -> List[Any]:
+        """A StopStrings criterion for the rows' stop rules, if any row has some"""
+        if not any(rules.strings() for rules in stops):
+            return []
+        return [StopStrings(self.tokenizer, prompt_length, stops)]
+    
+    def stream_response(self, messages: List[Dict[str, str]], max_tokens: int = 800,
+                        stop: Optional[List[str]] = None, session_id: Optional[str] = None,
+                        on_complete: Optional[Callable[[str], None]] = None,
+                        closing_markers: Optional[List[str]] = None) -> TokenStream:
+        """
+        Stream a response as text chunks while the local model generates it
+        
+        Streams bypass the dynamic batcher (TextIteratorStreamer handles one prompt)
+        but reuse the session and prefix KV caches like generate_response().
+        
+        Args:
+            messages: List of message dictionaries with 'role' and 'content'
+            max_tokens: Maximum tokens to generate
+            stop: Optional strings at which generation stops; the response is cut off before them
+            session_id: Conversation the messages belong to; its KV cache is reused across turns
+            on_complete: Called with the full response text once the stream ends
+            closing_markers: Optional markers that end a structured response; it is cut off after them
             
-            # Decode response
-            response = self.tokenizer.decode(outputs[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+        Returns:
+            TokenStream to iterate over; its timing holds time-to-first-token and inter-token latency
+        """
+        rules = self._stop_rules(stop, closing_markers)
+        if self.cassette:
+            # Cassettes hold whole responses, so a recorded or replayed turn arrives as one chunk
+            stream = TokenStream(stop=rules, on_complete=on_complete)
+            stream.chunks = (text for text in [self.generate_response(messages, max_tokens, stop, session_id,
+                                                                      closing_markers)])
+            return stream
+        
+        # Loaded before the stream's clock starts, so a first turn's latency excludes the model load
+        try:
+            self.load_model()
+        except Exception:
+            return TokenStream(["I apologize, but I'm having trouble processing your request right now. "
+                                "Please try again in a moment."])
+        
+        def finished(text: str):
+            timing = stream.timing
+            self._record_usage(session_id, input_ids.shape[1], timing.tokens, timing.total_ms / 1000)
+            if on_complete:
+                on_complete(text)
+        
+        stream = TokenStream(stop=rules, on_complete=finished)
+        prompt = self._format_messages_for_deepseek(messages)
+        input_ids, cache = self._cached_inputs(prompt, session_id)
+        streamer = TimedTextStreamer(self.tokenizer)
+        stream.start(streamer, lambda: self._generate_from_cache(
+            input_ids, cache, max_tokens, session_id, rules,
+            streamer=streamer, extra_criteria=[CancelGeneration(stream.cancelled)]
+        ))
+        return stream
+    
+    def cache_system_prefix(self, instructions: str):
+        """
+        Encode the static start of every system prompt once, so generations start from its KV cache
+        
+        Encoded right away if the model is loaded, otherwise as part of loading it.
+        
+        Args:
+            instructions: Text every system message starts with
+        """
+        self.prefix_instructions = instructions
+        if self.model is not None:
+            self._encode_prefix(self.model)
+    
+    def _encode_prefix(self, model):
+        import torch
+        from transformers import DynamicCache
+        start = time.perf_counter()
+        prefix = f"<|system|>\n{self.prefix_instructions}"
+        input_ids = self.tokenizer(prefix, return_tensors="pt")['input_ids'].to(self.device)
+        with startup.phase("encode system prefix"), torch.no_grad():
+            outputs = model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True)
+        self.prefix_cache = PrefixKVCache(input_ids[0].cpu(), outputs.past_key_values)
+        logger.info(f"Cached {input_ids.shape[1]}-token system prompt prefix in {time.perf_counter() - start:.2f}s")
+    
+    def _generate_with_cache(self, prompt: str, session_id: Optional[str], max_new_tokens: int,
+                             stop: StopRules) -> Tuple[str, int, int]:
+        """
+        Generate starting from the longest cached prefix: the session's last turn or the shared system prefix
+        
+        Args:
+            prompt: Formatted prompt
+            session_id: Session whose KV cache to reuse and update (None for one-off prompts)
+            max_new_tokens: Token limit
+            stop: Where generation ends early
             
-            return response.strip()
+        Returns:
+            (response text, number of generated tokens, number of prompt tokens)
+        """
+        input_ids, cache = self._cached_inputs(prompt, session_id)
+        sequence = self._generate_from_cache(input_ids, cache, max_new_tokens, session_id, stop)
+        text, new_tokens = self._decode_new_tokens(sequence[input_ids.shape[1]:].tolist(), max_new_tokens, stop)
+        return text, new_tokens, input_ids.shape[1]
+    
+    def _cached_inputs(self, prompt: str, session_id: Optional[str]) -> Tuple["torch.Tensor", Optional[Any]]:
+        """Tokenize a prompt and find the longest cached prefix: the session's last turn or the system prefix"""
+        input_ids = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=4096)['input_ids']
+        cache, reused = None, 0
+        if session_id and self.kv_cache:
+            cache, reused = self.kv_cache.take(session_id, input_ids[0])
+        if self.prefix_cache and reused < self.prefix_cache.length:
+            prefix_cache, prefix_reused = self.prefix_cache.copy_for(input_ids[0])
+            if prefix_reused > reused:
+                cache, reused = prefix_cache, prefix_reused
+        logger.debug(f"Session {session_id}: reusing {reused} cached tokens, prefilling {input_ids.shape[1] - reused}")
+        return input_ids, cache
+    
+    def _generate_from_cache(self, input_ids: "torch.Tensor", cache: Optional[Any], max_new_tokens: int,
+                             session_id: Optional[str], stop: StopRules, extra_criteria: Optional[List[Any]] = None,
+                             **generate_kwargs) -> "torch.Tensor":
+        """Run generate() from a cached prefix and keep the resulting cache for the session; returns the sequence"""
+        import torch
+        from transformers import StoppingCriteriaList, DynamicCache
+        input_ids = input_ids.to(self.device)
+        criteria = self._stopping_criteria(input_ids.shape[1], [stop]) + (extra_criteria or [])
+        assisted = self._assisted(1)
+        if assisted:
+            self.assisted_stats.begin()
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=cache if cache is not None else DynamicCache(),
+                max_new_tokens=max_new_tokens,
+                stopping_criteria=StoppingCriteriaList(criteria),
+                temperature=0.7,
+                do_sample=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+                return_dict_in_generate=True,
+                **assisted,
+                **generate_kwargs
+            )
+        
+        # The cache now covers the prompt and all generated tokens but the last
+        sequence = outputs.sequences[0]
+        if assisted:
+            self.assisted_stats.end(len(sequence) - input_ids.shape[1])
+        if session_id and self.kv_cache:
+            cache = outputs.past_key_values
+            self.kv_cache.put(session_id, sequence[:cache.get_seq_length()].cpu(), cache)
+        return sequence
+    
+    def _generate_batch(self, prompts: List[str], max_new_tokens: List[int],
+                        stops: List[StopRules]) -> List[Tuple[str, int, int]]:
+        """
+        Generate continuations for several prompts in one generate() call
+        
+        Args:
+            prompts: Formatted prompts (left-padded to a common length)
+            max_new_tokens: Per-prompt token limits
+            stops: Per-prompt stop rules
             
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
+        Returns:
+            (response text, number of generated tokens, number of prompt tokens) for each prompt
+        """
+        import torch
+        from transformers import StoppingCriteriaList
+        
+        # Tokenize input
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=4096)
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        prompt_length = inputs['input_ids'].shape[1]
+        assisted = self._assisted(len(prompts))
+        if assisted:
+            self.assisted_stats.begin()
+        
+        # Generate response
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max(max_new_tokens),
+                stopping_criteria=StoppingCriteriaList([PerRowMaxNewTokens(prompt_length, max_new_tokens)]
+                                                       + self._stopping_criteria(prompt_length, stops)),
+                temperature=0.7,
+                do_sample=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+                **assisted
+            )
+        if assisted:
+            self.assisted_stats.end(outputs.shape[1] - prompt_length)
+        
+        prompt_tokens = inputs['attention_mask'].sum(dim=1).tolist()
+        return [self._decode_new_tokens(row, limit, stop) + (prompt_tokens[index],)
+                for index, (row, limit, stop) in enumerate(zip(outputs[:, prompt_length:].tolist(), max_new_tokens, stops))]
+    
+    def _decode_new_tokens(self, row: List[int], limit: int, stop: StopRules) -> Tuple[str, int]:
+        """Decode generated token ids up to the first EOS/padding token and cut where the stop rules say"""
+        row = row[:limit]
+        for index, token_id in enumerate(row):
+            if token_id in (self.tokenizer.eos_token_id, self.tokenizer.pad_token_id):
+                row = row[:index]
+                break
+        response = stop.cut(self.tokenizer.decode(row, skip_special_tokens=True))[0]
+        return response.strip(), len(row)
     
     def _format_messages_for_deepseek(self, messages: List[Dict[str, str]]) -> str:
         """
@@ -171,16 +1199,20 @@ class LocalLLMService:
 class AgenticStartupFactory:
     """Agentic Startup Factory - Core agentic LLM implementation"""
     
-    def __init__(self, llm_service: LocalLLMService):
+    def __init__(self, llm_service: LocalLLMService, request_updates: bool = False):
         """
         Initialize the Agentic Startup Factory
         
         Args:
             llm_service: Local LLM service instance
+            request_updates: Ask the model to end each turn with a consideration updates section
         """
         self.llm_service = llm_service
+        self.request_updates = request_updates
         self.consideration_categories = self._get_consideration_categories()
         self.sessions: Dict[str, SessionData] = {}
+        # Every turn's system prompt starts with the same instructions: encode them once
+        self.llm_service.cache_system_prefix(ASF_INSTRUCTIONS)
     
     def _get_consideration_categories(self) -> List[ConsiderationCategory]:
         """Get the 8 core business consideration categories"""
@@ -292,6 +1324,39 @@ class AgenticStartupFactory:
         
         return "\n".join(context_parts)
     
+    def _build_messages(self, session_data: SessionData, user_message: str) -> List[Dict[str, str]]:
+        """
+        Build the system prompt, recent history and new user message for one turn
+        
+        Args:
+            session_data: Current session data
+            user_message: User's input message
+            
+        Returns:
+            Messages for the LLM
+        """
+        # Create system prompt for agentic behavior (static instructions first, so their KV cache is shared)
+        context = self._build_context(session_data)
+        system_prompt = f"""{ASF_INSTRUCTIONS}{context}
+
+Be conversational, supportive, and focus on helping the user develop a strong startup concept. If they ask about a specific consideration, provide targeted guidance for that area.
+"""
+        if self.request_updates:
+            system_prompt += UPDATES_INSTRUCTIONS
+        
+        # Build message history
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # Add recent chat history (last 10 messages)
+        recent_messages = session_data.chat_history[-10:]
+        for msg in recent_messages:
+            messages.append({"role": "user", "content": msg.user_message})
+            messages.append({"role": "assistant", "content": msg.ai_response})
+        
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+        return messages
+    
     def get_agentic_response(self, user_message: str, session_id: str) -> str:
         """
         Generate agentic response based on user message and session context
@@ -308,40 +1373,10 @@ class AgenticStartupFactory:
             return "Session not found. Please create a new session."
         
         try:
-            # Build context from session data
-            context = self._build_context(session_data)
-            
-            # Create system prompt for agentic behavior
-            system_prompt = f"""You are the Agentic Startup Factory (ASF), an AI assistant that helps ideators refine startup ideas through structured considerations. You guide users through 8 core consideration categories to develop comprehensive startup concepts.
-
-Your role is to:
-1. Ask insightful questions to help develop ideas
-2. Provide constructive feedback and suggestions
-3. Guide users toward completing all 8 considerations
-4. Maintain focus on practical, actionable advice
-5. Encourage ethical business practices and community collaboration
-6. Suggest when considerations need more detail (minimum 100 words each)
-
-Current session context:
-{context}
-
-Be conversational, supportive, and focus on helping the user develop a strong startup concept. If they ask about a specific consideration, provide targeted guidance for that area.
-"""
-            
-            # Build message history
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add recent chat history (last 10 messages)
-            recent_messages = session_data.chat_history[-10:]
-            for msg in recent_messages:
-                messages.append({"role": "user", "content": msg.user_message})
-                messages.append({"role": "assistant", "content": msg.ai_response})
-            
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
+            messages = self._build_messages(session_data, user_message)
             
             # Generate response using local LLM
-            response = self.llm_service.generate_response(messages, max_tokens=800)
+            response = self.llm_service.generate_response(messages, max_tokens=800, session_id=session_id)
             
             # Update session with new message
             self._add_message(session_id, user_message, response)
@@ -352,6 +1387,63 @@ Be conversational, supportive, and focus on helping the user develop a strong st
             logger.error(f"Error generating agentic response: {e}")
             return "I apologize, but I'm having trouble processing your request right now. Please try again in a moment."
     
+    def run_turn(self, user_message: str, session_id: str, max_tokens: int = 800) -> Dict[str, Any]:
+        """
+        Generate one turn, apply its consideration updates and return the parsed result
+        
+        Args:
+            user_message: User's input message
+            session_id: Session identifier
+            max_tokens: Maximum tokens to generate
+            
+        Returns:
+            Dictionary with the response (updates section removed), the updates applied and the completion status
+            
+        Raises:
+            Exception: Generation failed; the session is left unchanged
+        """
+        session_data = self.get_session(session_id)
+        if not session_data:
+            raise KeyError(f"Session not found: {session_id}")
+        
+        messages = self._build_messages(session_data, user_message)
+        raw_response = self.llm_service.generate_response(messages, max_tokens=max_tokens, session_id=session_id,
+                                                          closing_markers=[UPDATES_END], raise_errors=True)
+        response, updates = parse_consideration_updates(raw_response)
+        # Ids the model made up are dropped rather than stored as new considerations
+        updates = {consideration_id: content for consideration_id, content in updates.items()
+                   if consideration_id in session_data.considerations}
+        for consideration_id, content in updates.items():
+            self.update_consideration(session_id, consideration_id, content)
+        self._add_message(session_id, user_message, response)
+        
+        return {
+            "response": response,
+            "updates": updates,
+            "status": self.get_completion_status(session_id)
+        }
+    
+    def stream_agentic_response(self, user_message: str, session_id: str) -> TokenStream:
+        """
+        Stream an agentic response; the turn is added to the session once the stream ends
+        
+        Args:
+            user_message: User's input message
+            session_id: Session identifier
+            
+        Returns:
+            TokenStream of response text chunks
+        """
+        session_data = self.get_session(session_id)
+        if not session_data:
+            return TokenStream(["Session not found. Please create a new session."])
+        
+        messages = self._build_messages(session_data, user_message)
+        return self.llm_service.stream_response(
+            messages, max_tokens=800, session_id=session_id,
+            on_complete=lambda response: self._add_message(session_id, user_message, response)
+        )
+    
     def _add_message(self, session_id: str, user_message: str, ai_response: str):
         """
         Add message to session chat history
@@ -517,19 +1609,48 @@ Focus on fairness, long-term sustainability, and alignment with startup best pra
             "description": description if description else "No description available"
         }
 
+def local_llm_service_from_env(model_name: str, **kwargs) -> LocalLLMService:
+    """
+    Build a LocalLLMService configured by the environment, as every runner in this script does
+    
+    Args:
+        model_name: HuggingFace model name or local path
+        **kwargs: Further LocalLLMService arguments
+        
+    Returns:
+        Service whose model loads on first use
+    """
+    # LLM_CASSETTE_MODE=record|replay captures or replays generations for repeatable runs
+    cassette = LLMCassette.from_env("data/cassettes/local_llm.jsonl.gz")
+    # FORGE_CPU_INT8=1, FORGE_CPU_THREADS=N, FORGE_CPU_NUMA_NODE=N, ... enable the CPU performance mode;
+    # FORGE_MODEL_CACHE_DIR stages the model on node-local disk
+    return LocalLLMService(model_name, cassette=cassette, cpu=CPUSettings.from_env(),
+                           model_cache_dir=os.environ.get("FORGE_MODEL_CACHE_DIR"), **kwargs)
+
 class ExperimentRunner:
     """Main experiment runner for testing the agentic setup"""
     
-    def __init__(self, model_name: str = "deepseek-ai/deepseek-coder-6.7b-instruct"):
+    def __init__(self, model_name: str = "deepseek-ai/deepseek-coder-6.7b-instruct",
+                 draft_model_name: Optional[str] = None, draft_tokens: int = 5):
         """
         Initialize the experiment runner
         
         Args:
             model_name: HuggingFace model name
+            draft_model_name: Optional small model of the same family for assisted generation,
+                e.g. deepseek-ai/deepseek-coder-1.3b-instruct
+            draft_tokens: Tokens the draft model proposes per step to start with
         """
         logger.info("Initializing Experiment Runner...")
-        self.llm_service = LocalLLMService(model_name)
+        self.llm_service = local_llm_service_from_env(model_name, draft_model_name=draft_model_name,
+                                                      draft_tokens=draft_tokens)
         self.asf = AgenticStartupFactory(self.llm_service)
+        # asf.sessions is never pruned; FORGE_TRACEMALLOC_FRAMES=N traces allocations from the start
+        self.memory = MemoryMonitor(sample_interval=10,
+                                    trace_frames=int(os.environ.get("FORGE_TRACEMALLOC_FRAMES", "0")))
+        self.memory.register_sessions("asf_sessions", lambda: self.asf.sessions)
+        self.memory.start()
+        self.turn_timings: List[StreamTiming] = []
         logger.info("Experiment Runner initialized successfully!")
     
     def run_interactive_session(self):
@@ -540,6 +1661,7 @@ class ExperimentRunner:
         print("Welcome to the Agentic LLM Experiment!")
         print("This system will help you develop a startup idea through 8 core considerations.")
         print("Type 'quit' to exit, 'status' to see progress, 'summary' for idea summary.")
+        print("Type 'memory' for a memory report, 'memory snapshot' / 'memory diff' to track growth.")
         print("="*60)
         
         # Create new session
@@ -568,13 +1690,16 @@ class ExperimentRunner:
                     print(f"Description: {summary['description']}")
                     continue
                 
+                elif user_input.lower().startswith('memory'):
+                    self._print_memory(user_input.lower().split()[1:])
+                    continue
+                
                 elif not user_input:
                     continue
                 
-                # Generate agentic response
+                # Stream agentic response
                 print("🤖 ASF: ", end="", flush=True)
-                response = self.asf.get_agentic_response(user_input, session_id)
-                print(response)
+                self._stream_turn(user_input, session_id)
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Session interrupted. Goodbye!")
@@ -583,6 +1708,30 @@ class ExperimentRunner:
                 logger.error(f"Error in interactive session: {e}")
                 print(f"❌ Error: {e}")
     
+    def _stream_turn(self, message: str, session_id: str):
+        """Print a response as it is generated, then its latency"""
+        stream = self.asf.stream_agentic_response(message, session_id)
+        for chunk in stream:
+            print(chunk, end="", flush=True)
+        print()
+        timing = stream.timing
+        self.turn_timings.append(timing)
+        print(f"⏱️ First token {timing.time_to_first_token_ms:.0f} ms, {timing.tokens} tokens "
+              f"at {timing.inter_token_ms:.1f} ms/token ({timing.total_ms / 1000:.1f}s)")
+    
+    def _print_memory(self, args: List[str]):
+        """Print a memory report, take a snapshot, or diff against the latest snapshot"""
+        if args[:1] == ['snapshot']:
+            print(f"\n📸 Snapshot {self.memory.take_snapshot()} taken")
+        elif args[:1] == ['diff']:
+            try:
+                print("\n" + format_report(self.memory.diff(limit=10)))
+            except KeyError:
+                print("\n❌ No snapshot yet; type 'memory snapshot' first")
+        else:
+            self.memory.sample()
+            print("\n" + format_report(self.memory.report(limit=10)))
+    
     def run_demo_conversation(self):
         """Run a demo conversation to showcase the agentic capabilities"""
         print("\n" + "="*60)
@@ -606,8 +1755,8 @@ class ExperimentRunner:
             print(f"\n--- Turn {i} ---")
             print(f"🤔 User: {message}")
             
-            response = self.asf.get_agentic_response(message, session_id)
-            print(f"🤖 ASF: {response}")
+            print("🤖 ASF: ", end="", flush=True)
+            self._stream_turn(message, session_id)
             
             # Show progress
             status = self.asf.get_completion_status(session_id)
@@ -629,14 +1778,467 @@ class ExperimentRunner:
             print(f"💡 Equity Suggestion: {equity_result['suggestion'][:200]}...")
         else:
             print(f"❌ Equity suggestion failed: {equity_result['error']}")
+        
+        timed = [timing for timing in self.turn_timings if timing.tokens]
+        if timed:
+            print(f"\n--- Latency ---")
+            print(f"⏱️ Mean first token {sum(t.time_to_first_token_ms for t in timed) / len(timed):.0f} ms, "
+                  f"mean {sum(t.inter_token_ms for t in timed) / len(timed):.1f} ms/token over {len(timed)} turns")
+        
+        if self.llm_service.draft_model is not None:
+            assisted = self.llm_service.assisted_stats.summary()
+            print(f"\n--- Assisted Decoding ---")
+            print(f"🎯 {assisted['acceptance_rate']:.0%} of {assisted['drafted']} draft tokens accepted, "
+                  f"{assisted['tokens_per_step']:.2f} tokens per main-model step, "
+                  f"{assisted['tokens_per_second']:.1f} tokens/s")
+        
+        print(f"\n--- Startup ---")
+        print(startup.report())
+        
+        print(f"\n--- Memory ---")
+        self._print_memory([])
+
+@dataclass
+class Scenario:
+    """A scripted conversation for sweep runs"""
+    id: str
+    turns: List[str]
+    considerations: Dict[str, str] = field(default_factory=dict)  # seeded before the first turn
+
+def load_scenarios(path: str) -> List[Scenario]:
+    """
+    Load scenarios from a JSON list or a JSONL file of {"id", "turns", "considerations"} objects
+    
+    Args:
+        path: Scenario file
+        
+    Returns:
+        Scenarios in file order; a missing id becomes the scenario's position
+        
+    Raises:
+        ValueError: Two scenarios share an id (checkpoints and merges are keyed by it)
+    """
+    with open(path, encoding="utf-8") as handle:
+        text = handle.read()
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    scenarios = [Scenario(id=str(entry.get("id", index)), turns=list(entry["turns"]),
+                          considerations=dict(entry.get("considerations", {})))
+                 for index, entry in enumerate(entries)]
+    ids = [scenario.id for scenario in scenarios]
+    duplicates = sorted({scenario_id for scenario_id in ids if ids.count(scenario_id) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate scenario ids in {path}: {', '.join(duplicates)}")
+    return scenarios
+
+@dataclass
+class ShardSpec:
+    """Which share of a scenario set this job array task runs"""
+    index: int = 0
+    count: int = 1
+    
+    @classmethod
+    def from_env(cls) -> "ShardSpec":
+        """
+        Shard from FORGE_SHARD_INDEX/FORGE_SHARD_COUNT, else from the Slurm job array, else the whole set
+        
+        Slurm task ids are made zero-based with SLURM_ARRAY_TASK_MIN, so --array=1-8 gives shards 0..7.
+        """
+        if os.environ.get("FORGE_SHARD_COUNT"):
+            return cls(int(os.environ.get("FORGE_SHARD_INDEX", "0")), int(os.environ["FORGE_SHARD_COUNT"]))
+        if os.environ.get("SLURM_ARRAY_TASK_COUNT"):
+            return cls(int(os.environ["SLURM_ARRAY_TASK_ID"]) - int(os.environ.get("SLURM_ARRAY_TASK_MIN", "0")),
+                       int(os.environ["SLURM_ARRAY_TASK_COUNT"]))
+        return cls()
+    
+    def __post_init__(self):
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"Shard index {self.index} is outside 0..{self.count - 1}")
+    
+    def select(self, scenarios: List[Scenario]) -> List[Scenario]:
+        """Every count-th scenario starting at index: the same split for every task, balanced to within one"""
+        return scenarios[self.index::self.count]
+    
+    def output_path(self, output_path: str) -> str:
+        """Results file of this shard: results.jsonl becomes results.shard-003-of-008.jsonl"""
+        if self.count == 1:
+            return output_path
+        stem, extension = os.path.splitext(output_path)
+        return f"{stem}.shard-{self.index:03d}-of-{self.count:03d}{extension}"
+
+def read_sweep_records(path: str, repair: bool = False) -> List[Dict[str, Any]]:
+    """
+    Read a sweep results file, ignoring a final line cut short by a killed job
+    
+    Args:
+        path: Results JSONL file
+        repair: Truncate the cut-off line so appended records start on a fresh line
+        
+    Returns:
+        Records in file order
+    """
+    records = []
+    good_bytes = 0
+    with open(path, "rb") as handle:
+        for line in handle:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring truncated record at byte {good_bytes} of {path}")
+                break
+            good_bytes += len(line)
+    if repair and good_bytes < os.path.getsize(path):
+        with open(path, "r+b") as handle:
+            handle.truncate(good_bytes)
+    return records
+
+def completed_turns(records: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Each scenario's finished turns, in order, from its results records
+    
+    Turns are finished from the first onwards until a failed or missing turn; a turn recorded twice (rerun after
+    a restart) counts once, as its last record.
+    
+    Args:
+        records: Results records, possibly from several runs of the same shard
+        
+    Returns:
+        {scenario id: records of turns 1..n}
+    """
+    latest: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for record in records:
+        latest[(record["scenario"], record["turn"])] = record
+    completed: Dict[str, List[Dict[str, Any]]] = {}
+    for scenario_id in dict.fromkeys(record["scenario"] for record in records):
+        turns = []
+        while (scenario_id, len(turns) + 1) in latest and not latest[(scenario_id, len(turns) + 1)]["error"]:
+            turns.append(latest[(scenario_id, len(turns) + 1)])
+        completed[scenario_id] = turns
+    return completed
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class ScenarioSweep:
+    """Plays scenarios through one AgenticStartupFactory and reports a record per turn"""
+    
+    def __init__(self, llm_service: LocalLLMService, request_updates: bool = True, max_tokens: int = 800):
+        """
+        Initialize the sweep
+        
+        Args:
+            llm_service: Service shared by every scenario run on this sweep
+            request_updates: Ask for a consideration updates section each turn
+            max_tokens: Maximum tokens generated per turn
+        """
+        self.asf = AgenticStartupFactory(llm_service, request_updates=request_updates)
+        self.max_tokens = max_tokens
+        # Scenarios run concurrently, so usage is matched to its turn by session
+        self._usage: Dict[str, Tuple[Dict[str, int], float]] = {}
+        llm_service.usage_recorder = self._record_usage
+        # Loaded up front so the first turn's latency excludes the model load (replays never load it)
+        if not llm_service.cassette:
+            llm_service.load_model()
+    
+    def _record_usage(self, session_id: Optional[str], model: str, usage: Dict[str, int], latency: float):
+        self._usage[session_id] = (usage, latency)
+    
+    def run(self, scenario: Scenario, emit: Callable[[Dict[str, Any]], None],
+            completed: Optional[List[Dict[str, Any]]] = None):
+        """
+        Play a scenario turn by turn; a failed turn is reported and ends the scenario
+        
+        Args:
+            scenario: Scenario to play
+            emit: Called with each turn's record as soon as the turn finishes
+            completed: Records of turns finished by an earlier run; the scenario resumes after them
+        """
+        if completed:
+            session_id = self._restore_session(completed)
+        else:
+            session_id = self.asf.create_session()
+            for consideration_id, content in scenario.considerations.items():
+                self.asf.update_consideration(session_id, consideration_id, content)
+        
+        for turn, message in enumerate(scenario.turns, 1):
+            if completed and turn <= len(completed):
+                continue
+            record = {"scenario": scenario.id, "turn": turn, "session_id": session_id, "message": message,
+                      "response": None, "updates": {}, "status": None, "error": None, "worker": os.getpid()}
+            start = time.perf_counter()
+            try:
+                record.update(self.asf.run_turn(message, session_id, max_tokens=self.max_tokens))
+            except Exception as e:
+                logger.error(f"Scenario {scenario.id} turn {turn} failed: {e}")
+                record["error"] = str(e)
+            record["latency_ms"] = (time.perf_counter() - start) * 1000
+            
+            # Replayed cassette turns have no usage: the model never ran
+            usage, generation_seconds = self._usage.pop(session_id, ({}, None))
+            record["prompt_tokens"] = usage.get("prompt_tokens")
+            record["completion_tokens"] = usage.get("completion_tokens")
+            record["generation_ms"] = generation_seconds * 1000 if generation_seconds is not None else None
+            record["tokens_per_second"] = (usage["completion_tokens"] / generation_seconds
+                                           if generation_seconds else None)
+            # With the messages and responses before it, this checkpoints the whole session
+            record["considerations"] = dict(self.asf.get_session(session_id).considerations)
+            record["timestamp"] = time.time()
+            emit(record)
+            if record["error"]:
+                break
+
+    def _restore_session(self, completed: List[Dict[str, Any]]) -> str:
+        """Rebuild a session from the records of its finished turns, under its original id"""
+        session_id = completed[-1]["session_id"]
+        self.asf.sessions[session_id] = SessionData(
+            session_id=session_id,
+            created_at=datetime.fromtimestamp(completed[0]["timestamp"]).isoformat(),
+            considerations=dict(completed[-1]["considerations"]),
+            chat_history=[ChatMessage(timestamp=datetime.fromtimestamp(record["timestamp"]).isoformat(),
+                                      user_message=record["message"], ai_response=record["response"])
+                          for record in completed],
+            last_updated=datetime.fromtimestamp(completed[-1]["timestamp"]).isoformat()
+        )
+        logger.info(f"Resumed session {session_id} after turn {len(completed)}")
+        return session_id
+
+# Per-process sweep state for ProcessPoolExecutor workers
+_sweep_worker: Optional[ScenarioSweep] = None
+_sweep_records = None
+
+def _init_sweep_worker(model_name: str, service_options: Dict[str, Any], request_updates: bool, max_tokens: int,
+                       records):
+    global _sweep_worker, _sweep_records
+    logging.getLogger().setLevel(logging.WARNING)
+    _sweep_worker = ScenarioSweep(local_llm_service_from_env(model_name, **service_options),
+                                  request_updates, max_tokens)
+    _sweep_records = records
+
+def _run_sweep_scenario(scenario: Scenario, completed: List[Dict[str, Any]]) -> str:
+    _sweep_worker.run(scenario, _sweep_records.put, completed)
+    return scenario.id
+
+def run_sweep(model_name: str, scenarios: List[Scenario], output_path: str, workers: int = 1,
+              batch_sessions: int = 1, max_tokens: int = 800, request_updates: bool = True,
+              resume: bool = True, **service_options) -> Dict[str, Any]:
+    """
+    Run scenarios non-interactively, appending each turn's record to a JSONL file as it finishes
+    
+    With workers > 1 every worker process loads its own model and runs whole scenarios. Otherwise one
+    model serves batch_sessions scenarios at a time, their turns batched together by DynamicBatcher.
+    
+    The results file is also the checkpoint: each record carries its session's considerations, so a rerun
+    of a killed or preempted job rebuilds every session and continues from its first unfinished turn.
+    
+    Args:
+        model_name: HuggingFace model name or local path
+        scenarios: Scenarios to run
+        output_path: JSONL results file, appended to
+        workers: Worker processes, each with its own model
+        batch_sessions: Concurrent scenarios on the single model when workers is 1
+        max_tokens: Maximum tokens generated per turn
+        request_updates: Ask for a consideration updates section each turn
+        resume: Continue from the turns already in output_path; otherwise start the file afresh
+        **service_options: Further LocalLLMService arguments for every model, e.g. draft_model_name
+        
+    Returns:
+        Throughput and latency summary of this run's turns (see summarize_sweep); its wall time includes
+        model loads
+    """
+    completed: Dict[str, List[Dict[str, Any]]] = {}
+    if resume and os.path.exists(output_path):
+        completed = completed_turns(read_sweep_records(output_path, repair=True))
+    elif os.path.exists(output_path):
+        os.remove(output_path)
+    remaining = [scenario for scenario in scenarios if len(completed.get(scenario.id, [])) < len(scenario.turns)]
+    if len(remaining) < len(scenarios) or any(completed.values()):
+        logger.warning(f"Resuming {output_path}: {len(scenarios) - len(remaining)} scenarios already finished, "
+                       f"{sum(len(turns) for turns in completed.values())} turns done")
+    if not remaining:
+        return summarize_sweep([], 0.0)
+    
+    if workers > 1:
+        # spawn: forking after torch has started threads can deadlock the children
+        context = multiprocessing.get_context("spawn")
+        records = context.Queue()
+        executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_sweep_worker,
+                                       initargs=(model_name, service_options, request_updates, max_tokens, records))
+        run_scenario = _run_sweep_scenario
+    else:
+        records = queue.Queue()
+        executor = ThreadPoolExecutor(max(1, batch_sessions))
+    
+    results = []
+    start = time.perf_counter()
+    if workers <= 1:
+        sweep = ScenarioSweep(local_llm_service_from_env(model_name, max_batch_size=batch_sessions,
+                                                         **service_options),
+                              request_updates, max_tokens)
+        run_scenario = lambda scenario, done: sweep.run(scenario, records.put, done)
+    with executor, open(output_path, "a", encoding="utf-8") as output:
+        futures = [executor.submit(run_scenario, scenario, completed.get(scenario.id, []))
+                   for scenario in remaining]
+        # Write records as they arrive; after the last scenario finishes, drain what is still queued
+        while True:
+            finished = all(future.done() for future in futures)
+            try:
+                record = records.get(timeout=0.2)
+            except queue.Empty:
+                if finished:
+                    break
+                continue
+            results.append(record)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+        for future in futures:
+            future.result()
+    return summarize_sweep(results, time.perf_counter() - start)
+
+def summarize_sweep(records: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """
+    Aggregate throughput and latency over a sweep's turn records
+    
+    Args:
+        records: Turn records written by run_sweep
+        elapsed: Wall-clock seconds of the sweep
+        
+    Returns:
+        Summary dictionary
+    """
+    completed = [record for record in records if not record["error"]]
+    latencies = sorted(record["latency_ms"] for record in completed)
+    completion_tokens = sum(record["completion_tokens"] or 0 for record in completed)
+    prompt_tokens = sum(record["prompt_tokens"] or 0 for record in completed)
+    return {
+        "scenarios": len({record["scenario"] for record in records}),
+        "turns": len(records),
+        "errors": len(records) - len(completed),
+        "elapsed_seconds": elapsed,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "turns_per_second": len(completed) / elapsed if elapsed > 0 else 0.0,
+        "tokens_per_second": completion_tokens / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+
+def merge_sweep_shards(output_path: str) -> Dict[str, Any]:
+    """
+    Combine the shard results files of a sweep into one results file
+    
+    Each turn is kept once, as its last record, so turns rerun after a restart are not counted twice.
+    
+    Args:
+        output_path: Results path the shards were run with; the merged file is written here
+        
+    Returns:
+        Summary of the merged turns; wall time spans the first to the last turn of any shard
+        
+    Raises:
+        FileNotFoundError: No shard files were found for output_path
+    """
+    stem, extension = os.path.splitext(output_path)
+    paths = sorted(glob.glob(f"{glob.escape(stem)}.shard-*-of-*{extension}"))
+    if not paths:
+        raise FileNotFoundError(f"No shard results found for {output_path}")
+    
+    counts = {re.search(r"\.shard-\d+-of-(\d+)", path).group(1) for path in paths}
+    if len(counts) > 1:
+        raise ValueError(f"Shard files of different shard counts: {', '.join(paths)}")
+    expected = int(counts.pop())
+    if len(paths) < expected:
+        logger.warning(f"Only {len(paths)} of {expected} shards have results")
+    
+    latest: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for path in paths:
+        for record in read_sweep_records(path):
+            latest[(record["scenario"], record["turn"])] = record
+    records = sorted(latest.values(), key=lambda record: (record["scenario"], record["turn"]))
+    
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as output:
+        for record in records:
+            output.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, output_path)
+    
+    started = min((record["timestamp"] - record["latency_ms"] / 1000 for record in records), default=0.0)
+    finished = max((record["timestamp"] for record in records), default=0.0)
+    return summarize_sweep(records, finished - started)
+
+def format_sweep_summary(summary: Dict[str, Any]) -> str:
+    """Human-readable sweep summary"""
+    return "\n".join([
+        f"📊 {summary['turns']} turns over {summary['scenarios']} scenarios in {summary['elapsed_seconds']:.1f}s "
+        f"({summary['errors']} errors)",
+        f"⚡ {summary['turns_per_second']:.2f} turns/s, {summary['tokens_per_second']:.1f} generated tokens/s "
+        f"({summary['completion_tokens']} generated, {summary['prompt_tokens']} prompt tokens)",
+        f"⏱️ Turn latency mean {summary['mean_ms']:.0f} ms, p50 {summary['p50_ms']:.0f} ms, "
+        f"p95 {summary['p95_ms']:.0f} ms, max {summary['max_ms']:.0f} ms",
+    ])
 
 def main():
     """Main function to run the experiment"""
+    parser = argparse.ArgumentParser(description="HPC Cluster Experiments - Agentic LLM Setup")
+    parser.add_argument("--model", default="deepseek-ai/deepseek-coder-6.7b-instruct",
+                        help="HuggingFace model name or local path")
+    parser.add_argument("--draft-model", default=None,
+                        help="Small model with the same tokenizer for assisted generation, "
+                             "e.g. deepseek-ai/deepseek-coder-1.3b-instruct")
+    parser.add_argument("--draft-tokens", type=int, default=5, help="Draft tokens per step to start with")
+    commands = parser.add_subparsers(dest="command")
+    sweep = commands.add_parser("sweep", help="Run scenario conversations non-interactively, writing JSONL results")
+    sweep.add_argument("scenarios", help='JSON list or JSONL file of {"id", "turns", "considerations"} objects')
+    sweep.add_argument("--output", default="sweep_results.jsonl", help="Per-turn JSONL results")
+    sweep.add_argument("--workers", type=int, default=1,
+                       help="Worker processes, each loading the model (set FORGE_CPU_THREADS to share cores)")
+    sweep.add_argument("--batch-sessions", type=int, default=1,
+                       help="Scenarios batched together on one model when --workers is 1 (batched turns skip the "
+                            "KV caches and assisted decoding)")
+    sweep.add_argument("--max-tokens", type=int, default=800)
+    sweep.add_argument("--no-updates", action="store_true", help="Do not ask for consideration updates")
+    sweep.add_argument("--shard-index", type=int, default=None,
+                       help="Shard to run (default: FORGE_SHARD_INDEX or SLURM_ARRAY_TASK_ID)")
+    sweep.add_argument("--shard-count", type=int, default=None,
+                       help="Number of shards (default: FORGE_SHARD_COUNT or SLURM_ARRAY_TASK_COUNT)")
+    sweep.add_argument("--restart", action="store_true", help="Discard earlier results instead of resuming")
+    merge = commands.add_parser("merge", help="Combine the shard results of a sweep into one JSONL file")
+    merge.add_argument("output", help="The --output path the shards were run with")
+    args = parser.parse_args()
+    
+    if args.command == "sweep":
+        # --shard-index/--shard-count simulate job array tasks locally
+        shard = ShardSpec.from_env()
+        if args.shard_index is not None or args.shard_count is not None:
+            shard = ShardSpec(args.shard_index if args.shard_index is not None else shard.index,
+                              args.shard_count or shard.count)
+        scenarios = shard.select(load_scenarios(args.scenarios))
+        output_path = shard.output_path(args.output)
+        print(f"🚀 Sweeping {len(scenarios)} scenarios (shard {shard.index + 1}/{shard.count}) -> {output_path}")
+        summary = run_sweep(args.model, scenarios, output_path, workers=args.workers,
+                            batch_sessions=args.batch_sessions, max_tokens=args.max_tokens,
+                            request_updates=not args.no_updates, resume=not args.restart,
+                            draft_model_name=args.draft_model, draft_tokens=args.draft_tokens)
+        print(format_sweep_summary(summary))
+        return
+    if args.command == "merge":
+        summary = merge_sweep_shards(args.output)
+        print(f"🧩 Merged shard results -> {args.output}")
+        print(format_sweep_summary(summary))
+        return
+    
     print("🚀 Starting HPC Cluster Experiments - Agentic LLM Setup")
     
     try:
         # Initialize experiment runner
-        runner = ExperimentRunner()
+        runner = ExperimentRunner(args.model, draft_model_name=args.draft_model, draft_tokens=args.draft_tokens)
         
         # Ask user for mode
         print("\nSelect mode:")
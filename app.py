@@ -1,13 +1,23 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, g, Response, make_response
 import os
+import time
 import logging
 from datetime import datetime, timedelta
 import uuid
 from openai_service import OpenAIService
 from data_manager import DataManager
+from job_queue import ChatJobQueue
+from llm_dispatcher import LLMBackpressureError
+from logging_setup import configure_logging, begin_trace, end_trace, log_trace
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, CHAT_STAGE_SECONDS
+from request_profiler import RequestProfiler
+from memory_diagnostics import MemoryMonitor
+from fragment_cache import FragmentCache
+from markupsafe import Markup
+from http_cache import (StaticAssets, template_version, weak_etag, http_datetime, is_not_modified,
+                        set_validators, not_modified_response)
+import hmac
 
-# Configure detailed logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -22,12 +32,90 @@ def after_request(response):
     return response
 
 # Initialize services
-openai_service = OpenAIService()
 data_manager = DataManager()
+configure_logging(data_manager.config.get('logging'))
+openai_service = OpenAIService(data_manager.config)
+openai_service.usage_recorder = data_manager.record_llm_usage
+
+# Metrics: with several gunicorn workers, set metrics.multiprocess_dir (or METRICS_MULTIPROC_DIR)
+# so /metrics reports the sum over all workers
+METRICS_CONFIG = data_manager.config.get('metrics', {})
+metrics_dir = os.environ.get("METRICS_MULTIPROC_DIR") or METRICS_CONFIG.get('multiprocess_dir')
+if metrics_dir:
+    REGISTRY.enable_multiprocess(metrics_dir, METRICS_CONFIG.get('flush_interval_seconds', 5))
+
+# On-demand profiling of single requests flagged with the PROFILE_SECRET (off when unset)
+request_profiler = RequestProfiler.from_config(data_manager.config.get('profiling', {}))
+
+# Memory footprint: RSS history, tracemalloc diagnostics and recycling workers over the memory ceiling
+MEMORY_CONFIG = data_manager.config.get('memory', {})
+memory_monitor = MemoryMonitor.from_config(MEMORY_CONFIG)
+if memory_monitor:
+    if openai_service.context_cache:
+        memory_monitor.register_sessions('context_cache', lambda: openai_service.context_cache._sessions)
+    memory_monitor.start()
+
+# HTTP caching: fingerprinted immutable static assets, ETag/Last-Modified validators on marketplace pages
+HTTP_CACHE_CONFIG = data_manager.config.get('http_cache', {})
+PAGE_VALIDATORS = HTTP_CACHE_CONFIG.get('page_validators', True)
+if HTTP_CACHE_CONFIG.get('fingerprint_static', True):
+    static_assets = StaticAssets(app.static_folder, HTTP_CACHE_CONFIG.get('static_max_age_seconds', 31536000))
+    static_assets.init_app(app)
+    ASSETS_VERSION, ASSETS_MTIME = static_assets.version, static_assets.last_modified
+else:
+    ASSETS_VERSION, ASSETS_MTIME = '', 0.0
+TEMPLATES_VERSION, TEMPLATES_MTIME = template_version(app.template_folder)
+# Pages change on deploy too: fold template and asset versions into every validator
+RENDER_VERSION = f"{TEMPLATES_VERSION}-{ASSETS_VERSION}"
+RENDER_MTIME = http_datetime(max(TEMPLATES_MTIME, ASSETS_MTIME))
+
+# Pre-rendered HTML of idea bodies, comment lists and marketplace cards
+fragment_cache = FragmentCache.from_config(data_manager.config.get('fragment_cache', {}))
 
 # Get considerations from config
 CONSIDERATION_CATEGORIES = data_manager.config['considerations']
 
+@app.before_request
+def start_log_trace():
+    """Give each request its own log trace id (and trace sampling decision)"""
+    g.log_trace = begin_trace()
+    g.request_start = time.perf_counter()
+    
+    # Diagnostics endpoints share the secret header but are not profiled themselves
+    profile_mode = request_profiler.requested_mode(request) if request_profiler else None
+    if profile_mode and not request.path.startswith('/api/debug/'):
+        g.profile = request_profiler.begin(profile_mode, f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_latency(response):
+    if 'request_start' in g:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                     endpoint=request.endpoint or 'unmatched', status=str(response.status_code))
+    return response
+
+@app.after_request
+def attach_profile(response):
+    """Save the capture of a profiled request and return its span tree in the headers"""
+    if 'profile' in g:
+        response.headers.update(request_profiler.finish(g.pop('profile')))
+    return response
+
+@app.teardown_request
+def finish_log_trace(exc):
+    if 'profile' in g:
+        # The request failed before after_request ran; still stop the profiler and save what we have
+        request_profiler.finish(g.pop('profile'))
+    end_trace(g.pop('log_trace', None))
+
+@app.errorhandler(LLMBackpressureError)
+def llm_backpressure(e):
+    """LLM capacity exhausted: ask the client to retry later"""
+    response = jsonify({'error': 'The assistant is busy right now. Please try again shortly.',
+                        'retry_after': e.retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/')
 def index():
     """Main landing page introducing the Forge platform"""
@@ -55,11 +143,54 @@ def forge():
                          considerations=CONSIDERATION_CATEGORIES,
                          session_data=session_data)
 
+def cached_fragment(kind, key, version, render):
+    """HTML fragment from the fragment cache (rendered directly when the cache is disabled)"""
+    if fragment_cache is None:
+        return Markup(render())
+    return fragment_cache.get_or_render(kind, key, version, render)
+
+def idea_body_fragment(idea_id, idea):
+    """The considerations accordion of a submitted idea (immutable once submitted)"""
+    def render():
+        considerations = [(consideration_id, data_manager.get_consideration_content(data) or '')
+                          for consideration_id, data in idea.get('considerations', {}).items()]
+        return render_template('_idea_body.html',
+                               considerations=[item for item in considerations if item[1].strip()])
+    return cached_fragment('idea_body', idea_id, idea.get('submitted_at'), render)
+
+def idea_comments_fragment(idea_id, comments):
+    """An idea's comment list; comments are only ever appended, so their count is the version"""
+    return cached_fragment('idea_comments', idea_id, len(comments),
+                           lambda: render_template('_idea_comments.html', comments=comments))
+
 @app.route('/marketplace')
 def marketplace():
     """Public ideas marketplace"""
+    if not PAGE_VALIDATORS:
+        return render_marketplace()
+    
+    # Submissions and comments bump the marketplace version and views the views version (cards show
+    # and sort by view counts); the directory mtime catches ideas added by hand
+    versions = data_manager.get_marketplace_versions()
+    ideas_mtime = os.stat(data_manager.ideas_dir).st_mtime_ns
+    etag = weak_etag('marketplace', versions['version'], versions.get('views_version', 0), ideas_mtime, RENDER_VERSION)
+    last_modified = max(filter(None, [http_datetime(versions['updated_at']),
+                                      http_datetime(versions.get('views_updated_at')),
+                                      http_datetime(ideas_mtime / 1e9), RENDER_MTIME]))
+    if is_not_modified(request, etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    return set_validators(make_response(render_marketplace()), etag, last_modified)
+
+def render_marketplace():
+    """Marketplace page from cached cards; only the counters are rendered per request"""
     ideas = data_manager.get_public_ideas()
-    return render_template('marketplace.html', ideas=ideas)
+    card_fragments = {
+        idea['id']: cached_fragment('card', idea['id'], (idea['submitted_at'], idea['status']),
+                                    lambda idea=idea: render_template('_idea_card.html', idea=idea))
+        for idea in ideas
+    }
+    return render_template('marketplace.html', ideas=ideas, card_fragments=card_fragments)
 
 @app.route('/idea/<idea_id>')
 def idea_detail(idea_id):
@@ -68,65 +199,241 @@ def idea_detail(idea_id):
     if not idea:
         return redirect(url_for('marketplace'))
     
-    comments = data_manager.get_comments(idea_id)
-    return render_template('idea_detail.html', idea=idea, comments=comments)
+    # The page shows the view count, so the validators follow it (read after this visit was counted)
+    version = data_manager.get_marketplace_versions()['ideas'].get(idea_id) if PAGE_VALIDATORS else None
+    if version:
+        etag = weak_etag('idea', idea_id, version['version'], idea.get('views', 0), RENDER_VERSION)
+        last_modified = max(filter(None, [http_datetime(version['updated_at']),
+                                          http_datetime(version.get('views_updated_at')), RENDER_MTIME]))
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+    
+    # get_comments() would load the idea again and count a second view
+    comments = idea.get('comments', [])
+    response = make_response(render_template('idea_detail.html', idea=idea, comments=comments,
+                                             idea_body=idea_body_fragment(idea_id, idea),
+                                             comments_html=idea_comments_fragment(idea_id, comments)))
+    if version:
+        set_validators(response, etag, last_modified)
+    return response
+
+def process_chat_turn(session_id, message):
+    """Run one chat turn: call the ASF, apply consideration updates and record the message"""
+    start = time.perf_counter()
+    # Load session context
+    logger.debug("Loading session data...")
+    with CHAT_STAGE_SECONDS.time(stage="load_session"):
+        session_data = data_manager.load_session(session_id)
+    logger.debug("Session data loaded: %s", list(session_data.keys()) if session_data else 'None')
+    
+    # Get AI response
+    logger.debug("Calling OpenAI service...")
+    with CHAT_STAGE_SECONDS.time(stage="asf_response"):
+        ai_result = openai_service.get_asf_response(message, session_data, CONSIDERATION_CATEGORIES)
+    logger.debug("OpenAI response received, length: %s", len(ai_result.get('response', '')))
+    
+    # Extract response and consideration updates
+    response = ai_result.get('response', '')
+    consideration_updates = ai_result.get('consideration_updates', {})
+    
+    # Apply consideration updates to session
+    if consideration_updates:
+        logger.debug("Applying %s consideration updates...", len(consideration_updates))
+        with CHAT_STAGE_SECONDS.time(stage="apply_updates"):
+            for consideration_id, content in consideration_updates.items():
+                logger.debug("Updating consideration %s: %.50s...", consideration_id, content)
+                data_manager.update_consideration(session_id, consideration_id, content)
+    
+    # Update session with new message
+    logger.debug("Adding message to session...")
+    with CHAT_STAGE_SECONDS.time(stage="add_message"):
+        data_manager.add_message(session_id, message, response)
+    logger.debug("Message added to session successfully")
+    CHAT_STAGE_SECONDS.observe(time.perf_counter() - start, stage="total")
+    
+    logger.info("Chat turn completed", extra={
+        'session_id': session_id,
+        'consideration_updates': len(consideration_updates),
+        'duration_ms': round((time.perf_counter() - start) * 1000, 1)
+    })
+    
+    return {
+        'response': response,
+        'session_id': session_id,
+        'consideration_updates': consideration_updates
+    }
+
+def run_chat_job(session_id, payload, max_attempts=5):
+    """Job queue handler for queued chat turns; waits out LLM backpressure instead of failing"""
+    for attempt in range(1, max_attempts + 1):
+        try:
+            with log_trace():
+                return process_chat_turn(session_id, payload.get('message', ''))
+        except LLMBackpressureError as e:
+            if attempt == max_attempts:
+                raise
+            logger.warning(f"LLM backpressure on queued turn, retrying in {e.retry_after}s")
+            time.sleep(e.retry_after)
+
+# Optional background queue for chat turns (see "chat_queue" in data/config.json)
+CHAT_QUEUE_CONFIG = data_manager.config.get('chat_queue', {})
+chat_queue = None
+if CHAT_QUEUE_CONFIG.get('enabled'):
+    chat_queue = ChatJobQueue(
+        CHAT_QUEUE_CONFIG.get('db_path', 'data/jobs/chat_jobs.sqlite3'),
+        run_chat_job,
+        workers=CHAT_QUEUE_CONFIG.get('workers', 4),
+        job_timeout_seconds=CHAT_QUEUE_CONFIG.get('job_timeout_seconds', 300),
+        result_ttl_seconds=CHAT_QUEUE_CONFIG.get('result_ttl_seconds', 3600)
+    )
+    chat_queue.start()
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """Handle chat interactions with OpenAI"""
-    logger.info("=== CHAT API CALL START ===")
+    logger.debug("=== CHAT API CALL START ===")
     try:
         data = request.get_json()
         message = data.get('message', '')
         session_id = session.get('session_id')
         
-        logger.info(f"Received message: {message[:100]}...")
-        logger.info(f"Session ID: {session_id}")
-        logger.info(f"Request data keys: {list(data.keys()) if data else 'None'}")
+        logger.debug("Received message: %.100s...", message)
+        logger.debug("Session ID: %s", session_id)
+        logger.debug("Request data keys: %s", list(data.keys()) if data else 'None')
         
         if not session_id:
             logger.error("No session ID found in session")
             return jsonify({'error': 'No session found'}), 400
         
-        # Load session context
-        logger.info("Loading session data...")
-        session_data = data_manager.load_session(session_id)
-        logger.info(f"Session data loaded: {list(session_data.keys()) if session_data else 'None'}")
-        
-        # Get AI response
-        logger.info("Calling OpenAI service...")
-        ai_result = openai_service.get_asf_response(message, session_data, CONSIDERATION_CATEGORIES)
-        logger.info(f"OpenAI response received, length: {len(ai_result.get('response', ''))}")
-        
-        # Extract response and consideration updates
-        response = ai_result.get('response', '')
-        consideration_updates = ai_result.get('consideration_updates', {})
+        # Stop runaway conversations once the session's token/cost budget is used up
+        budget = data_manager.check_session_budget(session_id)
+        if budget['exceeded']:
+            logger.warning(f"Session {session_id} reached its usage budget")
+            return jsonify({
+                'error': 'This session has reached its usage limit. Submit your idea or start a new session.',
+                'budget': budget
+            }), 403
         
-        # Apply consideration updates to session
-        if consideration_updates:
-            logger.info(f"Applying {len(consideration_updates)} consideration updates...")
-            for consideration_id, content in consideration_updates.items():
-                logger.info(f"Updating consideration {consideration_id}: {content[:50]}...")
-                data_manager.update_consideration(session_id, consideration_id, content)
+        # Queue mode: hand the turn to the worker pool and return immediately
+        if chat_queue:
+            job_id = chat_queue.enqueue(session_id, {'message': message})
+            logger.info(f"Queued chat job {job_id}")
+            return jsonify({
+                'job_id': job_id,
+                'status': 'queued',
+                'session_id': session_id,
+                'result_url': url_for('chat_result', job_id=job_id)
+            }), 202
         
-        # Update session with new message
-        logger.info("Adding message to session...")
-        data_manager.add_message(session_id, message, response)
-        logger.info("Message added to session successfully")
+        result = process_chat_turn(session_id, message)
         
-        logger.info("=== CHAT API CALL END ===")
-        return jsonify({
-            'response': response,
-            'session_id': session_id,
-            'consideration_updates': consideration_updates
-        })
+        logger.debug("=== CHAT API CALL END ===")
+        return jsonify(result)
         
+    except LLMBackpressureError:
+        raise
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         logger.error(f"Error type: {type(e).__name__}")
         logger.error(f"Error traceback: ", exc_info=True)
         return jsonify({'error': 'Failed to process message'}), 500
 
+@app.route('/api/chat/result/<job_id>')
+def chat_result(job_id):
+    """Long-poll for the result of a queued chat turn"""
+    if not chat_queue:
+        return jsonify({'error': 'Chat queue is not enabled'}), 404
+    
+    try:
+        max_wait = CHAT_QUEUE_CONFIG.get('long_poll_seconds', 25)
+        wait = min(max(request.args.get('wait', max_wait, type=float), 0), max_wait)
+        
+        job = chat_queue.get(job_id)
+        if not job or job['session_id'] != session.get('session_id'):
+            return jsonify({'error': 'Job not found'}), 404
+        
+        job = chat_queue.wait(job_id, wait)
+        
+        if job['status'] == 'done':
+            return jsonify({'job_id': job_id, 'status': 'done', **job['result']})
+        if job['status'] == 'failed':
+            return jsonify({'job_id': job_id, 'status': 'failed', 'error': 'Failed to process message'}), 500
+        
+        return jsonify({'job_id': job_id, 'status': job['status'], 'position': job.get('position', 0)}), 202
+        
+    except Exception as e:
+        logging.error(f"Chat result error: {str(e)}")
+        return jsonify({'error': 'Failed to get chat result'}), 500
+
+@app.route('/api/chat/queue_stats')
+def chat_queue_stats():
+    """Queue depth metrics for the chat job queue"""
+    if not chat_queue:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **chat_queue.stats()})
+
+@app.route('/api/llm_stats')
+def llm_stats():
+    """LLM dispatcher queue depth, rate-limit budget, per-priority counters, model routing and context cache"""
+    context_cache = openai_service.context_cache.stats() if openai_service.context_cache else {'enabled': False}
+    return jsonify({**openai_service.dispatcher.stats(), 'routing': openai_service.get_routing_stats(),
+                    'context_cache': context_cache})
+
+@app.route('/api/usage')
+def usage_report():
+    """LLM token usage and cost: the current session, plus daily and per-model totals"""
+    try:
+        days = min(max(request.args.get('days', 7, type=int), 1), 90)
+        report = data_manager.get_usage_report(days)
+        session_id = session.get('session_id')
+        if session_id:
+            report['session'] = {**data_manager.get_session_usage(session_id),
+                                 'budget': data_manager.check_session_budget(session_id)}
+        return jsonify(report)
+    except Exception as e:
+        logging.error(f"Usage report error: {str(e)}")
+        return jsonify({'error': 'Failed to get usage report'}), 500
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics (per-stage chat latency, storage latency, LLM calls and tokens, cache hits)"""
+    if not METRICS_CONFIG.get('enabled', True):
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def diagnostics_authorized():
+    """Whether the request carries the diagnostics secret (X-Profile header or `_profile` parameter)"""
+    secret = os.environ.get(MEMORY_CONFIG.get('secret_env', 'PROFILE_SECRET'))
+    supplied = request.headers.get('X-Profile') or request.args.get('_profile')
+    return bool(secret and supplied) and hmac.compare_digest(supplied.encode(), secret.encode())
+
+@app.route('/api/debug/memory')
+def memory_report():
+    """This worker's RSS history, top allocation sites and per-session sizes, or a diff against a snapshot"""
+    if not memory_monitor or not diagnostics_authorized():
+        return jsonify({'error': 'Not found'}), 404
+    try:
+        limit = min(max(request.args.get('top', 20, type=int), 1), 200)
+        group_by = request.args.get('group_by', 'lineno')
+        if group_by not in ('lineno', 'filename', 'traceback'):
+            group_by = 'lineno'
+        diff = request.args.get('diff')
+        if diff:
+            return jsonify(memory_monitor.diff(None if diff == 'latest' else diff, limit, group_by))
+        return jsonify(memory_monitor.report(limit, group_by))
+    except KeyError:
+        return jsonify({'error': 'Unknown snapshot (snapshots are per worker and only the latest few are kept)'}), 404
+    except Exception as e:
+        logging.error(f"Memory report error: {str(e)}")
+        return jsonify({'error': 'Failed to build memory report'}), 500
+
+@app.route('/api/debug/memory/snapshot', methods=['POST'])
+def memory_snapshot():
+    """Store a tracemalloc snapshot of this worker to diff against later"""
+    if not memory_monitor or not diagnostics_authorized():
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'snapshot_id': memory_monitor.take_snapshot(), 'pid': os.getpid()})
+
 @app.route('/api/update_consideration', methods=['POST'])
 def update_consideration():
     """Update consideration content"""
@@ -174,6 +481,11 @@ def submit_idea():
         # Submit to marketplace
         idea_id = data_manager.submit_to_marketplace(session_id, session_data)
         
+        # Render the idea body now so its first visitor gets it from the fragment cache
+        idea = data_manager.get_idea(idea_id, count_view=False)
+        if idea:
+            idea_body_fragment(idea_id, idea)
+        
         return jsonify({
             'success': True,
             'idea_id': idea_id,
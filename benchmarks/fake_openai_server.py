@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible server for load testing The Forge
+=========================================================
+
+Speaks enough of the chat-completions API (plain and streaming) for
+OpenAIService to run against it without spending real API credits.
+
+Features:
+- Configurable latency distribution (fixed, uniform, normal, lognormal, exponential)
+- Simulated token generation rate for both streamed and non-streamed replies
+- Error injection (rate-limit and server errors) at a configurable rate
+- Canned responses with valid consideration-update blocks, so sessions
+  fill up and can be submitted to the marketplace
+
+Usage:
+    python benchmarks/fake_openai_server.py --port 8001 --latency-dist lognormal \\
+        --latency-mean-ms 800 --tokens-per-second 60 --error-rate 0.02
+
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://localhost:8001/v1 python3 main.py
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CONSIDERATION_IDS = [
+    "problem_definition",
+    "target_market",
+    "solution_approach",
+    "competitive_analysis",
+    "business_model",
+    "technical_feasibility",
+    "team_structure",
+    "growth_strategy",
+]
+
+CONVERSATIONAL_REPLIES = [
+    "That is a promising direction. Let's tighten who feels this pain most and how often they run into it. What does a typical week look like for them today?",
+    "Good detail. I've folded that into your plan. Next, it would help to understand how you expect to charge for this and who signs off on the purchase.",
+    "Thanks, that clarifies the approach. Which existing tools do your users reach for today, and where do those tools fall short for them?",
+    "Nice progress. To round things out, tell me a bit about the skills you already have on the team and which roles you would need to bring in first.",
+    "Understood. Let's think about growth next: which channel could bring in your first hundred customers without a large marketing budget?",
+]
+
+FILLER_SENTENCES = [
+    "The core need shows up repeatedly in day to day operations and costs teams real time and money.",
+    "Early conversations with practitioners suggest the pain is frequent, measurable and poorly served today.",
+    "A focused first version can deliver value quickly while leaving room to expand into adjacent workflows.",
+    "Success depends on earning trust with a small group of committed early adopters before scaling out.",
+    "Clear metrics such as time saved per week and retention after ninety days will guide iteration.",
+    "The approach favors simple onboarding, sensible defaults and integrations with tools people already use.",
+    "Risks include slow procurement cycles, data quality issues and competition from larger incumbents.",
+    "Mitigations include a generous pilot program, careful data validation and a tightly scoped roadmap.",
+]
+
+
+def _consideration_paragraph(consideration_id, seed, min_words=110):
+    """Build a deterministic paragraph of at least min_words words"""
+    rng = random.Random(f"{consideration_id}:{seed}")
+    title = consideration_id.replace('_', ' ')
+    words = [f"For the {title},"]
+    sentences = list(FILLER_SENTENCES)
+    while sum(len(w.split()) for w in words) < min_words:
+        rng.shuffle(sentences)
+        words.extend(sentences)
+    return " ".join(words)
+
+
+def _estimate_tokens(text):
+    """Rough token estimate (about 4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class FakeLLMBehavior:
+    """Latency, throughput and error model for the fake server"""
+
+    def __init__(self, latency_dist="lognormal", latency_mean_ms=500.0, latency_stddev_ms=200.0,
+                 tokens_per_second=50.0, error_rate=0.0, error_status=429, updates_per_turn=3,
+                 responses_file=None, seed=None):
+        self.latency_dist = latency_dist
+        self.latency_mean_ms = latency_mean_ms
+        self.latency_stddev_ms = latency_stddev_ms
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.updates_per_turn = updates_per_turn
+        self.canned_responses = self._load_responses(responses_file)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "streamed": 0}
+
+    def _load_responses(self, responses_file):
+        """Load canned responses from a JSON list of strings, if given"""
+        if not responses_file:
+            return None
+        with open(responses_file, 'r') as f:
+            responses = json.load(f)
+        if not isinstance(responses, list) or not responses:
+            raise ValueError("Responses file must contain a non-empty JSON list of strings")
+        return responses
+
+    def sample_latency(self):
+        """Sample time-to-first-token in seconds from the configured distribution"""
+        mean = self.latency_mean_ms / 1000.0
+        stddev = self.latency_stddev_ms / 1000.0
+        with self._lock:
+            if self.latency_dist == "fixed":
+                value = mean
+            elif self.latency_dist == "uniform":
+                value = self._rng.uniform(max(0.0, mean - stddev), mean + stddev)
+            elif self.latency_dist == "normal":
+                value = self._rng.gauss(mean, stddev)
+            elif self.latency_dist == "exponential":
+                value = self._rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+            else:
+                # Lognormal with the requested mean and standard deviation
+                if mean <= 0:
+                    value = 0.0
+                else:
+                    sigma_sq = math.log(1 + (stddev ** 2) / (mean ** 2))
+                    mu = math.log(mean) - sigma_sq / 2
+                    value = self._rng.lognormvariate(mu, math.sqrt(sigma_sq))
+        return max(0.0, value)
+
+    def should_fail(self):
+        """Decide whether to inject an error for this request"""
+        with self._lock:
+            self.stats["requests"] += 1
+            if self.error_rate > 0 and self._rng.random() < self.error_rate:
+                self.stats["errors_injected"] += 1
+                return True
+        return False
+
+    def build_reply(self, messages, response_format=None):
+        """Build reply text for the given conversation"""
+        turn = sum(1 for m in messages if m.get('role') == 'user')
+
+        if response_format and response_format.get('type') == 'json_object':
+            return json.dumps({
+                "equity_split": {"Founder": 40, "CTO": 30, "Marketing Lead": 20, "Reserved": 10},
+                "reasoning": "Split reflects idea origination, technical risk and go-to-market effort.",
+                "vesting": "Four year vesting with a one year cliff for all founders.",
+                "future_additions": "Keep an option pool of 10 percent for early hires.",
+            })
+
+        # Single-message requests without a system prompt are per-consideration drafts
+        if not any(m.get('role') == 'system' for m in messages):
+            prompt = messages[-1].get('content', '') if messages else ''
+            return _consideration_paragraph("section", len(prompt))
+
+        if self.canned_responses:
+            return self.canned_responses[(turn - 1) % len(self.canned_responses)]
+
+        reply = CONVERSATIONAL_REPLIES[(turn - 1) % len(CONVERSATIONAL_REPLIES)]
+        if self.updates_per_turn <= 0:
+            return reply
+
+        # Rotate through considerations so a handful of turns fills all of them
+        start = ((turn - 1) * self.updates_per_turn) % len(CONSIDERATION_IDS)
+        update_lines = []
+        for offset in range(min(self.updates_per_turn, len(CONSIDERATION_IDS))):
+            consideration_id = CONSIDERATION_IDS[(start + offset) % len(CONSIDERATION_IDS)]
+            update_lines.append(f"{consideration_id}: {_consideration_paragraph(consideration_id, turn)}")
+
+        return (
+            f"{reply}\n\n"
+            "=== CONSIDERATION UPDATES ===\n"
+            + "\n".join(update_lines) +
+            "\n=== END CONSIDERATION UPDATES ==="
+        )
+
+
+def _chunk_text(text, tokens):
+    """Split text into roughly `tokens` pieces, preserving whitespace"""
+    if tokens <= 1:
+        return [text]
+    size = max(1, math.ceil(len(text) / tokens))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(behavior):
+    """Create the fake server Flask app"""
+    app = Flask(__name__)
+
+    @app.route('/v1/models')
+    def list_models():
+        return jsonify({
+            "object": "list",
+            "data": [{"id": model, "object": "model", "owned_by": "fake"} for model in ("gpt-4o", "gpt-4o-mini")]
+        })
+
+    @app.route('/v1/stats')
+    def stats():
+        return jsonify(behavior.stats)
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        body = request.get_json(force=True, silent=True) or {}
+        messages = body.get('messages', [])
+        model = body.get('model', 'gpt-4o')
+        max_tokens = body.get('max_tokens') or body.get('max_completion_tokens')
+        stream = bool(body.get('stream'))
+
+        ttft = behavior.sample_latency()
+
+        if behavior.should_fail():
+            time.sleep(ttft)
+            status = behavior.error_status
+            error_type = "rate_limit_exceeded" if status == 429 else "server_error"
+            response = jsonify({"error": {"message": "Injected failure", "type": error_type, "code": error_type}})
+            response.status_code = status
+            if status == 429:
+                response.headers['Retry-After'] = '1'
+            return response
+
+        reply = behavior.build_reply(messages, body.get('response_format'))
+        completion_tokens = _estimate_tokens(reply)
+        finish_reason = "stop"
+        if max_tokens and completion_tokens > max_tokens:
+            reply = reply[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = "length"
+        prompt_tokens = sum(_estimate_tokens(m.get('content') or '') for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        per_token = 1.0 / behavior.tokens_per_second if behavior.tokens_per_second > 0 else 0.0
+
+        if not stream:
+            time.sleep(ttft + completion_tokens * per_token)
+            return jsonify({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+
+        with behavior._lock:
+            behavior.stats["streamed"] += 1
+        include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+
+        def generate():
+            def chunk(delta, finish=None):
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }) + "\n\n"
+
+            time.sleep(ttft)
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in _chunk_text(reply, completion_tokens):
+                yield chunk({"content": piece})
+                if per_token:
+                    time.sleep(per_token)
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype='text/event-stream')
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat-completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-dist', default='lognormal',
+                        choices=['fixed', 'uniform', 'normal', 'lognormal', 'exponential'],
+                        help="Distribution of time-to-first-token")
+    parser.add_argument('--latency-mean-ms', type=float, default=500.0)
+    parser.add_argument('--latency-stddev-ms', type=float, default=200.0)
+    parser.add_argument('--tokens-per-second', type=float, default=50.0,
+                        help="Simulated generation rate (0 disables the per-token delay)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=429, choices=[429, 500, 502, 503])
+    parser.add_argument('--updates-per-turn', type=int, default=3,
+                        help="Considerations updated by each canned reply")
+    parser.add_argument('--responses-file', help="JSON list of canned reply strings to cycle through")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible latency and errors")
+    args = parser.parse_args()
+
+    behavior = FakeLLMBehavior(
+        latency_dist=args.latency_dist,
+        latency_mean_ms=args.latency_mean_ms,
+        latency_stddev_ms=args.latency_stddev_ms,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        updates_per_turn=args.updates_per_turn,
+        responses_file=args.responses_file,
+        seed=args.seed,
+    )
+
+    logger.info(f"Fake OpenAI server on http://{args.host}:{args.port}/v1 "
+                f"(latency={args.latency_dist} mean={args.latency_mean_ms}ms, "
+                f"{args.tokens_per_second} tok/s, error_rate={args.error_rate})")
+    create_app(behavior).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
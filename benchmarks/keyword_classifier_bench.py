@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the consideration keyword classifier
+=======================================================
+
+Compares the compiled single-pass KeywordClassifier against the previous
+implementation of _generate_fallback_updates (lowercase the message, then
+eight separate `any(word in message_lower ...)` substring scans).
+
+The legacy scan stops at the first hit per consideration and returns no
+scores, so it stays cheap on long messages with the eight built-in lists;
+the scaling table shows how each approach grows as keyword sets get bigger.
+
+Also reports where the two disagree, which is mostly substring false
+positives of the old scan ("how" in "show", "tech" in "technique").
+
+Usage:
+    python benchmarks/keyword_classifier_bench.py --iterations 20000
+    python benchmarks/keyword_classifier_bench.py --config data/config.json --long
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_classifier import KeywordClassifier, DEFAULT_KEYWORDS  # noqa: E402
+
+SAMPLE_MESSAGES = [
+    "I have an idea for an app that helps small clinics manage patient records offline",
+    "Our target users are rural clinics with unreliable internet and one or two staff members",
+    "The solution syncs data when a connection is available and works fully offline otherwise",
+    "Competitors are mostly expensive hospital systems that assume constant connectivity",
+    "We could charge a low monthly subscription per clinic with a free tier for the smallest ones",
+    "Technically we need a local-first database, conflict resolution and strong encryption",
+    "The team needs a mobile developer, a backend engineer and someone with clinic operations experience",
+    "Growth would come through NGOs and regional health ministries that already work with these clinics",
+    "Can you show me what a typical onboarding flow would look like?",
+    "thanks, that makes sense",
+    "What is the biggest risk in this business model and how do we de-risk it before we hire anyone?",
+    "The problem is that existing tools ignore the users who most need them",
+]
+
+
+def legacy_match(message):
+    """The previous fallback matching: eight substring scans over the lowercased message"""
+    message_lower = message.lower()
+    matched = []
+    if any(word in message_lower for word in ['problem', 'issue', 'challenge']):
+        matched.append('problem_definition')
+    if any(word in message_lower for word in ['market', 'customer', 'user', 'target']):
+        matched.append('target_market')
+    if any(word in message_lower for word in ['solution', 'approach', 'how', 'method']):
+        matched.append('solution_approach')
+    if any(word in message_lower for word in ['competitor', 'competition', 'competitive']):
+        matched.append('competitive_analysis')
+    if any(word in message_lower for word in ['business', 'revenue', 'money', 'model']):
+        matched.append('business_model')
+    if any(word in message_lower for word in ['technical', 'technology', 'feasibility', 'tech']):
+        matched.append('technical_feasibility')
+    if any(word in message_lower for word in ['team', 'people', 'hire', 'role']):
+        matched.append('team_structure')
+    if any(word in message_lower for word in ['growth', 'scale', 'expand', 'strategy']):
+        matched.append('growth_strategy')
+    return matched
+
+
+def substring_scan(keyword_sets):
+    """The legacy approach generalised to arbitrary keyword sets (one `any()` scan per consideration)"""
+    def match(message):
+        message_lower = message.lower()
+        return [cid for cid, words in keyword_sets.items() if any(word in message_lower for word in words)]
+    return match
+
+
+def synthetic_keyword_sets(per_consideration):
+    """Pad each default keyword set with made-up words that never occur, to measure scaling"""
+    return {cid: words + [f"{cid[:4]}kw{i}" for i in range(per_consideration - len(words))]
+            for cid, words in DEFAULT_KEYWORDS.items()}
+
+
+def time_per_call(fn, messages, iterations):
+    """Mean microseconds per call over `iterations` passes of `messages`"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            fn(message)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(messages)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the consideration keyword classifier")
+    parser.add_argument("--iterations", type=int, default=5000, help="Passes over the sample messages")
+    parser.add_argument("--config", default=None,
+                        help="Config file with per-consideration keywords (default: legacy keyword sets)")
+    parser.add_argument("--long", action="store_true",
+                        help="Also benchmark long messages (samples joined into one paragraph)")
+    parser.add_argument("--scaling", default="4,32,128",
+                        help="Comma-separated keywords-per-consideration sizes for the scaling table")
+    args = parser.parse_args()
+
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            classifier = KeywordClassifier.from_config(json.load(f))
+    else:
+        classifier = KeywordClassifier(DEFAULT_KEYWORDS)
+
+    corpora = [("short", SAMPLE_MESSAGES)]
+    if args.long:
+        corpora.append(("long", [" ".join(SAMPLE_MESSAGES)] * 4))
+
+    print(f"{'corpus':<8} {'impl':<12} {'us/call':>10}")
+    for name, messages in corpora:
+        legacy_us = time_per_call(legacy_match, messages, args.iterations)
+        score_us = time_per_call(classifier.score, messages, args.iterations)
+        rank_us = time_per_call(classifier.rank, messages, args.iterations)
+        print(f"{name:<8} {'legacy':<12} {legacy_us:>10.2f}")
+        print(f"{name:<8} {'score':<12} {score_us:>10.2f}  ({legacy_us / score_us:.2f}x)")
+        print(f"{name:<8} {'rank':<12} {rank_us:>10.2f}  ({legacy_us / rank_us:.2f}x)")
+
+    print()
+    print("Scaling with keyword set size (short corpus):")
+    print(f"{'keywords':<10} {'substring':>10} {'classifier':>11}")
+    for size in [int(value) for value in args.scaling.split(",") if value]:
+        keyword_sets = synthetic_keyword_sets(size)
+        scan_us = time_per_call(substring_scan(keyword_sets), SAMPLE_MESSAGES, max(1, args.iterations // 5))
+        compiled = KeywordClassifier(keyword_sets)
+        score_us = time_per_call(compiled.score, SAMPLE_MESSAGES, max(1, args.iterations // 5))
+        print(f"{size * len(keyword_sets):<10} {scan_us:>10.2f} {score_us:>11.2f}")
+
+    print()
+    print("Disagreements (legacy substring scan vs word-boundary classifier):")
+    differences = 0
+    for message in SAMPLE_MESSAGES:
+        legacy = set(legacy_match(message))
+        scores = classifier.score(message)
+        if legacy != set(scores):
+            differences += 1
+            print(f"  {message[:70]!r}")
+            print(f"    legacy only:     {sorted(legacy - set(scores))}")
+            print(f"    classifier only: {sorted(set(scores) - legacy)}")
+    if not differences:
+        print("  none")
+
+
+if __name__ == "__main__":
+    main()
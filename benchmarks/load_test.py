@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Load generator for The Forge chat pipeline
+==========================================
+
+Drives N concurrent simulated ideators through the full flow:
+    GET /forge -> POST /api/chat (x turns) -> POST /api/submit_idea
+
+When the chat queue is enabled, queued turns are long-polled until done.
+
+Each ideator keeps its own cookie jar so it gets its own Flask session.
+At the end, throughput and p50/p95/p99 latency are reported per endpoint.
+
+Usage:
+    python benchmarks/fake_openai_server.py --port 8001 &
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://localhost:8001/v1 gunicorn -w 4 -b :5000 app:app &
+    python benchmarks/load_test.py --base-url http://localhost:5000 --users 20 --turns 4
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+SAMPLE_MESSAGES = [
+    "I have an idea for an app that helps small clinics manage patient records offline",
+    "Our target users are rural clinics with unreliable internet and one or two staff members",
+    "The solution syncs data when a connection is available and works fully offline otherwise",
+    "Competitors are mostly expensive hospital systems that assume constant connectivity",
+    "We could charge a low monthly subscription per clinic with a free tier for the smallest ones",
+    "Technically we need a local-first database, conflict resolution and strong encryption",
+    "The team needs a mobile developer, a backend engineer and someone with clinic operations experience",
+    "Growth would come through NGOs and regional health ministries that already work with these clinics",
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadStats:
+    """Thread-safe collection of per-endpoint latencies and outcomes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.status_counts = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, latency, status):
+        with self._lock:
+            self.latencies[endpoint].append(latency)
+            self.status_counts[endpoint][status] += 1
+            if status == 0 or status >= 400:
+                self.errors[endpoint] += 1
+
+    def summary(self, elapsed):
+        """Build a summary dictionary for all endpoints"""
+        with self._lock:
+            endpoints = {}
+            total_requests = 0
+            for endpoint, values in self.latencies.items():
+                ordered = sorted(values)
+                total_requests += len(ordered)
+                endpoints[endpoint] = {
+                    "requests": len(ordered),
+                    "errors": self.errors[endpoint],
+                    "throughput_rps": len(ordered) / elapsed if elapsed > 0 else 0.0,
+                    "mean_ms": 1000 * sum(ordered) / len(ordered),
+                    "p50_ms": 1000 * percentile(ordered, 50),
+                    "p95_ms": 1000 * percentile(ordered, 95),
+                    "p99_ms": 1000 * percentile(ordered, 99),
+                    "max_ms": 1000 * ordered[-1],
+                    "status_codes": dict(self.status_counts[endpoint]),
+                }
+        return {
+            "elapsed_seconds": elapsed,
+            "total_requests": total_requests,
+            "throughput_rps": total_requests / elapsed if elapsed > 0 else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+class SimulatedIdeator:
+    """One simulated user walking through the forge flow"""
+
+    def __init__(self, base_url, stats, turns, think_time, timeout, rng):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.turns = turns
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def _request(self, endpoint, method="GET", payload=None, path=None):
+        """Issue one timed request and return (status, parsed body or None)"""
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + (path or endpoint), data=data, headers=headers, method=method)
+
+        start = time.perf_counter()
+        status = 0
+        body = None
+        try:
+            with self.opener.open(req, timeout=self.timeout) as resp:
+                status = resp.status
+                raw = resp.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            raw = e.read()
+        except Exception:
+            raw = b''
+        latency = time.perf_counter() - start
+        self.stats.record(endpoint, latency, status)
+
+        if raw and endpoint.startswith('/api/'):
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                body = None
+        return status, body
+
+    def _think(self):
+        if self.think_time > 0:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+
+    def run(self):
+        status, _ = self._request('/forge')
+        if status != 200:
+            return
+
+        messages = list(SAMPLE_MESSAGES)
+        self.rng.shuffle(messages)
+        for turn in range(self.turns):
+            self._think()
+            turn_start = time.perf_counter()
+            status, body = self._request('/api/chat', method="POST", payload={'message': messages[turn % len(messages)]})
+
+            # Queue mode: long-poll until the turn completes and record end-to-end turn latency too
+            if status == 202 and body and body.get('result_url'):
+                while True:
+                    status, body = self._request('/api/chat/result', path=body['result_url'] + '?wait=25')
+                    if status != 202:
+                        break
+                self.stats.record('/api/chat [queued turn]', time.perf_counter() - turn_start, status)
+
+        self._think()
+        self._request('/api/submit_idea', method="POST", payload={})
+
+
+def print_report(summary):
+    """Print a human-readable latency table"""
+    print("\n" + "=" * 96)
+    print(f"Elapsed: {summary['elapsed_seconds']:.2f}s   "
+          f"Requests: {summary['total_requests']}   "
+          f"Throughput: {summary['throughput_rps']:.2f} req/s")
+    print("=" * 96)
+    print(f"{'endpoint':<20}{'reqs':>7}{'errors':>8}{'req/s':>9}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for endpoint, row in sorted(summary['endpoints'].items()):
+        print(f"{endpoint:<20}{row['requests']:>7}{row['errors']:>8}{row['throughput_rps']:>9.2f}"
+              f"{row['mean_ms']:>9.0f}ms{row['p50_ms']:>8.0f}ms{row['p95_ms']:>8.0f}ms"
+              f"{row['p99_ms']:>8.0f}ms{row['max_ms']:>8.0f}ms")
+        codes = ", ".join(f"{code}: {count}" for code, count in sorted(row['status_codes'].items()))
+        print(f"{'':<20}status codes -> {codes}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test The Forge chat pipeline")
+    parser.add_argument('--base-url', default='http://localhost:5000')
+    parser.add_argument('--users', type=int, default=10, help="Number of concurrent simulated ideators")
+    parser.add_argument('--turns', type=int, default=4, help="Chat turns per ideator before submitting")
+    parser.add_argument('--iterations', type=int, default=1, help="Flows each ideator runs back to back")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="Seconds over which to start all users")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Mean pause between requests (seconds)")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout (seconds)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json-out', help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    stats = LoadStats()
+
+    def user_loop(index):
+        rng = random.Random(args.seed + index)
+        if args.ramp_up > 0:
+            time.sleep(args.ramp_up * index / max(1, args.users))
+        for _ in range(args.iterations):
+            SimulatedIdeator(args.base_url, stats, args.turns, args.think_time, args.timeout, rng).run()
+
+    print(f"Starting {args.users} simulated ideators x {args.iterations} flow(s), "
+          f"{args.turns} chat turns each, against {args.base_url}")
+    threads = [threading.Thread(target=user_loop, args=(i,), daemon=True) for i in range(args.users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    summary = stats.summary(elapsed)
+    print_report(summary)
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.json_out}")
+
+    return 0 if summary['total_requests'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
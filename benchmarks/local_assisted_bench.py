@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Assisted (speculative) decoding benchmark for LocalLLMService
+=============================================================
+
+Generates the same single prompts with plain decoding and with a small draft
+model proposing tokens that the main model verifies in one forward pass. Both
+runs share one loaded main model. Reports the draft acceptance rate, tokens
+per main-model step and effective tokens per second. Run with
+CUDA_VISIBLE_DEVICES="" to measure on CPU. --check-stops instead checks that
+stop strings and role tags still end assisted generations.
+
+Usage:
+    CUDA_VISIBLE_DEVICES="" python benchmarks/local_assisted_bench.py --draft-model deepseek-ai/deepseek-coder-1.3b-instruct
+    CUDA_VISIBLE_DEVICES="" FORGE_CPU_INT8=1 python benchmarks/local_assisted_bench.py \\
+        --model /scratch/models/deepseek-coder-6.7b-instruct --draft-model /scratch/models/deepseek-coder-1.3b-instruct \\
+        --draft-tokens 4 --prompts 4 --max-new-tokens 64
+    CUDA_VISIBLE_DEVICES="" python benchmarks/local_assisted_bench.py --draft-model deepseek-ai/deepseek-coder-1.3b-instruct --check-stops
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch  # noqa: E402
+
+from HPC_cluster_experiments import LocalLLMService, CPUSettings, StopRules, StopStrings  # noqa: E402
+
+PROMPTS = [
+    "I have an idea for a mobile app that helps people find local restaurants",
+    "Who is the target market for an offline-first clinic records system?",
+    "How can I differentiate from apps like Yelp and Google Maps?",
+    "What technical challenges should I expect when syncing data offline?",
+]
+
+
+def run(service, prompts, max_new_tokens):
+    # Role tags off: both runs decode the same number of tokens per prompt
+    rules = StopRules(role_tags=False)
+    tokens = 0
+    start = time.perf_counter()
+    for i in range(prompts):
+        prompt = service._format_messages_for_deepseek([{"role": "user", "content": PROMPTS[i % len(PROMPTS)]}])
+        tokens += service._generate_batch([prompt], [max_new_tokens], [rules])[0][1]
+    seconds = time.perf_counter() - start
+    return tokens, seconds
+
+
+def check_stops(service):
+    """Fail unless role tags and stop strings end generation when steps check draft tokens first"""
+    tokenizer = service.tokenizer
+    encode = lambda text: tokenizer(text, add_special_tokens=False, return_tensors="pt")["input_ids"]
+    prompt = encode("### Instruction:\nhi\n### Response:\n")
+    accepted = torch.cat([prompt, encode("Sure, here is an idea")], dim=1)
+    draft = encode(" that drafts many more tokens than the stop string window covers before it is rejected" * 2)
+    corrected = encode(" <|user|>")
+
+    # The call pattern of transformers' assisted decoding: accepted step, draft tokens, accepted step
+    # with the main model's own token (a role tag) after the first matching draft token
+    criteria = StopStrings(tokenizer, prompt.shape[1], [StopRules()])
+    criteria(accepted, None)
+    criteria(torch.cat([accepted, draft], dim=1), None)
+    stopped = criteria(torch.cat([accepted, draft[:, :1], corrected], dim=1), None)
+    assert stopped.all(), "role tag after a rejected draft was not detected"
+
+    # End to end with the draft model: a stop on any lowercase letter ends generation within a step or two
+    rules = StopRules(stop=list("abcdefghijklmnopqrstuvwxyz"))
+    prompt_text = service._format_messages_for_deepseek([{"role": "user", "content": PROMPTS[0]}])
+    service.assisted_stats.reset()
+    service._generate_batch([prompt_text], [200], [rules])
+    generated = service.assisted_stats.summary()["tokens"]
+    assert generated < 200, f"assisted generation ran to max_new_tokens ({generated} tokens) past a stop string"
+    print(f"stop checks passed: role tag after a rejected draft detected, "
+          f"assisted generation stopped after {generated} tokens")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="deepseek-ai/deepseek-coder-6.7b-instruct")
+    parser.add_argument("--draft-model", required=True, help="Small model with the same tokenizer")
+    parser.add_argument("--draft-tokens", type=int, default=5)
+    parser.add_argument("--prompts", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--check-stops", action="store_true", help="Check stop handling instead of timing")
+    args = parser.parse_args()
+
+    service = LocalLLMService(args.model, kv_cache_max_mb=0, cpu=CPUSettings.from_env(), lazy_load=False,
+                              draft_model_name=args.draft_model, draft_tokens=args.draft_tokens)
+    draft_model = service.draft_model
+    if args.check_stops:
+        check_stops(service)
+        return
+
+    print(f"{args.prompts} prompts, {args.max_new_tokens} new tokens each, on {service.device}")
+    print(f"{'decoding':>9} {'tokens':>7} {'seconds':>8} {'tokens/s':>9} {'accepted':>9} {'tok/step':>9} {'speedup':>8}")
+    baseline = None
+    for label, draft in (("plain", None), ("assisted", draft_model)):
+        service.draft_model = draft
+        run(service, 1, 4)  # warm-up
+        service.assisted_stats.reset()
+        tokens, seconds = run(service, args.prompts, args.max_new_tokens)
+        throughput = tokens / seconds if seconds else 0.0
+        baseline = baseline or throughput
+        # Plain decoding is one token per main-model step by definition
+        assisted = service.assisted_stats.summary() if draft else {"acceptance_rate": 0.0, "tokens_per_step": 1.0}
+        print(f"{label:>9} {tokens:>7} {seconds:>8.2f} {throughput:>9.1f} {assisted['acceptance_rate']:>8.0%} "
+              f"{assisted['tokens_per_step']:>9.2f} {throughput / baseline if baseline else 0.0:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
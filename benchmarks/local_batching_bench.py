@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for dynamic batching in LocalLLMService
+============================================================
+
+Sends the same set of concurrent prompts through DynamicBatcher at several
+maximum batch sizes and reports generated tokens per second for each. Batch
+size 1 is the previous behaviour: every caller waits for its own generate()
+call to finish.
+
+Usage:
+    python benchmarks/local_batching_bench.py --batch-sizes 1,2,4,8 --requests 16
+    python benchmarks/local_batching_bench.py --model /scratch/models/deepseek-coder-6.7b-instruct --max-new-tokens 64
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HPC_cluster_experiments import LocalLLMService, DynamicBatcher  # noqa: E402
+
+PROMPTS = [
+    "I have an idea for a mobile app that helps people find local restaurants",
+    "Who is the target market for an offline-first clinic records system?",
+    "How can I differentiate from apps like Yelp and Google Maps?",
+    "What technical challenges should I expect when syncing data offline?",
+    "How should I structure the team for a two-sided marketplace?",
+    "What is a sensible business model for a developer tool?",
+    "How do I grow a B2B product without a sales team?",
+    "Which competitors should I worry about for AI meeting notes?",
+]
+
+
+def run(service, batch_size, window_ms, requests, max_new_tokens):
+    service.batcher = DynamicBatcher(service, batch_size, window_ms)
+    messages = [[{"role": "user", "content": PROMPTS[i % len(PROMPTS)]}] for i in range(requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        list(pool.map(lambda m: service._generate(m, max_new_tokens), messages))
+    elapsed = time.perf_counter() - start
+    stats = service.batcher.stats()
+    tokens = sum(entry["tokens"] for entry in stats.values())
+    batches = sum(entry["batches"] for entry in stats.values())
+    return tokens, batches, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="deepseek-ai/deepseek-coder-6.7b-instruct")
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=16, help="Concurrent prompts per run")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    service = LocalLLMService(args.model, lazy_load=False)
+    run(service, 1, args.window_ms, 1, 4)  # warm-up
+
+    print(f"{args.requests} concurrent prompts, {args.max_new_tokens} new tokens each")
+    print(f"{'max batch':>10} {'batches':>8} {'tokens':>8} {'seconds':>8} {'tokens/s':>9} {'speedup':>8}")
+    baseline = None
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        tokens, batches, elapsed = run(service, batch_size, args.window_ms, args.requests, args.max_new_tokens)
+        throughput = tokens / elapsed if elapsed else 0.0
+        baseline = baseline or throughput
+        print(f"{batch_size:>10} {batches:>8} {tokens:>8} {elapsed:>8.2f} {throughput:>9.1f} "
+              f"{throughput / baseline if baseline else 0.0:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark: int8 dynamic quantization against the fp32 baseline
+==================================================================
+
+Loads the model once per mode, each in its own process so resident memory is
+measured cleanly, then generates the same prompts and reports load time,
+resident memory after generation (weights are memory-mapped, so they only
+count once touched), peak memory and generated tokens per second. With
+--quantized-cache-dir a third run reloads the saved int8 model.
+
+Usage:
+    CUDA_VISIBLE_DEVICES="" python benchmarks/local_cpu_quant_bench.py --threads 16
+    CUDA_VISIBLE_DEVICES="" python benchmarks/local_cpu_quant_bench.py --model /scratch/models/deepseek-coder-6.7b-instruct \\
+        --numa-node 0 --quantized-cache-dir /tmp/forge-int8 --prompts 4 --max-new-tokens 32
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_diagnostics import current_rss_bytes  # noqa: E402
+
+PROMPTS = [
+    "I have an idea for a mobile app that helps people find local restaurants",
+    "Who is the target market for an offline-first clinic records system?",
+    "How can I differentiate from apps like Yelp and Google Maps?",
+    "What technical challenges should I expect when syncing data offline?",
+]
+
+
+def run_mode(args):
+    """Child process: load in one mode, generate, print a JSON result line"""
+    from HPC_cluster_experiments import LocalLLMService, CPUSettings, StopRules
+
+    cpu = CPUSettings(quantize_int8=args.mode == "int8", intra_op_threads=args.threads,
+                      inter_op_threads=args.interop_threads, numa_node=args.numa_node,
+                      quantized_cache_dir=args.quantized_cache_dir)
+    quantized_path = cpu.quantized_path(args.model) if cpu.quantize_int8 else None
+    cached = bool(quantized_path and os.path.exists(quantized_path))
+    start = time.perf_counter()
+    service = LocalLLMService(args.model, kv_cache_max_mb=0, cpu=cpu, lazy_load=False)
+    load_seconds = time.perf_counter() - start
+
+    # Role tags off and one prompt per call: every run decodes the same amount of work
+    rules = StopRules(role_tags=False)
+    service._generate_batch([service._format_messages_for_deepseek([{"role": "user", "content": "hi"}])], [4], [rules])
+    tokens = 0
+    start = time.perf_counter()
+    for i in range(args.prompts):
+        prompt = service._format_messages_for_deepseek([{"role": "user", "content": PROMPTS[i % len(PROMPTS)]}])
+        tokens += service._generate_batch([prompt], [args.max_new_tokens], [rules])[0][1]
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        "mode": args.mode + (" cache" if cached else ""),
+        "load_seconds": load_seconds,
+        "rss_mb": current_rss_bytes() / 2**20,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "tokens": tokens,
+        "tokens_per_second": tokens / seconds if seconds else 0.0,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="deepseek-ai/deepseek-coder-6.7b-instruct")
+    parser.add_argument("--prompts", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0: torch default)")
+    parser.add_argument("--interop-threads", type=int, default=0)
+    parser.add_argument("--numa-node", type=int, default=None)
+    parser.add_argument("--quantized-cache-dir", default=None, help="Save/reuse the int8 model here")
+    parser.add_argument("--mode", choices=["fp32", "int8"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    modes = ["fp32", "int8"] + (["int8"] if args.quantized_cache_dir else [])
+    results = []
+    for mode in modes:
+        command = [sys.executable, os.path.abspath(__file__), "--mode", mode] + sys.argv[1:]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    baseline = results[0]
+    print(f"{args.prompts} prompts, {args.max_new_tokens} new tokens each")
+    print(f"{'mode':>10} {'load s':>7} {'RSS MB':>8} {'peak MB':>8} {'tokens/s':>9} {'speedup':>8} {'memory':>7}")
+    for result in results:
+        print(f"{result['mode']:>10} {result['load_seconds']:>7.1f} {result['rss_mb']:>8.0f} "
+              f"{result['peak_rss_mb']:>8.0f} {result['tokens_per_second']:>9.1f} "
+              f"{result['tokens_per_second'] / baseline['tokens_per_second']:>7.2f}x "
+              f"{result['rss_mb'] / baseline['rss_mb']:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-token benchmark for the shared system-prompt prefix cache
+=======================================================================
+
+Builds real first-turn ASF prompts (static instructions, session context,
+user message) and times a one-token generation for each, once starting from
+the cached KV state of the static instructions and once prefilling the whole
+prompt. Run with CUDA_VISIBLE_DEVICES="" to measure on CPU.
+
+Usage:
+    CUDA_VISIBLE_DEVICES="" python benchmarks/local_prefix_cache_bench.py --requests 16
+    python benchmarks/local_prefix_cache_bench.py --model /scratch/models/deepseek-coder-6.7b-instruct --requests 8
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HPC_cluster_experiments import LocalLLMService, AgenticStartupFactory  # noqa: E402
+
+PROMPTS = [
+    "I have an idea for a mobile app that helps people find local restaurants",
+    "Who is the target market for an offline-first clinic records system?",
+    "How can I differentiate from apps like Yelp and Google Maps?",
+    "What technical challenges should I expect when syncing data offline?",
+    "How should I structure the team for a two-sided marketplace?",
+    "What is a sensible business model for a developer tool?",
+    "How do I grow a B2B product without a sales team?",
+    "Which competitors should I worry about for AI meeting notes?",
+]
+
+
+def time_to_first_token(service, factory, requests):
+    timings = []
+    for i in range(requests):
+        session = factory.get_session(factory.create_session())
+        messages = factory._build_messages(session, PROMPTS[i % len(PROMPTS)])
+        start = time.perf_counter()
+        service._generate(messages, 1)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="deepseek-ai/deepseek-coder-6.7b-instruct")
+    parser.add_argument("--requests", type=int, default=16, help="First-turn prompts per run")
+    args = parser.parse_args()
+
+    # No session cache, so every request starts from the prefix cache or from scratch
+    service = LocalLLMService(args.model, kv_cache_max_mb=0, lazy_load=False)
+    factory = AgenticStartupFactory(service)
+    prefix_cache = service.prefix_cache
+    time_to_first_token(service, factory, 2)  # warm-up
+    logging.getLogger().setLevel(logging.WARNING)  # one "Created new session" line per request otherwise
+
+    print(f"{args.requests} first-turn prompts on {service.device}, "
+          f"{prefix_cache.length}-token shared prefix")
+    print(f"{'prefix cache':>12} {'mean ms':>9} {'p50 ms':>8} {'max ms':>8} {'speedup':>8}")
+    baseline = None
+    for label, cache in (("off", None), ("on", prefix_cache)):
+        service.prefix_cache = cache
+        timings = time_to_first_token(service, factory, args.requests)
+        mean = statistics.mean(timings)
+        baseline = baseline or mean
+        print(f"{label:>12} {mean:>9.1f} {statistics.median(timings):>8.1f} {max(timings):>8.1f} "
+              f"{baseline / mean if mean else 0.0:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
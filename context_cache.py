@@ -0,0 +1,79 @@
+import logging
+import threading
+from collections import OrderedDict
+from metrics import CONTEXT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class ContextRenderCache:
+    """Memoizes the per-consideration lines of the ASF session context.
+
+    Entries are keyed by session id, then by consideration id. Each entry
+    holds a fingerprint of the inputs it was rendered from (title, content
+    and completion flag); a line is re-rendered only when its fingerprint
+    changes, every other line is reused as-is. Sessions are evicted least
+    recently used first once max_sessions is reached.
+    """
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build a cache from the "context_cache" config section, or None when disabled"""
+        if not settings.get('enabled', True):
+            return None
+        return cls(max_sessions=settings.get('max_sessions', 1000))
+
+    def lines_for(self, session_id):
+        """Cached entries of one session (consideration id -> (fingerprint, value)), marking it recently used"""
+        with self._lock:
+            lines = self._sessions.get(session_id)
+            if lines is None:
+                lines = {}
+                self._sessions[session_id] = lines
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            return lines
+
+    def get_or_render(self, lines, key, fingerprint, render):
+        """Return the cached value for key if its fingerprint matches, otherwise render and store it"""
+        entry = lines.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            with self._lock:
+                self.hits += 1
+            CONTEXT_CACHE_LOOKUPS.inc(result="hit")
+            return entry[1]
+        value = render()
+        lines[key] = (fingerprint, value)
+        with self._lock:
+            self.misses += 1
+        CONTEXT_CACHE_LOOKUPS.inc(result="miss")
+        return value
+
+    def invalidate(self, session_id):
+        """Drop everything cached for a session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        """Hit rate and size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
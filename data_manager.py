@@ -3,9 +3,9 @@ import json
 import logging
 from datetime import datetime, timedelta
 import uuid
+import fcntl
+from metrics import STORAGE_SECONDS
 
-# Configure detailed logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class DataManager:
@@ -14,6 +14,9 @@ class DataManager:
         self.ideas_dir = "data/ideas"
         self.users_dir = "data/users"
         self.comments_dir = "data/comments"
+        self.usage_sessions_dir = "data/usage/sessions"
+        self.usage_daily_dir = "data/usage/daily"
+        self.marketplace_versions_file = "data/marketplace_versions.json"
         self.config_file = "data/config.json"
         self._ensure_directories()
         self.config = self._load_config()
@@ -24,6 +27,8 @@ class DataManager:
         os.makedirs(self.ideas_dir, exist_ok=True)
         os.makedirs(self.users_dir, exist_ok=True)
         os.makedirs(self.comments_dir, exist_ok=True)
+        os.makedirs(self.usage_sessions_dir, exist_ok=True)
+        os.makedirs(self.usage_daily_dir, exist_ok=True)
     
     def _load_config(self):
         """Load configuration from config.json"""
@@ -52,25 +57,26 @@ class DataManager:
             }
         }
     
+    @STORAGE_SECONDS.timed(op="load_session")
     def load_session(self, session_id):
         """Load session data from file"""
-        logger.info(f"=== LOADING SESSION {session_id} ===")
+        logger.debug("=== LOADING SESSION %s ===", session_id)
         session_file = os.path.join(self.sessions_dir, f"{session_id}.json")
-        logger.info(f"Session file path: {session_file}")
+        logger.debug("Session file path: %s", session_file)
         
         if os.path.exists(session_file):
-            logger.info("Session file exists, loading...")
+            logger.debug("Session file exists, loading...")
             try:
                 with open(session_file, 'r') as f:
                     session_data = json.load(f)
-                logger.info(f"Session loaded successfully: {list(session_data.keys())}")
-                logger.info(f"Considerations: {list(session_data.get('considerations', {}).keys())}")
-                logger.info(f"Chat history length: {len(session_data.get('chat_history', []))}")
+                logger.debug("Session loaded successfully: %s", list(session_data.keys()))
+                logger.debug("Considerations: %s", list(session_data.get('considerations', {}).keys()))
+                logger.debug("Chat history length: %s", len(session_data.get('chat_history', [])))
                 return session_data
             except Exception as e:
                 logger.error(f"Error loading session {session_id}: {str(e)}")
         else:
-            logger.info("Session file does not exist, creating new session")
+            logger.debug("Session file does not exist, creating new session")
         
         # Return new session structure
         new_session = {
@@ -80,10 +86,11 @@ class DataManager:
             "chat_history": [],
             "last_updated": datetime.now().isoformat()
         }
-        logger.info(f"Created new session structure: {list(new_session.keys())}")
-        logger.info("=== SESSION LOADING END ===")
+        logger.debug("Created new session structure: %s", list(new_session.keys()))
+        logger.debug("=== SESSION LOADING END ===")
         return new_session
     
+    @STORAGE_SECONDS.timed(op="save_session")
     def save_session(self, session_id, session_data):
         """Save session data to file"""
         session_file = os.path.join(self.sessions_dir, f"{session_id}.json")
@@ -95,6 +102,7 @@ class DataManager:
         except Exception as e:
             logging.error(f"Error saving session {session_id}: {str(e)}")
     
+    @STORAGE_SECONDS.timed(op="add_message")
     def add_message(self, session_id, user_message, ai_response):
         """Add chat message to session"""
         session_data = self.load_session(session_id)
@@ -113,6 +121,7 @@ class DataManager:
         
         self.save_session(session_id, session_data)
     
+    @STORAGE_SECONDS.timed(op="update_consideration")
     def update_consideration(self, session_id, consideration_id, content):
         """Update consideration content with previous value storage and metadata placeholder"""
         session_data = self.load_session(session_id)
@@ -201,6 +210,7 @@ class DataManager:
             "can_submit": completed_count >= min_completed
         }
     
+    @STORAGE_SECONDS.timed(op="submit_to_marketplace")
     def submit_to_marketplace(self, session_id, session_data):
         """Submit idea to public marketplace"""
         idea_id = str(uuid.uuid4())
@@ -215,7 +225,8 @@ class DataManager:
             "review_until": (datetime.now() + timedelta(days=7)).isoformat(),
             "status": "under_review",
             "views": 0,
-            "comments": []
+            "comments": [],
+            "usage": self.get_session_usage(session_id)
         }
         
         idea_file = os.path.join(self.ideas_dir, f"{idea_id}.json")
@@ -223,11 +234,13 @@ class DataManager:
         try:
             with open(idea_file, 'w') as f:
                 json.dump(idea_data, f, indent=2)
+            self._bump_marketplace_version(idea_id)
             return idea_id
         except Exception as e:
             logging.error(f"Error submitting idea: {str(e)}")
             raise
     
+    @STORAGE_SECONDS.timed(op="get_public_ideas")
     def get_public_ideas(self):
         """Get all public ideas for marketplace"""
         ideas = []
@@ -260,14 +273,17 @@ class DataManager:
         ideas.sort(key=lambda x: x["submitted_at"], reverse=True)
         return ideas
     
-    def get_idea(self, idea_id):
-        """Get specific idea by ID"""
+    @STORAGE_SECONDS.timed(op="get_idea")
+    def get_idea(self, idea_id, count_view=True):
+        """Get specific idea by ID (counting a view unless count_view is False)"""
         idea_file = os.path.join(self.ideas_dir, f"{idea_id}.json")
         
         if os.path.exists(idea_file):
             try:
                 with open(idea_file, 'r') as f:
                     idea_data = json.load(f)
+                    if not count_view:
+                        return idea_data
                     
                     # Increment view count
                     idea_data["views"] = idea_data.get("views", 0) + 1
@@ -275,6 +291,7 @@ class DataManager:
                     # Save updated view count
                     with open(idea_file, 'w') as f:
                         json.dump(idea_data, f, indent=2)
+                    self._bump_views_version(idea_id)
                     
                     return idea_data
             except Exception as e:
@@ -282,6 +299,7 @@ class DataManager:
         
         return None
     
+    @STORAGE_SECONDS.timed(op="add_comment")
     def add_comment(self, idea_id, comment, author):
         """Add comment to an idea"""
         idea_file = os.path.join(self.ideas_dir, f"{idea_id}.json")
@@ -308,6 +326,7 @@ class DataManager:
             
             with open(idea_file, 'w') as f:
                 json.dump(idea_data, f, indent=2)
+            self._bump_marketplace_version(idea_id)
             
             return comment_id
             
@@ -315,6 +334,7 @@ class DataManager:
             logging.error(f"Error adding comment to idea {idea_id}: {str(e)}")
             raise
     
+    @STORAGE_SECONDS.timed(op="get_comments")
     def get_comments(self, idea_id):
         """Get comments for an idea"""
         idea_data = self.get_idea(idea_id)
@@ -322,6 +342,202 @@ class DataManager:
             return idea_data.get("comments", [])
         return []
     
+    def _scan_marketplace_versions(self):
+        """Initial versions for ideas that predate version tracking (version 1, modified at submission)"""
+        versions = {"version": 1, "updated_at": datetime.now().isoformat(), "ideas": {}}
+        for filename in os.listdir(self.ideas_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.ideas_dir, filename), 'r') as f:
+                    idea_data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Error scanning idea {filename}: {str(e)}")
+                continue
+            # Keyed like get_idea() looks ideas up: by file name
+            versions["ideas"][filename[:-len('.json')]] = {"version": 1,
+                                          "updated_at": idea_data.get("submitted_at", versions["updated_at"])}
+        return versions
+    
+    def _bump_marketplace_version(self, idea_id):
+        """Record that an idea's content or comments changed (also changes the marketplace listing)"""
+        now = datetime.now().isoformat()
+        
+        def bump(data):
+            data["version"] += 1
+            data["updated_at"] = now
+            entry = data["ideas"].setdefault(idea_id, {"version": 0})
+            entry["version"] += 1
+            entry["updated_at"] = now
+        
+        self._update_json_locked(self.marketplace_versions_file, self._versions_default(now), bump)
+    
+    def _bump_views_version(self, idea_id):
+        """Record that an idea's view count changed; the marketplace listing and the idea page both show it"""
+        now = datetime.now().isoformat()
+        
+        def bump(data):
+            data["views_version"] = data.get("views_version", 0) + 1
+            data["views_updated_at"] = now
+            entry = data["ideas"].get(idea_id)
+            if entry:
+                entry["views_updated_at"] = now
+        
+        self._update_json_locked(self.marketplace_versions_file, self._versions_default(now), bump)
+    
+    def _versions_default(self, now):
+        if os.path.exists(self.marketplace_versions_file):
+            return {"version": 0, "updated_at": now, "ideas": {}}
+        return self._scan_marketplace_versions()
+    
+    @STORAGE_SECONDS.timed(op="get_marketplace_versions")
+    def get_marketplace_versions(self):
+        """Marketplace and per-idea versions for HTTP validators (views have their own marketplace-wide version)"""
+        versions = self._read_json_locked(self.marketplace_versions_file)
+        if versions is None:
+            versions = self._scan_marketplace_versions()
+            self._update_json_locked(self.marketplace_versions_file, versions, lambda data: None)
+        return versions
+    
+    def _empty_usage_totals(self):
+        return {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "total_tokens": 0,
+            "cost_usd": 0.0,
+            "latency_seconds": 0.0
+        }
+    
+    def _add_usage(self, totals, call):
+        totals["calls"] += 1
+        for key in ("prompt_tokens", "completion_tokens", "cached_tokens", "total_tokens"):
+            totals[key] += call[key]
+        totals["cost_usd"] = round(totals["cost_usd"] + call["cost_usd"], 6)
+        totals["latency_seconds"] = round(totals["latency_seconds"] + call["latency_seconds"], 3)
+    
+    def _update_json_locked(self, path, default, update):
+        """Read-modify-write a JSON file under an exclusive lock (safe across gunicorn workers)"""
+        with open(path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            raw = f.read()
+            data = json.loads(raw) if raw.strip() else default
+            update(data)
+            f.seek(0)
+            f.truncate()
+            json.dump(data, f, indent=2)
+    
+    def _read_json_locked(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            raw = f.read()
+        return json.loads(raw) if raw.strip() else None
+    
+    def llm_call_cost(self, model, prompt_tokens, completion_tokens, cached_tokens=0):
+        """Cost in USD from the per-million-token prices in usage.pricing (unknown models cost 0)"""
+        prices = self.config.get('usage', {}).get('pricing', {}).get(model)
+        if not prices:
+            return 0.0
+        uncached = max(prompt_tokens - cached_tokens, 0)
+        return (uncached * prices.get('prompt', 0)
+                + cached_tokens * prices.get('cached_prompt', prices.get('prompt', 0))
+                + completion_tokens * prices.get('completion', 0)) / 1_000_000
+    
+    @STORAGE_SECONDS.timed(op="record_llm_usage")
+    def record_llm_usage(self, session_id, model, usage, latency):
+        """Add one LLM call's usage to the per-session and per-day (by model) totals"""
+        usage = usage or {}
+        prompt_tokens = usage.get('prompt_tokens') or 0
+        completion_tokens = usage.get('completion_tokens') or 0
+        cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+        call = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "total_tokens": usage.get('total_tokens') or prompt_tokens + completion_tokens,
+            "cost_usd": self.llm_call_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+            "latency_seconds": latency or 0.0
+        }
+        now = datetime.now()
+        
+        def update_totals(data):
+            self._add_usage(data["totals"], call)
+            self._add_usage(data["models"].setdefault(model, self._empty_usage_totals()), call)
+            data["last_call_at"] = now.isoformat()
+        
+        try:
+            if session_id:
+                self._update_json_locked(
+                    os.path.join(self.usage_sessions_dir, f"{session_id}.json"),
+                    {"session_id": session_id, "first_call_at": now.isoformat(),
+                     "totals": self._empty_usage_totals(), "models": {}},
+                    update_totals
+                )
+            day = now.strftime("%Y-%m-%d")
+            self._update_json_locked(
+                os.path.join(self.usage_daily_dir, f"{day}.json"),
+                {"date": day, "totals": self._empty_usage_totals(), "models": {}},
+                update_totals
+            )
+        except Exception as e:
+            logging.error(f"Error recording LLM usage for session {session_id}: {str(e)}")
+    
+    def get_session_usage(self, session_id):
+        """Usage totals for a session (zeros if it has made no LLM calls)"""
+        try:
+            usage = self._read_json_locked(os.path.join(self.usage_sessions_dir, f"{session_id}.json"))
+        except Exception as e:
+            logging.error(f"Error loading usage for session {session_id}: {str(e)}")
+            usage = None
+        return usage or {"session_id": session_id, "totals": self._empty_usage_totals(), "models": {}}
+    
+    def get_usage_report(self, days=7):
+        """Daily totals and per-model totals for the last `days` days"""
+        daily = []
+        models = {}
+        totals = self._empty_usage_totals()
+        today = datetime.now().date()
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+            try:
+                data = self._read_json_locked(os.path.join(self.usage_daily_dir, f"{day}.json"))
+            except Exception as e:
+                logging.error(f"Error loading usage for {day}: {str(e)}")
+                data = None
+            if not data:
+                continue
+            daily.append({"date": day, **data["totals"]})
+            for model, model_totals in data["models"].items():
+                merged = models.setdefault(model, self._empty_usage_totals())
+                for key in merged:
+                    merged[key] += model_totals.get(key, 0)
+            for key in totals:
+                totals[key] += data["totals"].get(key, 0)
+        for values in [totals] + list(models.values()):
+            values["cost_usd"] = round(values["cost_usd"], 6)
+            values["latency_seconds"] = round(values["latency_seconds"], 3)
+        return {"days": days, "totals": totals, "daily": daily, "models": models}
+    
+    def check_session_budget(self, session_id):
+        """Remaining budget for a session; exceeded=True once a token or cost limit is reached"""
+        limits = self.config.get('usage', {})
+        totals = self.get_session_usage(session_id)["totals"]
+        token_budget = limits.get('session_token_budget')
+        cost_budget = limits.get('session_cost_budget_usd')
+        exceeded = bool((token_budget and totals["total_tokens"] >= token_budget)
+                        or (cost_budget and totals["cost_usd"] >= cost_budget))
+        return {
+            "exceeded": exceeded,
+            "tokens_used": totals["total_tokens"],
+            "token_budget": token_budget,
+            "cost_usd": totals["cost_usd"],
+            "cost_budget_usd": cost_budget
+        }
+    
     def save_session_for_marketplace(self, session_id, session_data):
         """Save session data for potential marketplace integration"""
         try:
@@ -385,7 +601,7 @@ class DataManager:
         considerations = session_data.get("considerations", {})
         
         # Try to extract from problem definition
-        problem_def = considerations.get("problem_definition", "")
+        problem_def = self.get_consideration_content(considerations.get("problem_definition", "")) or ""
         if problem_def:
             # Take first sentence as title
             title = problem_def.split('.')[0].strip()
@@ -403,7 +619,7 @@ class DataManager:
         description_parts = []
         
         for key in ["problem_definition", "solution_approach", "target_market"]:
-            content = considerations.get(key, "").strip()
+            content = (self.get_consideration_content(considerations.get(key, "")) or "").strip()
             if content:
                 description_parts.append(content)
         
@@ -135,47 +135,140 @@ def create_config_file():
             {
                 "id": "problem_definition",
                 "title": "Problem Definition",
-                "description": "Clearly define the problem you're solving and why it matters"
+                "description": "Clearly define the problem you're solving and why it matters",
+                "keywords": ["problem", "issue", "challenge", "pain point"]
             },
             {
                 "id": "target_market",
                 "title": "Target Market",
-                "description": "Identify your ideal customers and market size"
+                "description": "Identify your ideal customers and market size",
+                "keywords": ["market", "customer", "user", "target", "audience"]
             },
             {
                 "id": "solution_approach",
                 "title": "Solution Approach",
-                "description": "Outline your proposed solution and its key features"
+                "description": "Outline your proposed solution and its key features",
+                "keywords": ["solution", "approach", "how", "method", "feature"]
             },
             {
                 "id": "competitive_analysis",
                 "title": "Competitive Analysis",
-                "description": "Analyze competitors and your competitive advantage"
+                "description": "Analyze competitors and your competitive advantage",
+                "keywords": ["competitor", "competition", "competitive", "alternative"]
             },
             {
                 "id": "business_model",
                 "title": "Business Model",
-                "description": "Define how you'll make money and serve customers"
+                "description": "Define how you'll make money and serve customers",
+                "keywords": ["business", "revenue", "money", "model", "pricing", "subscription"]
             },
             {
                 "id": "technical_feasibility",
                 "title": "Technical Feasibility",
-                "description": "Assess technical requirements and implementation challenges"
+                "description": "Assess technical requirements and implementation challenges",
+                "keywords": ["technical*", "technology", "feasibility", "tech", "infrastructure"]
             },
             {
                 "id": "team_structure",
                 "title": "Team Structure",
-                "description": "Define roles needed and team composition"
+                "description": "Define roles needed and team composition",
+                "keywords": ["team", "people", "hire", "role", "cofounder"]
             },
             {
                 "id": "growth_strategy",
                 "title": "Growth Strategy",
-                "description": "Plan for customer acquisition and business scaling"
+                "description": "Plan for customer acquisition and business scaling",
+                "keywords": ["growth", "scale", "expand", "strategy", "marketing"]
             }
         ],
         "submission_requirements": {
             "min_completed_considerations": 6,
             "min_words_per_consideration": 100
+        },
+        "chat_queue": {
+            "enabled": False,
+            "db_path": "data/jobs/chat_jobs.sqlite3",
+            "workers": 4,
+            "long_poll_seconds": 25,
+            "job_timeout_seconds": 300,
+            "result_ttl_seconds": 3600
+        },
+        "llm_limits": {
+            "rpm": 500,
+            "tpm": 30000,
+            "max_concurrent": 16,
+            "max_queue_depth": 200,
+            "max_wait_seconds": 20
+        },
+        "model_routing": {
+            "enabled": True,
+            "tiers": {
+                "ack": {"model": "gpt-4o-mini", "max_tokens": 200},
+                "question": {"model": "gpt-4o-mini", "max_tokens": 500},
+                "content": {"model": "gpt-4o", "max_tokens": 800}
+            }
+        },
+        "parallel_drafting": {
+            "enabled": False,
+            "max_workers": 16,
+            "max_considerations": 3,
+            "reply_max_tokens": 300,
+            "draft_max_tokens": 250
+        },
+        "context_cache": {
+            "enabled": True,
+            "max_sessions": 1000
+        },
+        "logging": {
+            "level": "INFO",
+            "format": "json",
+            "async": True,
+            "file": None,
+            "trace_sample_rate": 0.01,
+            "levels": {
+                "app": "DEBUG",
+                "openai_service": "DEBUG",
+                "data_manager": "DEBUG",
+                "werkzeug": "INFO"
+            }
+        },
+        "metrics": {
+            "enabled": True,
+            "multiprocess_dir": None,
+            "flush_interval_seconds": 5
+        },
+        "profiling": {
+            "enabled": True,
+            "secret_env": "PROFILE_SECRET",
+            "output_dir": "data/profiles",
+            "sample_interval_ms": 1,
+            "max_header_bytes": 4000
+        },
+        "usage": {
+            "session_token_budget": 200000,
+            "session_cost_budget_usd": 2.0,
+            "pricing": {
+                "gpt-4o": {"prompt": 2.5, "cached_prompt": 1.25, "completion": 10.0},
+                "gpt-4o-mini": {"prompt": 0.15, "cached_prompt": 0.075, "completion": 0.6}
+            }
+        },
+        "memory": {
+            "enabled": True,
+            "secret_env": "PROFILE_SECRET",
+            "sample_interval_seconds": 30,
+            "history_size": 240,
+            "max_rss_mb": 0,
+            "tracemalloc_frames": 0,
+            "max_snapshots": 5
+        },
+        "http_cache": {
+            "page_validators": True,
+            "fingerprint_static": True,
+            "static_max_age_seconds": 31536000
+        },
+        "fragment_cache": {
+            "enabled": True,
+            "max_entries": 2000
         }
     }
     
@@ -0,0 +1,68 @@
+import logging
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+from metrics import FRAGMENT_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """Pre-rendered HTML fragments of marketplace pages.
+
+    Entries are keyed by (kind, id) and stamped with the version of the data
+    they were rendered from: submitted idea bodies and marketplace cards never
+    change, comment lists are versioned by comment count. A fragment is
+    re-rendered only when its version changes, so each worker invalidates
+    precisely without coordinating with the others. Counters (views, comment
+    counts) stay outside the fragments and are rendered per request.
+    """
+
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build a cache from the "fragment_cache" config section, or None when disabled"""
+        if not settings.get('enabled', True):
+            return None
+        return cls(max_entries=settings.get('max_entries', 2000))
+
+    def get_or_render(self, kind, key, version, render):
+        """Cached HTML for (kind, key) if rendered from `version`, otherwise render() and store it"""
+        cache_key = (kind, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                FRAGMENT_CACHE_LOOKUPS.inc(kind=kind, result="hit")
+                return entry[1]
+        html = Markup(render())
+        with self._lock:
+            self._entries[cache_key] = (version, html)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self.misses += 1
+        FRAGMENT_CACHE_LOOKUPS.inc(kind=kind, result="miss")
+        return html
+
+    def stats(self):
+        """Hit rate and size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
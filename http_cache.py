@@ -0,0 +1,111 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, timezone
+from flask import Response, current_app, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+# One year: fingerprinted URLs change whenever the file does, so they can be cached forever
+IMMUTABLE_MAX_AGE = 31536000
+
+
+class StaticAssets:
+    """Content-hash fingerprinted URLs for everything under static/.
+
+    `url_for('static', filename='js/forge.js')` renders as
+    `/static/js/forge.<hash>.js`, served with `Cache-Control: public,
+    max-age=31536000, immutable`. A changed file gets a new URL, so browsers
+    and CDNs never need to revalidate. Unfingerprinted URLs are still served,
+    with Flask's default (revalidating) caching.
+    """
+
+    def __init__(self, static_folder, max_age=IMMUTABLE_MAX_AGE):
+        self.static_folder = static_folder
+        self.max_age = max_age
+        self.urls = {}
+        self.files = {}
+        self.last_modified = 0.0
+        self._build()
+        self.version = hashlib.sha1("\n".join(sorted(self.urls.values())).encode()).hexdigest()[:12]
+
+    def _build(self):
+        for root, _, filenames in os.walk(self.static_folder):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                relative = os.path.relpath(path, self.static_folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:10]
+                stem, ext = os.path.splitext(relative)
+                fingerprinted = f"{stem}.{digest}{ext}"
+                self.urls[relative] = fingerprinted
+                self.files[fingerprinted] = relative
+                self.last_modified = max(self.last_modified, os.path.getmtime(path))
+        logger.info(f"Fingerprinted {len(self.urls)} static assets")
+
+    def init_app(self, app):
+        app.url_defaults(self._fingerprint_url)
+        app.view_functions["static"] = self.send
+
+    def _fingerprint_url(self, endpoint, values):
+        if endpoint == "static" and values.get("filename") in self.urls:
+            values["filename"] = self.urls[values["filename"]]
+
+    def send(self, filename):
+        relative = self.files.get(filename)
+        if relative is None:
+            return current_app.send_static_file(filename)
+        response = send_from_directory(self.static_folder, relative, max_age=self.max_age)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+def template_version(template_folder):
+    """Hash and newest mtime of the templates, so page validators change on deploy"""
+    digest = hashlib.sha1()
+    newest = 0.0
+    for root, _, filenames in sorted(os.walk(template_folder)):
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            with open(path, "rb") as f:
+                digest.update(f.read())
+            newest = max(newest, os.path.getmtime(path))
+    return digest.hexdigest()[:12], newest
+
+
+def weak_etag(*parts):
+    """Opaque tag for a page built from the given version parts (weak: view counts may lag)"""
+    return hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:16]
+
+
+def http_datetime(value):
+    """A naive local ISO timestamp or epoch seconds as an aware UTC datetime (None stays None)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, timezone.utc).replace(microsecond=0)
+    return datetime.fromisoformat(value).astimezone(timezone.utc).replace(microsecond=0)
+
+
+def is_not_modified(request, etag, last_modified):
+    """Conditional GET check; If-None-Match takes precedence over If-Modified-Since (RFC 9110)"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    """Tag a page so clients revalidate it on every visit and get a 304 when it is unchanged"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified_response(etag, last_modified):
+    return set_validators(Response(status=304), etag, last_modified)
@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class ChatJobQueue:
+    """Persistent job queue for chat turns, backed by SQLite.
+
+    Jobs survive restarts and can be claimed by workers in any process
+    sharing the database file. Turns belonging to one session are run
+    strictly in enqueue order and never concurrently.
+
+    A claimed job holds a lease that its process renews while the handler
+    runs, so only jobs whose worker has died (or hung the whole process)
+    are re-queued, however long a turn takes.
+    """
+
+    def __init__(self, db_path, handler, workers=4, job_timeout_seconds=300, result_ttl_seconds=3600):
+        """
+        Args:
+            db_path: SQLite database file
+            handler: Callable(session_id, payload) -> JSON-serializable result
+            workers: Number of worker threads in this process
+            job_timeout_seconds: Lease on a running job; renewed while its worker is alive, re-queued once it lapses
+            result_ttl_seconds: Finished jobs are purged after this long
+        """
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.job_timeout_seconds = job_timeout_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._last_maintenance = 0.0
+        # job id -> claiming worker, for the jobs whose leases this process renews
+        self._active = {}
+        self._active_lock = threading.Lock()
+        self._heartbeat = None
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        """Create the jobs table if needed"""
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT UNIQUE NOT NULL,
+                    session_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    enqueued_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    lease_expires_at REAL
+                )
+            """)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_expires_at" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session_id, status)")
+        finally:
+            conn.close()
+
+    def enqueue(self, session_id, payload):
+        """Add a chat turn to the queue and return its job id"""
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, session_id, status, payload, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, session_id, QUEUED, json.dumps(payload), time.time())
+            )
+        finally:
+            conn.close()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Get job status and result, or None if unknown"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = {
+                "job_id": row["id"],
+                "session_id": row["session_id"],
+                "status": row["status"],
+                "enqueued_at": row["enqueued_at"],
+                "started_at": row["started_at"],
+                "finished_at": row["finished_at"],
+            }
+            if row["status"] == QUEUED:
+                job["position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND seq < ?", (QUEUED, row["seq"])
+                ).fetchone()[0]
+            if row["result"] is not None:
+                job["result"] = json.loads(row["result"])
+            if row["error"] is not None:
+                job["error"] = row["error"]
+            return job
+        finally:
+            conn.close()
+
+    def wait(self, job_id, timeout):
+        """Long-poll: block until the job finishes or timeout elapses, then return its state"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in (DONE, FAILED):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            # Local completions notify immediately; jobs finished by other processes are seen on the next poll
+            with self._finished:
+                self._finished.wait(min(remaining, 0.5))
+
+    def stats(self):
+        """Queue depth and latency metrics"""
+        conn = self._connect()
+        try:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+                counts[row["status"]] = row["n"]
+
+            oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            sessions_waiting = conn.execute(
+                "SELECT COUNT(DISTINCT session_id) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            recent = conn.execute(
+                "SELECT AVG(started_at - enqueued_at), AVG(finished_at - started_at) FROM jobs "
+                "WHERE status IN (?, ?) AND finished_at > ?",
+                (DONE, FAILED, time.time() - 300)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        return {
+            "queue_depth": counts[QUEUED],
+            "running": counts[RUNNING],
+            "done": counts[DONE],
+            "failed": counts[FAILED],
+            "sessions_waiting": sessions_waiting,
+            "oldest_queued_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "avg_wait_seconds_5m": round(recent[0], 3) if recent[0] is not None else None,
+            "avg_run_seconds_5m": round(recent[1], 3) if recent[1] is not None else None,
+            "local_workers": len(self._threads),
+        }
+
+    def _claim(self):
+        """Atomically claim the next runnable job, honouring per-session ordering"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("""
+                SELECT j.id, j.session_id, j.payload FROM jobs j
+                WHERE j.status = ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM jobs o
+                      WHERE o.session_id = j.session_id
+                        AND (o.status = ? OR (o.status = ? AND o.seq < j.seq))
+                  )
+                ORDER BY j.seq
+                LIMIT 1
+            """, (QUEUED, RUNNING, QUEUED)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            # One claim per worker thread, so a stale thread can never finish a job re-claimed elsewhere
+            worker = f"{self.worker_id}/{threading.current_thread().name}"
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, worker = ?, lease_expires_at = ? WHERE id = ?",
+                (RUNNING, now, worker, now + self.job_timeout_seconds, row["id"])
+            )
+            conn.execute("COMMIT")
+            with self._active_lock:
+                self._active[row["id"]] = worker
+            return row["id"], row["session_id"], json.loads(row["payload"])
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._active_lock:
+            worker = self._active.pop(job_id, None)
+        conn = self._connect()
+        try:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_expires_at = NULL "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(),
+                 job_id, RUNNING, worker)
+            ).rowcount
+        finally:
+            conn.close()
+
+        if not updated:
+            logger.warning(f"Chat job {job_id} lost its lease before finishing; result discarded")
+
+        with self._finished:
+            self._finished.notify_all()
+
+    def _maintenance(self):
+        """Re-queue orphaned jobs and purge old results (at most every 30 seconds)"""
+        now = time.time()
+        if now - self._last_maintenance < 30:
+            return
+        self._last_maintenance = now
+
+        conn = self._connect()
+        try:
+            # Jobs claimed before leases existed have none: fall back to their start time
+            requeued = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker = NULL, lease_expires_at = NULL "
+                "WHERE status = ? AND COALESCE(lease_expires_at, started_at + ?) < ?",
+                (QUEUED, RUNNING, self.job_timeout_seconds, now)
+            ).rowcount
+            purged = conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, now - self.result_ttl_seconds)
+            ).rowcount
+        finally:
+            conn.close()
+
+        if requeued:
+            logger.warning(f"Re-queued {requeued} orphaned chat jobs")
+        if purged:
+            logger.info(f"Purged {purged} finished chat jobs")
+
+    def _renew_leases(self):
+        """Extend the lease of every job this process is running"""
+        with self._active_lock:
+            active = list(self._active.items())
+        if not active:
+            return
+        conn = self._connect()
+        try:
+            for job_id, worker in active:
+                renewed = conn.execute(
+                    "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                    (time.time() + self.job_timeout_seconds, job_id, RUNNING, worker)
+                ).rowcount
+                if not renewed:
+                    logger.warning(f"Chat job {job_id} is no longer leased to {worker}")
+        finally:
+            conn.close()
+
+    def _heartbeat_loop(self):
+        # Three renewals per lease, so one slow or failed renewal does not let a lease lapse
+        while not self._stop.wait(self.job_timeout_seconds / 3):
+            try:
+                self._renew_leases()
+            except Exception as e:
+                logger.error(f"Chat job lease renewal failed: {str(e)}")
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                self._maintenance()
+                claimed = self._claim()
+            except Exception as e:
+                logger.error(f"Chat job queue error: {str(e)}")
+                claimed = None
+
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(0.5)
+                continue
+
+            job_id, session_id, payload = claimed
+            try:
+                result = self.handler(session_id, payload)
+                self._finish(job_id, DONE, result=result)
+            except Exception as e:
+                logger.error(f"Chat job {job_id} failed: {str(e)}", exc_info=True)
+                self._finish(job_id, FAILED, error=str(e))
+
+    def start(self):
+        """Start the worker pool"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"chat-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="chat-job-heartbeat", daemon=True)
+        self._heartbeat.start()
+        logger.info(f"Chat job queue started with {self.workers} workers ({self.db_path})")
+
+    def stop(self, timeout=5):
+        """Stop the worker pool after in-flight jobs finish"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._heartbeat:
+            self._heartbeat.join(timeout)
+            self._heartbeat = None
@@ -0,0 +1,129 @@
+import re
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Used when data/config.json does not define "keywords" for a consideration
+DEFAULT_KEYWORDS = {
+    'problem_definition': ['problem', 'issue', 'challenge'],
+    'target_market': ['market', 'customer', 'user', 'target'],
+    'solution_approach': ['solution', 'approach', 'how', 'method'],
+    'competitive_analysis': ['competitor', 'competition', 'competitive'],
+    'business_model': ['business', 'revenue', 'money', 'model'],
+    'technical_feasibility': ['technical', 'technology', 'feasibility', 'tech'],
+    'team_structure': ['team', 'people', 'hire', 'role'],
+    'growth_strategy': ['growth', 'scale', 'expand', 'strategy']
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class KeywordClassifier:
+    """Maps a message to considerations by keyword, scanning it once.
+
+    Keywords match whole words only, so "how" no longer matches "show".
+    Plain keywords also match their plural ("customer" matches "customers"),
+    a trailing "*" makes a prefix match ("compet*" matches "competitors"),
+    and multi-word keywords ("pain point") match consecutive words.
+
+    All keyword sets are compiled once at startup: single words into a hash
+    table intersected with the message's word counts, phrases and prefixes
+    into one regex each, so the cost barely grows with the number of keywords.
+    """
+
+    def __init__(self, keyword_sets):
+        """
+        Args:
+            keyword_sets: Ordered mapping of consideration id -> list of keywords
+        """
+        self.consideration_ids = list(keyword_sets.keys())
+        self._order = {cid: i for i, cid in enumerate(self.consideration_ids)}
+        # word (and its plurals) -> consideration ids
+        self._words = {}
+        # phrase / prefix -> consideration ids, each matched by one combined regex
+        self._phrases = {}
+        self._prefixes = {}
+
+        count = 0
+        for consideration_id, keywords in keyword_sets.items():
+            for keyword in keywords:
+                words = _TOKEN_RE.findall(keyword.strip().lower())
+                if not words:
+                    continue
+                count += 1
+                if keyword.strip().endswith('*') and len(words) == 1:
+                    self._add(self._prefixes, words[0], consideration_id)
+                elif len(words) == 1:
+                    for form in (words[0], words[0] + 's', words[0] + 'es'):
+                        self._add(self._words, form, consideration_id)
+                else:
+                    self._add(self._phrases, " ".join(words), consideration_id)
+
+        # Phrases are matched against the space-joined tokens, so any whitespace or
+        # punctuation between words is accepted; the last word may be plural
+        self._phrase_re = self._compile(r"\b(%s)(?:e?s)?\b", self._phrases)
+        self._prefix_re = self._compile(r"\b(%s)[a-z0-9]*", self._prefixes)
+        self._phrase_starts = {phrase.split()[0] for phrase in self._phrases}
+        logger.info(f"Compiled keyword classifier: {count} keywords across {len(self.consideration_ids)} considerations")
+
+    @staticmethod
+    def _add(table, key, consideration_id):
+        owners = table.setdefault(key, [])
+        if consideration_id not in owners:
+            owners.append(consideration_id)
+
+    @staticmethod
+    def _compile(template, table):
+        if not table:
+            return None
+        # Longest first so "pain point" wins over "pain"
+        alternatives = sorted(table, key=len, reverse=True)
+        return re.compile(template % "|".join(re.escape(item) for item in alternatives))
+
+    @classmethod
+    def from_config(cls, config):
+        """Compile keyword sets from the considerations in data/config.json"""
+        keyword_sets = {}
+        for cat in config.get('considerations', []):
+            keywords = cat.get('keywords')
+            if keywords is None:
+                keywords = DEFAULT_KEYWORDS.get(cat['id'], [])
+            keyword_sets[cat['id']] = keywords
+        if not keyword_sets:
+            keyword_sets = dict(DEFAULT_KEYWORDS)
+        return cls(keyword_sets)
+
+    def score(self, text):
+        """Keyword hit counts per consideration (only considerations with hits are included)"""
+        scores = {}
+        if not text:
+            return scores
+
+        lowered = text.lower()
+        tokens = _TOKEN_RE.findall(lowered)
+        counts = Counter(tokens)
+
+        # Whole words: one set intersection against every configured keyword
+        for word in counts.keys() & self._words.keys():
+            for consideration_id in self._words[word]:
+                scores[consideration_id] = scores.get(consideration_id, 0) + counts[word]
+
+        if self._phrase_re is not None and not self._phrase_starts.isdisjoint(counts):
+            for phrase in self._phrase_re.findall(" ".join(tokens)):
+                for consideration_id in self._phrases[phrase]:
+                    scores[consideration_id] = scores.get(consideration_id, 0) + 1
+
+        if self._prefix_re is not None:
+            for prefix in self._prefix_re.findall(lowered):
+                for consideration_id in self._prefixes[prefix]:
+                    scores[consideration_id] = scores.get(consideration_id, 0) + 1
+        return scores
+
+    def rank(self, text):
+        """Matched consideration ids, highest score first, ties in configured order"""
+        return self.order(self.score(text))
+
+    def order(self, scores):
+        """Consideration ids of already computed scores, highest first, ties in configured order"""
+        return sorted(scores, key=lambda cid: (-scores[cid], self._order.get(cid, len(self._order))))
@@ -0,0 +1,132 @@
+import os
+import json
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMissError(KeyError):
+    """Raised in replay mode when a request was never recorded"""
+
+
+class LLMCassette:
+    """Record/replay store for LLM request/response pairs.
+
+    Cassettes are gzip-compressed JSON lines, one entry per call:
+    {"key": <request hash>, "latency": <seconds>, "response": {...}}.
+    Only the request hash is stored, which keeps cassettes small.
+    Identical requests are replayed in the order they were recorded.
+    """
+
+    def __init__(self, path, mode, replay_latency=False, latency_scale=1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries = defaultdict(deque)
+        self._last_entry = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+        if mode == REPLAY:
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @classmethod
+    def from_env(cls, default_path):
+        """Build a cassette from LLM_CASSETTE_* environment variables, or None if disabled"""
+        mode = os.environ.get("LLM_CASSETTE_MODE", "").strip().lower()
+        if not mode:
+            return None
+        path = os.environ.get("LLM_CASSETTE_PATH", default_path)
+        replay_latency = os.environ.get("LLM_CASSETTE_REPLAY_LATENCY", "0").lower() in ("1", "true", "yes")
+        latency_scale = float(os.environ.get("LLM_CASSETTE_LATENCY_SCALE", "1.0"))
+        return cls(path, mode, replay_latency=replay_latency, latency_scale=latency_scale)
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    @property
+    def recording(self):
+        return self.mode == RECORD
+
+    @staticmethod
+    def request_key(request):
+        """Stable hash of a request payload"""
+        canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """Load all entries from the cassette file"""
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette not found: {self.path}")
+
+        count = 0
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                self._entries[entry["key"]].append(entry)
+                count += 1
+        logger.info("Loaded %d cassette entries from %s", count, self.path)
+
+    def record(self, request, response, latency):
+        """Append a request/response pair to the cassette"""
+        entry = {
+            "key": self.request_key(request),
+            "latency": round(latency, 4),
+            "response": response,
+        }
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+        with self._lock:
+            # Each append is its own gzip member; gzip readers concatenate members transparently
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            self.stats["recorded"] += 1
+
+    def replay(self, request):
+        """Return the recorded response for a request, optionally reproducing its latency"""
+        key = self.request_key(request)
+        with self._lock:
+            queue = self._entries.get(key)
+            if queue:
+                entry = queue.popleft()
+                self._last_entry[key] = entry
+            else:
+                # Recorded responses for this key are exhausted: repeat the last one
+                entry = self._last_entry.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                raise CassetteMissError(f"No cassette entry for request {key[:12]}")
+            self.stats["replayed"] += 1
+
+        if self.replay_latency and entry.get("latency"):
+            time.sleep(entry["latency"] * self.latency_scale)
+        return entry["response"]
+
+    def call(self, request, fn):
+        """Serve a request from the cassette, or run fn() and record its result.
+
+        fn must return a JSON-serializable response.
+        """
+        if self.replaying:
+            return self.replay(request)
+
+        start = time.perf_counter()
+        response = fn()
+        self.record(request, response, time.perf_counter() - start)
+        return response
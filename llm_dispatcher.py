@@ -0,0 +1,239 @@
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class LLMBackpressureError(Exception):
+    """Raised when an LLM call cannot be admitted; routes turn this into a 429"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding up to one minute of budget"""
+
+    def __init__(self, rate_per_minute):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+        self.updated = now
+
+    def time_until(self, amount, now):
+        """Seconds until `amount` can be consumed (0 if available now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second
+
+    def consume(self, amount):
+        self.tokens -= amount
+
+    def adjust(self, delta):
+        """Correct a previous consumption once the real cost is known"""
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class _Ticket:
+    __slots__ = ("priority", "session_key", "tokens", "deadline", "enqueued_at", "granted")
+
+    def __init__(self, priority, session_key, tokens, deadline):
+        self.priority = priority
+        self.session_key = session_key
+        self.tokens = tokens
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class LLMDispatcher:
+    """Process-wide scheduler for outbound LLM calls.
+
+    - Priority classes: interactive calls are always dispatched before background ones
+    - Fair queueing: within a class, sessions are served round-robin, so one busy
+      session cannot starve the others
+    - Token buckets enforce the configured requests/minute and tokens/minute limits
+    - Backpressure: calls are rejected with LLMBackpressureError (and a Retry-After hint)
+      when the queue is full or the expected wait exceeds max_wait_seconds
+    """
+
+    def __init__(self, rpm=500, tpm=30000, max_concurrent=16, max_queue_depth=200, max_wait_seconds=20.0):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_concurrent = max_concurrent
+        self.max_queue_depth = max_queue_depth
+        self.max_wait_seconds = max_wait_seconds
+
+        self._cond = threading.Condition()
+        # priority -> OrderedDict(session_key -> deque of tickets); order is the round-robin rotation
+        self._queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._depth = 0
+        self._queued_tokens = 0
+        self._in_flight = 0
+        self.stats_counters = {
+            "dispatched": {INTERACTIVE: 0, BACKGROUND: 0},
+            "rejected": {INTERACTIVE: 0, BACKGROUND: 0},
+            "timed_out": {INTERACTIVE: 0, BACKGROUND: 0},
+            "wait_seconds_total": {INTERACTIVE: 0.0, BACKGROUND: 0.0},
+        }
+
+    @classmethod
+    def from_config(cls, limits):
+        """Build a dispatcher from the "llm_limits" config section"""
+        return cls(
+            rpm=limits.get('rpm', 500),
+            tpm=limits.get('tpm', 30000),
+            max_concurrent=limits.get('max_concurrent', 16),
+            max_queue_depth=limits.get('max_queue_depth', 200),
+            max_wait_seconds=limits.get('max_wait_seconds', 20)
+        )
+
+    def _head(self):
+        """The next ticket to dispatch under priority + round-robin ordering"""
+        for priority in (INTERACTIVE, BACKGROUND):
+            sessions = self._queues[priority]
+            if sessions:
+                return sessions[next(iter(sessions))][0]
+        return None
+
+    def _estimated_wait(self, extra_tokens):
+        """Rough time until the buckets could cover everything queued plus a new call"""
+        now = time.monotonic()
+        waits = [0.0]
+        for bucket, demand in ((self.request_bucket, self._depth + 1),
+                               (self.token_bucket, self._queued_tokens + extra_tokens)):
+            if bucket:
+                bucket.time_until(0, now)  # refill to the current time
+                waits.append(max(0.0, demand - bucket.tokens) / bucket.rate_per_second)
+        return max(waits)
+
+    def _remove(self, ticket):
+        sessions = self._queues[ticket.priority]
+        queue = sessions[ticket.session_key]
+        queue.remove(ticket)
+        if not queue:
+            del sessions[ticket.session_key]
+        self._depth -= 1
+        self._queued_tokens -= ticket.tokens
+
+    def _grant(self, ticket):
+        """Dispatch the head ticket and rotate its session to the back"""
+        sessions = self._queues[ticket.priority]
+        queue = sessions[ticket.session_key]
+        queue.popleft()
+        if queue:
+            sessions.move_to_end(ticket.session_key)
+        else:
+            del sessions[ticket.session_key]
+        self._depth -= 1
+        self._queued_tokens -= ticket.tokens
+        self._in_flight += 1
+        ticket.granted = True
+
+        if self.request_bucket:
+            self.request_bucket.consume(1)
+        if self.token_bucket:
+            self.token_bucket.consume(ticket.tokens)
+
+        waited = time.monotonic() - ticket.enqueued_at
+        self.stats_counters["dispatched"][ticket.priority] += 1
+        self.stats_counters["wait_seconds_total"][ticket.priority] += waited
+
+    def acquire(self, priority=INTERACTIVE, session_id=None, estimated_tokens=1000):
+        """Block until the call may proceed; returns a ticket for release()"""
+        with self._cond:
+            estimate = self._estimated_wait(estimated_tokens)
+            if self._depth >= self.max_queue_depth or estimate > self.max_wait_seconds:
+                self.stats_counters["rejected"][priority] += 1
+                raise LLMBackpressureError("LLM capacity exhausted, please retry shortly", estimate)
+
+            ticket = _Ticket(priority, session_id or "anonymous", estimated_tokens,
+                             time.monotonic() + self.max_wait_seconds)
+            self._queues[priority].setdefault(ticket.session_key, deque()).append(ticket)
+            self._depth += 1
+            self._queued_tokens += estimated_tokens
+
+            while True:
+                now = time.monotonic()
+                if now >= ticket.deadline:
+                    self._remove(ticket)
+                    self.stats_counters["timed_out"][priority] += 1
+                    self._cond.notify_all()
+                    raise LLMBackpressureError("Timed out waiting for LLM capacity", self._estimated_wait(0))
+
+                wait = ticket.deadline - now
+                if self._head() is ticket and self._in_flight < self.max_concurrent:
+                    bucket_wait = 0.0
+                    if self.request_bucket:
+                        bucket_wait = max(bucket_wait, self.request_bucket.time_until(1, now))
+                    if self.token_bucket:
+                        bucket_wait = max(bucket_wait, self.token_bucket.time_until(ticket.tokens, now))
+                    if bucket_wait == 0.0:
+                        self._grant(ticket)
+                        self._cond.notify_all()
+                        return ticket
+                    wait = min(wait, bucket_wait)
+
+                self._cond.wait(wait)
+
+    def release(self, ticket, actual_tokens=None):
+        """Finish a call, correcting the token budget with the real usage if known"""
+        with self._cond:
+            self._in_flight -= 1
+            if actual_tokens is not None and self.token_bucket:
+                self.token_bucket.adjust(actual_tokens - ticket.tokens)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, session_id=None, estimated_tokens=1000):
+        """Context manager around acquire/release; set usage['total_tokens'] on the yielded dict"""
+        ticket = self.acquire(priority, session_id, estimated_tokens)
+        usage = {}
+        try:
+            yield usage
+        finally:
+            self.release(ticket, usage.get('total_tokens'))
+
+    def stats(self):
+        """Queue depth, limits and per-class counters"""
+        with self._cond:
+            now = time.monotonic()
+            for bucket in (self.request_bucket, self.token_bucket):
+                if bucket:
+                    bucket.time_until(0, now)  # refill to the current time
+            per_class = {}
+            for priority, name in PRIORITY_NAMES.items():
+                dispatched = self.stats_counters["dispatched"][priority]
+                per_class[name] = {
+                    "queued": sum(len(q) for q in self._queues[priority].values()),
+                    "sessions_queued": len(self._queues[priority]),
+                    "dispatched": dispatched,
+                    "rejected": self.stats_counters["rejected"][priority],
+                    "timed_out": self.stats_counters["timed_out"][priority],
+                    "avg_wait_seconds": (self.stats_counters["wait_seconds_total"][priority] / dispatched
+                                         if dispatched else 0.0),
+                }
+            return {
+                "queue_depth": self._depth,
+                "in_flight": self._in_flight,
+                "max_concurrent": self.max_concurrent,
+                "requests_available": round(self.request_bucket.tokens, 1) if self.request_bucket else None,
+                "tokens_available": round(self.token_bucket.tokens) if self.token_bucket else None,
+                "classes": per_class,
+            }
@@ -0,0 +1,187 @@
+import os
+import sys
+import copy
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+import contextvars
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+# (trace id, sampled) for the request or chat turn running in this context
+_current_trace = contextvars.ContextVar("log_trace", default=None)
+_trace_sample_rate = 0.0
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, trace id and any `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TraceSamplingFilter(logging.Filter):
+    """Tags records with the current trace id and drops DEBUG records of unsampled traces.
+
+    DEBUG is where the per-turn pipeline trace lives; with trace_sample_rate=0.01 one
+    turn in a hundred is logged in full and the rest only at INFO and above.
+    Records emitted outside any trace (startup, background threads) are not sampled.
+    Handler.handle() runs filters on the calling thread, before the queue handler
+    enqueues the record, so the trace read here is the caller's.
+    """
+
+    def filter(self, record):
+        trace = _current_trace.get()
+        if trace is None:
+            return True
+        record.trace_id = trace[0]
+        return record.levelno > logging.DEBUG or trace[1]
+
+
+def _gate_debug(logger):
+    """Reject DEBUG calls on `logger` up front in unsampled traces.
+
+    The filter only runs after a LogRecord has been built (caller lookup included),
+    which costs ~10us per call; checking the trace before the level keeps a skipped
+    debug line under a microsecond. The check is an instance attribute, so the
+    logger stays a plain logging.Logger.
+    """
+    if "isEnabledFor" in vars(logger):
+        return
+    enabled_for = logger.isEnabledFor
+
+    def isEnabledFor(level):
+        if level <= logging.DEBUG:
+            trace = _current_trace.get()
+            if trace is not None and not trace[1]:
+                return False
+        return enabled_for(level)
+
+    logger.isEnabledFor = isEnabledFor
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() runs the full formatter on the calling thread; here only
+    the message is merged (args may be mutated after the call) and the traceback
+    rendered, so JSON encoding and I/O happen off the request path.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def begin_trace(sample_rate=None):
+    """Start a log trace for the current request or chat turn; returns a token for end_trace()"""
+    rate = _trace_sample_rate if sample_rate is None else sample_rate
+    return _current_trace.set((uuid.uuid4().hex[:12], rate > 0 and random.random() < rate))
+
+
+def end_trace(token):
+    if token is not None:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def log_trace():
+    """Run a block under its own trace, unless one is already active (e.g. the enclosing request)"""
+    token = begin_trace() if _current_trace.get() is None else None
+    try:
+        yield
+    finally:
+        end_trace(token)
+
+
+def configure_logging(settings=None):
+    """Set up logging from the "logging" config section.
+
+    Records go through a queue to a background listener thread that formats them
+    (JSON or text) and writes them to stderr or `file`. `levels` sets per-logger
+    levels ("" is the root logger). LOG_LEVEL and LOG_FORMAT override the config.
+    """
+    global _listener, _trace_sample_rate
+    settings = settings or {}
+
+    level = os.environ.get("LOG_LEVEL", settings.get("level", "INFO")).upper()
+    log_format = os.environ.get("LOG_FORMAT", settings.get("format", "json")).lower()
+    _trace_sample_rate = float(settings.get("trace_sample_rate", 0.0))
+
+    if settings.get("file"):
+        os.makedirs(os.path.dirname(settings["file"]) or ".", exist_ok=True)
+        output = logging.FileHandler(settings["file"], encoding="utf-8")
+    else:
+        output = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    if settings.get("async", True):
+        log_queue = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+    else:
+        handler = output
+    handler.addFilter(TraceSamplingFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, logger_level in settings.get("levels", {}).items():
+        logging.getLogger(name or None).setLevel(logger_level.upper())
+
+    # Loggers created after this call still sample through the filter, only without the fast path
+    for existing_logger in [root] + list(logging.Logger.manager.loggerDict.values()):
+        if isinstance(existing_logger, logging.Logger):
+            _gate_debug(existing_logger)
+
+
+def shutdown_logging():
+    """Flush queued records (registered at exit)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Memory diagnostics for long-lived workers: RSS history, tracemalloc allocation
+sites and snapshot diffs, per-session object sizes and a memory ceiling that
+gracefully recycles the worker.
+
+As a CLI it queries a running server's /api/debug/memory endpoint:
+
+    PROFILE_SECRET=... python memory_diagnostics.py report --url http://localhost:5000
+    PROFILE_SECRET=... python memory_diagnostics.py snapshot --url http://localhost:5000
+    PROFILE_SECRET=... python memory_diagnostics.py diff <snapshot id> --url http://localhost:5000
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import itertools
+import threading
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes():
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate size in bytes of an object and everything it references (each object counted once)"""
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+        elif hasattr(item, "__slots__"):
+            stack.extend(getattr(item, name) for name in item.__slots__ if hasattr(item, name))
+    return total
+
+
+def _format_bytes(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024 or unit == "GiB":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024.0
+
+
+def _stat_to_dict(stat, diff=False):
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    entry = {"site": frames[0] if frames else "?", "size_bytes": stat.size, "count": stat.count}
+    if len(frames) > 1:
+        entry["traceback"] = frames
+    if diff:
+        entry["size_diff_bytes"] = stat.size_diff
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+class MemoryMonitor:
+    """Tracks the memory footprint of one worker process.
+
+    A background thread samples RSS every `sample_interval` seconds into a
+    bounded history. When RSS crosses `max_rss_mb` the top allocation sites
+    are logged and the worker is recycled: under gunicorn it sends itself
+    SIGTERM, so it finishes its in-flight requests and the arbiter starts a
+    fresh worker. tracemalloc (off by default, it slows allocations down) can
+    be enabled in the config, with PYTHONTRACEMALLOC, or on demand by taking
+    a snapshot. Session stores register themselves so their per-session sizes
+    show up in reports.
+    """
+
+    def __init__(self, sample_interval=30.0, history_size=240, max_rss_mb=0, trace_frames=0,
+                 max_snapshots=5, recycle=None):
+        self.sample_interval = sample_interval
+        self.history = deque(maxlen=history_size)
+        self.max_rss_bytes = int(max_rss_mb * 1024 * 1024)
+        self.trace_frames = trace_frames
+        self.max_snapshots = max_snapshots
+        self.recycle = recycle or self._recycle_worker
+        self.recycling = False
+        self._session_stores = {}
+        self._snapshots = {}
+        self._snapshot_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if trace_frames and not tracemalloc.is_tracing():
+            tracemalloc.start(trace_frames)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build a monitor from the "memory" config section, or None when disabled"""
+        if not settings.get('enabled', True):
+            return None
+        return cls(sample_interval=settings.get('sample_interval_seconds', 30),
+                   history_size=settings.get('history_size', 240),
+                   max_rss_mb=settings.get('max_rss_mb', 0),
+                   trace_frames=settings.get('tracemalloc_frames', 0),
+                   max_snapshots=settings.get('max_snapshots', 5))
+
+    def register_sessions(self, name, get_sessions):
+        """Report per-session sizes of a session store (`get_sessions` returns a session id -> object mapping)"""
+        self._session_stores[name] = get_sessions
+
+    def start(self):
+        """Start sampling RSS in the background"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _after_fork(self):
+        """Each forked worker keeps its own history and its own sampler"""
+        self._lock = threading.Lock()
+        self.history.clear()
+        self.recycling = False
+        if self._thread is not None:
+            self._stop = threading.Event()
+            self.start()
+
+    def _run(self):
+        self.sample()
+        while not self._stop.wait(self.sample_interval):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Memory sampling failed: {str(e)}")
+
+    def sample(self):
+        """Record the current RSS and recycle the worker if it is over the ceiling"""
+        rss = current_rss_bytes()
+        with self._lock:
+            self.history.append((time.time(), rss))
+        if self.max_rss_bytes and rss > self.max_rss_bytes and not self.recycling:
+            self.recycling = True
+            logger.warning(f"Worker {os.getpid()} RSS {_format_bytes(rss)} is over the "
+                           f"{_format_bytes(self.max_rss_bytes)} ceiling; recycling")
+            if tracemalloc.is_tracing():
+                for entry in self.top_allocations(limit=10):
+                    logger.warning(f"  {entry['site']}: {_format_bytes(entry['size_bytes'])} in {entry['count']} blocks")
+            self.recycle()
+        return rss
+
+    def _recycle_worker(self):
+        """Ask gunicorn to replace this worker; other servers can't restart it, so only log"""
+        if "gunicorn" in sys.modules:
+            os.kill(os.getpid(), signal.SIGTERM)
+        else:
+            logger.warning("Not running under gunicorn; restart the server to release memory")
+
+    def top_allocations(self, limit=20, group_by="lineno", snapshot=None):
+        """Largest live allocation sites (requires tracemalloc)"""
+        if snapshot is None:
+            if not tracemalloc.is_tracing():
+                return []
+            snapshot = self._filtered(tracemalloc.take_snapshot())
+        return [_stat_to_dict(stat) for stat in snapshot.statistics(group_by)[:limit]]
+
+    @staticmethod
+    def _filtered(snapshot):
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def take_snapshot(self):
+        """Store a tracemalloc snapshot (starting tracing if needed) and return its id"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames or 1)
+            logger.info("tracemalloc started on demand; only allocations made from now on are traced")
+        snapshot = self._filtered(tracemalloc.take_snapshot())
+        with self._lock:
+            # A counter rather than the stored count: pruning holds that at max_snapshots and ids would repeat
+            snapshot_id = datetime.now().strftime("%H%M%S") + f"-{next(self._snapshot_ids)}"
+            self._snapshots[snapshot_id] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.pop(next(iter(self._snapshots)))
+        return snapshot_id
+
+    def diff(self, snapshot_id=None, limit=20, group_by="lineno"):
+        """Allocation sites that grew since a stored snapshot (the latest one by default)"""
+        with self._lock:
+            if snapshot_id is None and self._snapshots:
+                snapshot_id = next(reversed(self._snapshots))
+            baseline = self._snapshots.get(snapshot_id)
+        if baseline is None or not tracemalloc.is_tracing():
+            raise KeyError(snapshot_id)
+        current = self._filtered(tracemalloc.take_snapshot())
+        stats = current.compare_to(baseline, group_by)
+        return {
+            "since": snapshot_id,
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [_stat_to_dict(stat, diff=True) for stat in stats[:limit]],
+        }
+
+    def session_sizes(self, limit=20):
+        """Per-session deep sizes of every registered session store, largest first"""
+        report = {}
+        for name, get_sessions in self._session_stores.items():
+            try:
+                sessions = dict(get_sessions() or {})
+            except Exception as e:
+                report[name] = {"error": str(e)}
+                continue
+            sizes = sorted(((deep_sizeof(value), key) for key, value in sessions.items()), reverse=True)
+            report[name] = {
+                "sessions": len(sizes),
+                "total_bytes": sum(size for size, _ in sizes),
+                "largest": [{"session_id": key, "size_bytes": size} for size, key in sizes[:limit]],
+            }
+        return report
+
+    def report(self, limit=20, group_by="lineno"):
+        """RSS now and over time, tracemalloc state and top sites, stored snapshots and session sizes"""
+        with self._lock:
+            history = list(self.history)
+            snapshots = list(self._snapshots)
+        rss = current_rss_bytes()
+        report = {
+            "pid": os.getpid(),
+            "rss_bytes": rss,
+            "max_rss_bytes": self.max_rss_bytes or None,
+            "recycling": self.recycling,
+            "rss_history": [{"ts": round(ts, 1), "rss_bytes": value} for ts, value in history],
+            "tracemalloc": {"tracing": tracemalloc.is_tracing()},
+            "snapshots": snapshots,
+            "sessions": self.session_sizes(limit),
+        }
+        if tracemalloc.is_tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"].update({
+                "frames": tracemalloc.get_traceback_limit(),
+                "traced_bytes": traced,
+                "peak_bytes": peak,
+                "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+                "top": self.top_allocations(limit, group_by),
+            })
+        return report
+
+
+def format_report(report):
+    """Human-readable rendering of a report (or diff) for the CLI"""
+    lines = []
+    if "rss_bytes" in report:
+        ceiling = report.get("max_rss_bytes")
+        lines.append(f"pid {report['pid']}  RSS {_format_bytes(report['rss_bytes'])}"
+                     + (f" / ceiling {_format_bytes(ceiling)}" if ceiling else ""))
+        history = report.get("rss_history", [])
+        if history:
+            first, last = history[0], history[-1]
+            minutes = (last["ts"] - first["ts"]) / 60.0
+            lines.append(f"RSS {_format_bytes(first['rss_bytes'])} -> {_format_bytes(last['rss_bytes'])} "
+                         f"over {minutes:.1f} min ({len(history)} samples)")
+        trace = report.get("tracemalloc", {})
+        if trace.get("tracing"):
+            lines.append(f"tracemalloc: {_format_bytes(trace['traced_bytes'])} traced, "
+                         f"peak {_format_bytes(trace['peak_bytes'])}, overhead {_format_bytes(trace['overhead_bytes'])}")
+        else:
+            lines.append("tracemalloc: off (take a snapshot to start it)")
+        if report.get("snapshots"):
+            lines.append(f"snapshots: {', '.join(report['snapshots'])}")
+        for name, store in report.get("sessions", {}).items():
+            if "error" in store:
+                lines.append(f"{name}: {store['error']}")
+                continue
+            lines.append(f"{name}: {store['sessions']} sessions, {_format_bytes(store['total_bytes'])}")
+            for entry in store["largest"][:5]:
+                lines.append(f"  {entry['session_id']}  {_format_bytes(entry['size_bytes'])}")
+        top = trace.get("top", [])
+    else:
+        lines.append(f"since snapshot {report['since']}: {_format_bytes(report['size_diff_bytes'])}")
+        top = report["top"]
+
+    if top:
+        lines.append("top allocation sites:")
+    for entry in top:
+        delta = f" ({'+' if entry['size_diff_bytes'] >= 0 else ''}{_format_bytes(entry['size_diff_bytes'])})" \
+            if "size_diff_bytes" in entry else ""
+        lines.append(f"  {_format_bytes(entry['size_bytes']):>10}{delta}  {entry['count']:>7} blocks  {entry['site']}")
+    return "\n".join(lines)
+
+
+def main():
+    """Query a running server's memory diagnostics endpoint"""
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+    from urllib.parse import urlencode
+
+    parser = argparse.ArgumentParser(description="Memory diagnostics of a running Forge worker")
+    parser.add_argument("command", choices=["report", "snapshot", "diff"])
+    parser.add_argument("snapshot_id", nargs="?", help="Baseline for diff (default: latest snapshot)")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--group-by", default="lineno", choices=["lineno", "filename", "traceback"])
+    parser.add_argument("--secret", default=os.environ.get("PROFILE_SECRET"))
+    parser.add_argument("--json", action="store_true", help="Print the raw JSON")
+    args = parser.parse_args()
+
+    params = {"top": args.top, "group_by": args.group_by}
+    method = "GET"
+    path = "/api/debug/memory"
+    if args.command == "snapshot":
+        method, path = "POST", "/api/debug/memory/snapshot"
+    elif args.command == "diff":
+        params["diff"] = args.snapshot_id or "latest"
+    request = Request(f"{args.url.rstrip('/')}{path}?{urlencode(params)}", method=method,
+                      headers={"X-Profile": args.secret or ""})
+    try:
+        with urlopen(request) as response:
+            result = json.loads(response.read())
+    except HTTPError as e:
+        try:
+            message = json.loads(e.read()).get("error", e.reason)
+        except ValueError:
+            message = e.reason
+        sys.exit(f"{e.code}: {message}")
+
+    if args.json or args.command == "snapshot":
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import os
+import json
+import glob
+import time
+import bisect
+import atexit
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from request_profiler import span
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond storage calls to slow LLM turns
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, registry, name, help_text):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels"""
+
+    def __init__(self, registry, name, help_text, buckets=DEFAULT_BUCKETS, span_prefix=None):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # Timed blocks also show up as spans in request profiles ("<prefix>.<label values>")
+        self.span_prefix = span_prefix
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def timed(self, **labels):
+        """Decorator observing each call's duration"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block (and record it as a span when the request is profiled)"""
+        parts = [str(value) for value in labels.values()]
+        if self.span_prefix:
+            parts.insert(0, self.span_prefix)
+        start = time.perf_counter()
+        try:
+            with span(".".join(parts) or self.name):
+                yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, rendered in the Prometheus text format.
+
+    In multiprocess mode (e.g. several gunicorn workers) every process writes a
+    snapshot of its own values to `<dir>/metrics_<pid>.json` every few seconds
+    and at exit; /metrics sums the snapshots of all processes, including ones
+    that have exited, so counters never go backwards. Clear the directory when
+    the whole server is restarted.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.multiprocess_dir = None
+        self.flush_interval = 5.0
+        self._flusher = None
+        self._stop = threading.Event()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def counter(self, name, help_text):
+        metric = self.metrics.get(name) or Counter(self, name, help_text)
+        self.metrics[name] = metric
+        return metric
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, span_prefix=None):
+        metric = self.metrics.get(name) or Histogram(self, name, help_text, buckets, span_prefix)
+        self.metrics[name] = metric
+        return metric
+
+    def enable_multiprocess(self, directory, flush_interval=5.0):
+        """Share values with the other worker processes through snapshot files in `directory`"""
+        os.makedirs(directory, exist_ok=True)
+        self.multiprocess_dir = directory
+        self.flush_interval = flush_interval
+        self._start_flusher()
+        logger.info(f"Metrics multiprocess mode enabled ({directory})")
+
+    def _start_flusher(self):
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush failed: {str(e)}")
+
+    def _after_fork(self):
+        """A forked worker starts from zero (the parent's values are in the parent's own file)"""
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric.values = {}
+        if self.multiprocess_dir:
+            self._stop = threading.Event()
+            self._start_flusher()
+
+    def _local_values(self):
+        """name -> {label key: value} for this process (copies, safe to use outside the lock)"""
+        with self.lock:
+            return {
+                name: {key: (value if isinstance(metric, Counter) else [list(value[0]), value[1], value[2]])
+                       for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self):
+        """Write this process's snapshot (multiprocess mode only)"""
+        if not self.multiprocess_dir:
+            return
+        path = os.path.join(self.multiprocess_dir, f"metrics_{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({name: [[list(map(list, key)), value] for key, value in series.items()]
+                       for name, series in self._local_values().items()}, f)
+        os.replace(tmp_path, path)
+
+    def _collect(self):
+        """name -> {label key: value}, merged across processes in multiprocess mode"""
+        if not self.multiprocess_dir:
+            return self._local_values()
+
+        self.flush()
+        merged = {name: {} for name in self.metrics}
+        for path in glob.glob(os.path.join(self.multiprocess_dir, "metrics_*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, series in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for pairs, value in series:
+                    key = tuple(tuple(pair) for pair in pairs)
+                    current = merged[name].get(key)
+                    if isinstance(metric, Counter):
+                        merged[name][key] = (current or 0) + value
+                    elif current is None:
+                        merged[name][key] = value
+                    elif len(current[0]) == len(value[0]):
+                        merged[name][key] = [[a + b for a, b in zip(current[0], value[0])],
+                                             current[1] + value[1], current[2] + value[2]]
+        return merged
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, series in self._collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                continue
+
+            lines.append(f"# TYPE {name} histogram")
+            for key, (bucket_counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self):
+        """Stop the flusher and write a final snapshot"""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Metrics flush failed: {str(e)}")
+
+
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.shutdown)
+
+# Metrics shared across the app
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "forge_http_request_seconds", "HTTP request latency by endpoint and status")
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "forge_chat_stage_seconds", "Time spent in each stage of a chat turn")
+STORAGE_SECONDS = REGISTRY.histogram(
+    "forge_storage_seconds", "JSON storage operation latency", span_prefix="storage")
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "forge_llm_request_seconds", "LLM call latency by model, including dispatcher wait")
+LLM_TOKENS = REGISTRY.counter(
+    "forge_llm_tokens_total", "LLM tokens used, by model and direction (prompt/completion)")
+LLM_REQUESTS = REGISTRY.counter(
+    "forge_llm_requests_total", "LLM calls by model and outcome")
+CONTEXT_CACHE_LOOKUPS = REGISTRY.counter(
+    "forge_context_cache_lookups_total", "Context render cache lookups by result (hit/miss)")
+FALLBACK_UPDATES = REGISTRY.counter(
+    "forge_fallback_updates_total", "Chat turns that used keyword fallback consideration updates")
+FRAGMENT_CACHE_LOOKUPS = REGISTRY.counter(
+    "forge_fragment_cache_lookups_total", "Rendered HTML fragment cache lookups by fragment kind and result (hit/miss)")
@@ -1,41 +1,432 @@
 import os
+import re
 import json
+import time
 import logging
-from openai import OpenAI
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, RateLimitError
+from llm_cassette import LLMCassette
+from keyword_classifier import KeywordClassifier
+from context_cache import ContextRenderCache
+from llm_dispatcher import LLMDispatcher, LLMBackpressureError, INTERACTIVE, BACKGROUND
+from request_profiler import span
+from metrics import CHAT_STAGE_SECONDS, LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_TOKENS, FALLBACK_UPDATES
 
-# Configure detailed logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Words that make up greetings and acknowledgements ("thanks", "ok got it", "hi there")
+ACK_WORDS = {
+    'hi', 'hello', 'hey', 'there', 'thanks', 'thank', 'you', 'thx', 'ty', 'ok', 'okay', 'k', 'cool',
+    'great', 'nice', 'awesome', 'perfect', 'sure', 'yes', 'yeah', 'yep', 'no', 'nope', 'got', 'it',
+    'sounds', 'good', 'fine', 'alright', 'right', 'bye', 'goodbye', 'much', 'lot', 'a', 'so', 'that',
+    'makes', 'sense', 'will', 'do', 'love', 'appreciate', 'cheers', 'morning', 'evening'
+}
+QUESTION_WORDS = {
+    'what', 'how', 'why', 'when', 'where', 'who', 'which', 'can', 'could', 'should', 'would',
+    'is', 'are', 'do', 'does', 'did', 'will', 'any', 'may'
+}
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Fallback text for considerations matched by keyword when the model returns no updates;
+# used when a consideration in data/config.json has no "fallback_template"
+DEFAULT_FALLBACK_TEMPLATES = {
+    'problem_definition': "Based on the conversation, the problem involves {snippet}...",
+    'target_market': "Target market analysis based on: {snippet}...",
+    'solution_approach': "Solution approach considering: {snippet}...",
+    'competitive_analysis': "Competitive analysis based on: {snippet}...",
+    'business_model': "Business model considerations: {snippet}...",
+    'technical_feasibility': "Technical feasibility analysis: {snippet}...",
+    'team_structure': "Team structure considerations: {snippet}...",
+    'growth_strategy': "Growth strategy based on: {snippet}..."
+}
+
+# Default tiers: cheap model for acknowledgements and short questions, full model for content
+DEFAULT_MODEL_TIERS = {
+    "ack": {"model": "gpt-4o-mini", "max_tokens": 200, "fallback_updates": False,
+            "prompt_note": "The user is only acknowledging or greeting. Reply in one or two short sentences and leave the consideration updates section empty."},
+    "question": {"model": "gpt-4o-mini", "max_tokens": 500},
+    "content": {"model": "gpt-4o", "max_tokens": 800}
+}
+
 class OpenAIService:
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config or {}
         api_key = os.environ.get("OPENAI_API_KEY")
+        # OPENAI_BASE_URL points the client at any OpenAI-compatible endpoint,
+        # e.g. benchmarks/fake_openai_server.py for load testing
+        base_url = os.environ.get("OPENAI_BASE_URL") or None
         if api_key:
-            self.client = OpenAI(api_key=api_key)
+            self.client = OpenAI(api_key=api_key, base_url=base_url)
             self.model = "gpt-4o"  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
         else:
             self.client = None
             self.model = None
+        
+        # Optional record/replay cassette (LLM_CASSETTE_MODE=record|replay) for repeatable benchmarks
+        self.cassette = LLMCassette.from_env("data/cassettes/openai.jsonl.gz")
+        if self.cassette and self.cassette.replaying and not self.model:
+            self.model = "gpt-4o"
+        
+        # Keyword sets from config, compiled once into a word table plus phrase and prefix patterns
+        self.keyword_classifier = KeywordClassifier.from_config(self.config)
+        self.fallback_templates = self._fallback_templates_from_config(self.config)
+        
+        # Per-session memo of rendered consideration lines for _build_context
+        self.context_cache = ContextRenderCache.from_config(self.config.get('context_cache', {}))
+        
+        # Optional callable(session_id, model, usage, latency) that accounts every LLM call
+        self.usage_recorder = None
+        
+        # All outbound calls share one dispatcher (priorities, fair queueing, RPM/TPM limits)
+        self.dispatcher = LLMDispatcher.from_config(self.config.get('llm_limits', {}))
+        
+        # Tiered model routing for cheap vs. expensive turns
+        routing = self.config.get('model_routing', {})
+        self.routing_enabled = routing.get('enabled', False)
+        self.model_tiers = {tier: dict(settings) for tier, settings in DEFAULT_MODEL_TIERS.items()}
+        for tier, settings in routing.get('tiers', {}).items():
+            self.model_tiers.setdefault(tier, {}).update(settings)
+        self._routing_lock = threading.Lock()
+        self.routing_stats = {}
+        
+        # Optional fan-out pipeline: short reply call plus concurrent per-consideration drafts
+        self.drafting_config = self.config.get('parallel_drafting', {})
+        self.drafting_enabled = self.drafting_config.get('enabled', False)
+        self._drafting_pool = ThreadPoolExecutor(
+            max_workers=self.drafting_config.get('max_workers', 16),
+            thread_name_prefix="consideration-draft"
+        ) if self.drafting_enabled else None
+    
+    @property
+    def available(self):
+        """Whether LLM calls can be served (live client or cassette replay)"""
+        return self.client is not None or (self.cassette is not None and self.cassette.replaying)
+    
+    def _chat_completion(self, messages, max_tokens=None, temperature=None, response_format=None,
+                         priority=INTERACTIVE, session_id=None, model=None):
+        """Run one chat completion and return its content, usage and latency.
+        
+        Raises LLMBackpressureError when the dispatcher or the upstream API is out of capacity.
+        """
+        request = {"model": model or self.model, "messages": messages}
+        if max_tokens is not None:
+            request["max_tokens"] = max_tokens
+        if temperature is not None:
+            request["temperature"] = temperature
+        if response_format is not None:
+            request["response_format"] = response_format
+        
+        # Rough cost estimate for the token bucket, corrected with real usage afterwards
+        estimated_tokens = sum(len(m.get('content') or '') for m in messages) // 4 + (max_tokens or 1000)
+        
+        def call_api():
+            with self.dispatcher.slot(priority, session_id, estimated_tokens) as slot_usage, span(f"llm.{request['model']}"):
+                start = time.perf_counter()
+                try:
+                    response = self.client.chat.completions.create(**request)
+                except RateLimitError as e:
+                    retry_after = e.response.headers.get('retry-after') if e.response is not None else None
+                    try:
+                        retry_after = float(retry_after)
+                    except (TypeError, ValueError):
+                        retry_after = 1
+                    raise LLMBackpressureError("Upstream LLM rate limit reached", retry_after)
+                usage = response.usage.model_dump() if response.usage else {}
+                slot_usage['total_tokens'] = usage.get('total_tokens')
+                return {
+                    'content': response.choices[0].message.content,
+                    'model': response.model,
+                    'usage': usage,
+                    'latency': time.perf_counter() - start
+                }
+        
+        # Metrics use the requested model name so label values stay bounded
+        start = time.perf_counter()
+        try:
+            result = self.cassette.call(request, call_api) if self.cassette else call_api()
+        except LLMBackpressureError:
+            LLM_REQUESTS.inc(model=request["model"], outcome="backpressure")
+            raise
+        except Exception:
+            LLM_REQUESTS.inc(model=request["model"], outcome="error")
+            raise
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=request["model"])
+        LLM_REQUESTS.inc(model=request["model"], outcome="ok")
+        usage = result.get('usage') or {}
+        LLM_TOKENS.inc(usage.get('prompt_tokens') or 0, model=request["model"], direction="prompt")
+        LLM_TOKENS.inc(usage.get('completion_tokens') or 0, model=request["model"], direction="completion")
+        if self.usage_recorder:
+            self.usage_recorder(session_id, request["model"], usage, result.get('latency'))
+        return result
+    
+    def classify_turn(self, user_message):
+        """Classify a turn as 'ack', 'question' or 'content' with a cheap local heuristic"""
+        text = user_message.strip().lower()
+        words = _WORD_RE.findall(text)
+        
+        if not words or (len(words) <= 6 and all(word in ACK_WORDS for word in words)):
+            return "ack"
+        
+        is_question = text.endswith('?') or words[0] in QUESTION_WORDS
+        if is_question and len(words) <= 25 and text.count('.') <= 1:
+            return "question"
+        
+        return "content"
+    
+    def _route_turn(self, user_message):
+        """Pick the model tier for a turn; returns (tier, settings)"""
+        if not self.routing_enabled:
+            return "default", {"model": self.model, "max_tokens": 800}
+        tier = self.classify_turn(user_message)
+        settings = dict(self.model_tiers.get(tier, {}))
+        settings.setdefault("model", self.model)
+        settings.setdefault("max_tokens", 800)
+        return tier, settings
+    
+    def _record_routing(self, tier, model, latency, usage):
+        """Accumulate per-tier routing counts and latency"""
+        with self._routing_lock:
+            stats = self.routing_stats.setdefault(tier, {
+                "turns": 0, "latency_total": 0.0, "latency_max": 0.0,
+                "completion_tokens": 0, "models": {}
+            })
+            stats["turns"] += 1
+            stats["latency_total"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+            stats["completion_tokens"] += (usage or {}).get('completion_tokens') or 0
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+    
+    def get_routing_stats(self):
+        """Per-tier routing share and latency, for tuning the tier split"""
+        with self._routing_lock:
+            total = sum(stats["turns"] for stats in self.routing_stats.values())
+            return {
+                "enabled": self.routing_enabled,
+                "tiers": {
+                    tier: {
+                        "turns": stats["turns"],
+                        "share": stats["turns"] / total if total else 0.0,
+                        "avg_latency_seconds": stats["latency_total"] / stats["turns"],
+                        "max_latency_seconds": stats["latency_max"],
+                        "avg_completion_tokens": stats["completion_tokens"] / stats["turns"],
+                        "models": dict(stats["models"])
+                    }
+                    for tier, stats in self.routing_stats.items()
+                }
+            }
     
     def get_asf_response(self, user_message, session_data, consideration_categories):
         """Generate ASF response based on user message and session context"""
-        logger.info(f"=== ASF RESPONSE GENERATION START ===")
-        logger.info(f"User message: {user_message[:100]}...")
-        logger.info(f"Session data keys: {list(session_data.keys()) if session_data else 'None'}")
-        logger.info(f"Consideration categories count: {len(consideration_categories)}")
+        logger.debug("=== ASF RESPONSE GENERATION START ===")
+        logger.debug("User message: %.100s...", user_message)
+        logger.debug("Session data keys: %s", list(session_data.keys()) if session_data else 'None')
+        logger.debug("Consideration categories count: %s", len(consideration_categories))
         
-        if not self.client:
+        if not self.available:
             logger.error("OpenAI client not available - API key missing")
             return "I'm sorry, but the AI assistant is not currently available. Please check that the OpenAI API key is properly configured."
         
         try:
             # Build context from session data
-            logger.info("Building context from session data...")
-            context = self._build_context(session_data, consideration_categories)
-            logger.info(f"Built context: {context[:200]}...")
+            logger.debug("Building context from session data...")
+            with CHAT_STAGE_SECONDS.time(stage="build_context"):
+                context = self._build_context(session_data, consideration_categories)
+            logger.debug("Built context: %.200s...", context)
+            
+            # Parallel drafting: short reply call plus one concurrent draft call per touched consideration
+            tier, tier_settings = self._route_turn(user_message)
+            if self.drafting_enabled and tier in ("content", "default"):
+                with CHAT_STAGE_SECONDS.time(stage="parallel_drafting"):
+                    return self._get_parallel_drafted_response(user_message, session_data, consideration_categories,
+                                                               context, tier_settings['model'])
+            
+            with CHAT_STAGE_SECONDS.time(stage="build_prompt"):
+                # Create system prompt for ASF with consideration auto-filling instructions
+                system_prompt = self._build_system_prompt(context)
+                logger.debug("System prompt length: %s characters", len(system_prompt))
+                
+                # Get chat history for context
+                messages = self._build_chat_messages(system_prompt, session_data, user_message)
+            
+            # Apply the routed model tier
+            if tier_settings.get('prompt_note'):
+                messages[0]["content"] = system_prompt + "\n" + tier_settings['prompt_note'] + "\n"
+            
+            # Log API call details
+            logger.debug("Making OpenAI API call with model: %s (tier: %s)", tier_settings['model'], tier)
+            logger.debug("Max tokens: %s, Temperature: 0.7", tier_settings['max_tokens'])
+            
+            with CHAT_STAGE_SECONDS.time(stage="llm_call"):
+                completion = self._chat_completion(
+                    messages, max_tokens=tier_settings['max_tokens'], temperature=0.7,
+                    priority=INTERACTIVE,
+                    session_id=session_data.get('session_id') if session_data else None,
+                    model=tier_settings['model']
+                )
+            self._record_routing(tier, completion.get('model') or tier_settings['model'],
+                                 completion.get('latency', 0.0), completion.get('usage'))
             
-            # Create system prompt for ASF with consideration auto-filling instructions
-            system_prompt = f"""FORMATTING RULE: Use ONLY plain text. NO bold, NO asterisks, NO markdown, NO special formatting. Just regular text.
+            ai_response = completion['content']
+            logger.debug("API response received, length: %s characters", len(ai_response))
+            logger.debug("Response preview: %.200s...", ai_response)
+            
+            # Extract consideration updates from response
+            with CHAT_STAGE_SECONDS.time(stage="parse_response"):
+                consideration_updates = self._extract_consideration_updates(ai_response)
+                clean_response = self._clean_response(ai_response)
+            logger.debug("Extracted consideration updates: %s", consideration_updates)
+            
+            # If no consideration updates found, generate them based on context
+            if not consideration_updates and tier_settings.get('fallback_updates', True):
+                logger.debug("No consideration updates found, generating fallback updates")
+                consideration_updates = self._generate_fallback_updates(user_message, session_data, consideration_categories)
+                logger.debug("Generated fallback updates: %s", consideration_updates)
+            
+            logger.debug("Clean response length: %s characters", len(clean_response))
+            
+            logger.debug("=== ASF RESPONSE GENERATION END ===")
+            
+            # Return both response and consideration updates
+            return {
+                'response': clean_response,
+                'consideration_updates': consideration_updates
+            }
+            
+        except LLMBackpressureError:
+            # Let the route turn this into a 429 with Retry-After
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            logger.error(f"Error type: {type(e).__name__}")
+            return {
+                'response': "I apologize, but I'm having trouble processing your request right now. Please try again in a moment.",
+                'consideration_updates': {}
+            }
+    
+    def _build_chat_messages(self, system_prompt, session_data, user_message):
+        """System prompt, the last 10 exchanges and the current user message"""
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # Add recent chat history if available
+        if session_data and 'chat_history' in session_data:
+            recent_messages = session_data['chat_history'][-10:]  # Last 10 messages
+            logger.debug("Adding %s recent messages to context", len(recent_messages))
+            for msg in recent_messages:
+                messages.append({"role": "user", "content": msg.get('user_message', '')})
+                messages.append({"role": "assistant", "content": msg.get('ai_response', '')})
+        else:
+            logger.debug("No chat history found in session data")
+        
+        # Add current user message
+        messages.append({"role": "user", "content": user_message})
+        logger.debug("Total messages for API call: %s", len(messages))
+        return messages
+    
+    def _touched_considerations(self, user_message, consideration_categories, limit):
+        """Considerations the message's keywords match, best first, up to limit"""
+        valid_ids = {cat['id'] for cat in consideration_categories}
+        return [cid for cid in self.keyword_classifier.rank(user_message) if cid in valid_ids][:limit]
+    
+    def _draft_consideration(self, category, session_data, user_message, session_id, model=None):
+        """Draft or extend one consideration with its own short LLM call"""
+        considerations = session_data.get('considerations', {}) if session_data else {}
+        current = considerations.get(category['id'], '')
+        if isinstance(current, dict):
+            current = current.get('content', '')
+        
+        recent = []
+        if session_data:
+            for msg in session_data.get('chat_history', [])[-3:]:
+                recent.append(f"User: {msg.get('user_message', '')}")
+        recent.append(f"User: {user_message}")
+        
+        prompt = f"""You are drafting one section of a startup plan. Use plain text only, no markdown.
+
+Section: {category['title']}
+Purpose: {category.get('description', '')}
+
+Current draft:
+{current.strip() or 'Not started'}
+
+Recent conversation:
+{chr(10).join(recent)}
+
+Write the updated section. Keep what is still accurate in the current draft, add what the conversation adds, and aim for at least 100 words. Output only the section text."""
+        
+        completion = self._chat_completion(
+            [{"role": "user", "content": prompt}],
+            max_tokens=self.drafting_config.get('draft_max_tokens', 250),
+            temperature=0.7,
+            priority=INTERACTIVE,
+            session_id=session_id,
+            model=model
+        )
+        return completion['content'].strip()
+    
+    def _get_parallel_drafted_response(self, user_message, session_data, consideration_categories, context, model):
+        """Reply from one short call while each touched consideration is drafted concurrently"""
+        session_id = session_data.get('session_id') if session_data else None
+        categories_by_id = {cat['id']: cat for cat in consideration_categories}
+        touched = self._touched_considerations(
+            user_message, consideration_categories, self.drafting_config.get('max_considerations', 3)
+        )
+        logger.debug("Parallel drafting for considerations: %s", touched)
+        
+        reply_messages = self._build_chat_messages(
+            self._build_system_prompt(context, include_updates=False), session_data, user_message
+        )
+        # Each task runs in a copy of this context so its log records stay in the turn's trace
+        reply_future = self._drafting_pool.submit(
+            contextvars.copy_context().run, self._chat_completion, reply_messages,
+            max_tokens=self.drafting_config.get('reply_max_tokens', 300), temperature=0.7,
+            priority=INTERACTIVE, session_id=session_id, model=self.drafting_config.get('reply_model', model)
+        )
+        draft_futures = {
+            cid: self._drafting_pool.submit(contextvars.copy_context().run, self._draft_consideration,
+                                            categories_by_id[cid], session_data, user_message, session_id,
+                                            self.drafting_config.get('draft_model', model))
+            for cid in touched
+        }
+        
+        start = time.perf_counter()
+        completion = reply_future.result()
+        self._record_routing("parallel_reply", completion.get('model') or self.model,
+                             completion.get('latency', 0.0), completion.get('usage'))
+        
+        consideration_updates = {}
+        for cid, future in draft_futures.items():
+            try:
+                draft = future.result()
+                if draft:
+                    consideration_updates[cid] = draft
+            except LLMBackpressureError:
+                logger.warning(f"Skipped draft for {cid}: LLM capacity exhausted")
+            except Exception as e:
+                logger.error(f"Draft for {cid} failed: {str(e)}")
+        logger.debug("Parallel drafting finished in %.2fs with %d/%d drafts",
+                     time.perf_counter() - start, len(consideration_updates), len(touched))
+        
+        if not consideration_updates:
+            consideration_updates = self._generate_fallback_updates(user_message, session_data, consideration_categories)
+        
+        return {
+            'response': self._clean_response(completion['content']),
+            'consideration_updates': consideration_updates
+        }
+    
+    def _build_system_prompt(self, context, include_updates=True):
+        """Build the ASF system prompt; without updates it asks for the conversational reply only"""
+        if include_updates:
+            role_items = """7. AUTO-FILL consideration content based on the conversation
+8. Ask about remaining incomplete considerations
+"""
+        else:
+            role_items = """7. Ask about remaining incomplete considerations
+"""
+        
+        prompt = f"""FORMATTING RULE: Use ONLY plain text. NO bold, NO asterisks, NO markdown, NO special formatting. Just regular text.
 
 You are the Agentic Startup Factory (ASF), an AI assistant that helps ideators refine startup ideas through structured considerations. You guide users through 8 core consideration categories to develop comprehensive startup concepts.
 
@@ -46,14 +437,14 @@ Your role is to:
 4. Maintain focus on practical, actionable advice
 5. Encourage ethical business practices and community collaboration
 6. Suggest when considerations need more detail (minimum 100 words each)
-7. AUTO-FILL consideration content based on the conversation
-8. Ask about remaining incomplete considerations
-
+{role_items}
 CRITICAL: Use plain text only. No bold formatting, no asterisks, no markdown, no special characters. Just regular text.
 
 RESPONSE LENGTH: Keep responses concise and focused. Aim for 2-3 sentences per point. Avoid lengthy explanations unless specifically requested.
 
-MANDATORY: After your conversational response, you MUST include consideration updates in this exact format:
+"""
+        if include_updates:
+            prompt += """MANDATORY: After your conversational response, you MUST include consideration updates in this exact format:
 
 === CONSIDERATION UPDATES ===
 [consideration_id]: [content]
@@ -65,134 +456,104 @@ problem_definition: Rural clinics face significant challenges with manual patien
 target_market: Primary target includes rural healthcare clinics, community health centers, and small medical practices in low-bandwidth regions across developing countries and remote areas.
 === END CONSIDERATION UPDATES ===
 
-Current session context:
+"""
+        else:
+            prompt += """Do NOT include any consideration updates section. The business plan sections are drafted separately.
+
+"""
+        prompt += f"""Current session context:
 {context}
 
-Be conversational, supportive, and focus on helping the user develop a strong startup concept. Use plain text without any formatting. Keep responses concise and easy to read. Always ask about remaining incomplete considerations to guide the user toward completing all 8 areas. ALWAYS include consideration updates section at the end of your response.
+Be conversational, supportive, and focus on helping the user develop a strong startup concept. Use plain text without any formatting. Keep responses concise and easy to read. Always ask about remaining incomplete considerations to guide the user toward completing all 8 areas."""
+        if include_updates:
+            prompt += """ ALWAYS include consideration updates section at the end of your response.
 """
-            logger.info(f"System prompt length: {len(system_prompt)} characters")
-            
-            # Get chat history for context
-            messages = [{"role": "system", "content": system_prompt}]
-            
-            # Add recent chat history if available
-            if session_data and 'chat_history' in session_data:
-                recent_messages = session_data['chat_history'][-10:]  # Last 10 messages
-                logger.info(f"Adding {len(recent_messages)} recent messages to context")
-                for msg in recent_messages:
-                    messages.append({"role": "user", "content": msg.get('user_message', '')})
-                    messages.append({"role": "assistant", "content": msg.get('ai_response', '')})
-            else:
-                logger.info("No chat history found in session data")
-            
-            # Add current user message
-            messages.append({"role": "user", "content": user_message})
-            logger.info(f"Total messages for API call: {len(messages)}")
-            
-            # Log API call details
-            logger.info(f"Making OpenAI API call with model: {self.model}")
-            logger.info(f"Max tokens: 800, Temperature: 0.7")
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=800,
-                temperature=0.7
-            )
-            
-            ai_response = response.choices[0].message.content
-            logger.info(f"API response received, length: {len(ai_response)} characters")
-            logger.info(f"Response preview: {ai_response[:200]}...")
-            
-            # Extract consideration updates from response
-            consideration_updates = self._extract_consideration_updates(ai_response)
-            logger.info(f"Extracted consideration updates: {consideration_updates}")
-            
-            # If no consideration updates found, generate them based on context
-            if not consideration_updates:
-                logger.info("No consideration updates found, generating fallback updates")
-                consideration_updates = self._generate_fallback_updates(user_message, session_data, consideration_categories)
-                logger.info(f"Generated fallback updates: {consideration_updates}")
-            
-            # Clean response by removing consideration update section
-            clean_response = self._clean_response(ai_response)
-            logger.info(f"Clean response length: {len(clean_response)} characters")
-            
-            logger.info(f"=== ASF RESPONSE GENERATION END ===")
-            
-            # Return both response and consideration updates
-            return {
-                'response': clean_response,
-                'consideration_updates': consideration_updates
-            }
-            
-        except Exception as e:
-            logger.error(f"OpenAI API error: {str(e)}")
-            logger.error(f"Error type: {type(e).__name__}")
-            return {
-                'response': "I apologize, but I'm having trouble processing your request right now. Please try again in a moment.",
-                'consideration_updates': {}
-            }
+        else:
+            prompt += "\n"
+        return prompt
     
     def _build_context(self, session_data, consideration_categories):
         """Build context string from session data"""
-        logger.info("=== BUILDING CONTEXT ===")
+        logger.debug("=== BUILDING CONTEXT ===")
         
         if not session_data:
-            logger.info("No session data - returning default context")
+            logger.debug("No session data - returning default context")
             return "New session - no previous considerations completed."
         
         context_parts = []
         
         # Add completion status
         considerations = session_data.get('considerations', {})
-        logger.info(f"Considerations in session: {list(considerations.keys())}")
+        logger.debug("Considerations in session: %s", list(considerations.keys()))
+        
+        # Unchanged considerations reuse their cached word counts and summary lines
+        session_id = session_data.get('session_id')
+        cached = self.context_cache.lines_for(session_id) if self.context_cache and session_id else None
         
         # Handle both old string format and new dict format for completion count
         completed_count = 0
-        for content in considerations.values():
+        for cat_id, content in considerations.items():
             if isinstance(content, dict):
                 content_text = content.get('content', '').strip()
             else:
                 content_text = content.strip()
-            if len(content_text.split()) >= 100:
+            if self._cached_render(cached, ('words', cat_id), self._fingerprint(content_text),
+                                   lambda: len(content_text.split()) >= 100):
                 completed_count += 1
-        logger.info(f"Completed considerations: {completed_count}/8")
+        logger.debug("Completed considerations: %s/8", completed_count)
         context_parts.append(f"Completed considerations: {completed_count}/8")
         
         # Add brief summary of each completed consideration
         for cat in consideration_categories:
-            cat_id = cat['id']
-            consideration_data = considerations.get(cat_id, '')
-            
-            # Handle both old string format and new dict format
+            consideration_data = considerations.get(cat['id'], '')
             if isinstance(consideration_data, dict):
-                content = consideration_data.get('content', '').strip()
-                is_complete = consideration_data.get('is_complete', False)
+                fingerprint = (cat['title'], consideration_data.get('is_complete', False),
+                               self._fingerprint(consideration_data.get('content', '')))
             else:
-                content = consideration_data.strip()
-                is_complete = len(content.split()) >= 100
-            
-            logger.info(f"Consideration '{cat['title']}': {len(content)} characters, complete: {is_complete}")
-            
-            if content:
-                summary = content[:150] + "..." if len(content) > 150 else content
-                status = "COMPLETE" if is_complete else "INCOMPLETE"
-                context_parts.append(f"{cat['title']}: {status} - {summary}")
-                logger.info(f"  - Has content: {summary[:50]}...")
-            else:
-                context_parts.append(f"{cat['title']}: NOT STARTED")
-                logger.info(f"  - No content yet")
+                fingerprint = (cat['title'], None, self._fingerprint(consideration_data))
+            context_parts.append(self._cached_render(cached, ('line', cat['id']), fingerprint,
+                                                     lambda: self._render_consideration_line(cat, consideration_data)))
         
         final_context = "\n".join(context_parts)
-        logger.info(f"Final context length: {len(final_context)} characters")
-        logger.info("=== CONTEXT BUILDING END ===")
+        logger.debug("Final context length: %s characters", len(final_context))
+        logger.debug("=== CONTEXT BUILDING END ===")
         
         return final_context
     
+    @staticmethod
+    def _fingerprint(text):
+        """Cheap content fingerprint for the context cache"""
+        return len(text), hash(text)
+    
+    def _cached_render(self, lines, key, fingerprint, render):
+        """Reuse a cached context value when its fingerprint is unchanged (lines is None: no caching)"""
+        if lines is None:
+            return render()
+        return self.context_cache.get_or_render(lines, key, fingerprint, render)
+    
+    def _render_consideration_line(self, cat, consideration_data):
+        """One consideration's status and 150-character summary for the context"""
+        # Handle both old string format and new dict format
+        if isinstance(consideration_data, dict):
+            content = consideration_data.get('content', '').strip()
+            is_complete = consideration_data.get('is_complete', False)
+        else:
+            content = consideration_data.strip()
+            is_complete = len(content.split()) >= 100
+        
+        logger.debug("Consideration '%s': %s characters, complete: %s", cat['title'], len(content), is_complete)
+        
+        if content:
+            summary = content[:150] + "..." if len(content) > 150 else content
+            status = "COMPLETE" if is_complete else "INCOMPLETE"
+            logger.debug("  - Has content: %.50s...", summary)
+            return f"{cat['title']}: {status} - {summary}"
+        logger.debug("  - No content yet")
+        return f"{cat['title']}: NOT STARTED"
+    
     def _extract_consideration_updates(self, ai_response):
         """Extract consideration updates from AI response"""
-        logger.info("=== EXTRACTING CONSIDERATION UPDATES ===")
+        logger.debug("=== EXTRACTING CONSIDERATION UPDATES ===")
         
         consideration_updates = {}
         
@@ -207,7 +568,7 @@ Be conversational, supportive, and focus on helping the user develop a strong st
             if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
                 # Extract the consideration updates section
                 updates_section = ai_response[start_idx + len(start_marker):end_idx].strip()
-                logger.info(f"Found consideration updates section: {updates_section[:200]}...")
+                logger.debug("Found consideration updates section: %.200s...", updates_section)
                 
                 # Parse each line
                 for line in updates_section.split('\n'):
@@ -219,20 +580,20 @@ Be conversational, supportive, and focus on helping the user develop a strong st
                         
                         if consideration_id and content:
                             consideration_updates[consideration_id] = content
-                            logger.info(f"Extracted: {consideration_id} -> {content[:50]}...")
+                            logger.debug("Extracted: %s -> %.50s...", consideration_id, content)
             else:
-                logger.info("No consideration updates section found in response")
+                logger.debug("No consideration updates section found in response")
                 
         except Exception as e:
             logger.error(f"Error extracting consideration updates: {str(e)}")
         
-        logger.info(f"Total consideration updates extracted: {len(consideration_updates)}")
-        logger.info("=== CONSIDERATION EXTRACTION END ===")
+        logger.debug("Total consideration updates extracted: %s", len(consideration_updates))
+        logger.debug("=== CONSIDERATION EXTRACTION END ===")
         return consideration_updates
     
     def _clean_response(self, ai_response):
         """Remove consideration updates section from response"""
-        logger.info("=== CLEANING RESPONSE ===")
+        logger.debug("=== CLEANING RESPONSE ===")
         
         # Look for consideration updates section and remove it
         start_marker = "=== CONSIDERATION UPDATES ==="
@@ -244,17 +605,18 @@ Be conversational, supportive, and focus on helping the user develop a strong st
             if end_idx != -1:
                 # Remove the entire section including markers
                 cleaned_response = ai_response[:start_idx].strip() + ai_response[end_idx + len(end_marker):].strip()
-                logger.info(f"Removed consideration updates section, cleaned length: {len(cleaned_response)}")
-                logger.info("=== RESPONSE CLEANING END ===")
+                logger.debug("Removed consideration updates section, cleaned length: %s", len(cleaned_response))
+                logger.debug("=== RESPONSE CLEANING END ===")
                 return cleaned_response
         
-        logger.info("No consideration updates section found, keeping original response")
-        logger.info("=== RESPONSE CLEANING END ===")
+        logger.debug("No consideration updates section found, keeping original response")
+        logger.debug("=== RESPONSE CLEANING END ===")
         return ai_response
     
     def _generate_fallback_updates(self, user_message, session_data, consideration_categories):
         """Generate fallback consideration updates when AI doesn't provide them"""
-        logger.info("=== GENERATING FALLBACK UPDATES ===")
+        logger.debug("=== GENERATING FALLBACK UPDATES ===")
+        FALLBACK_UPDATES.inc()
         
         # Get current considerations
         current_considerations = session_data.get('considerations', {}) if session_data else {}
@@ -262,51 +624,20 @@ Be conversational, supportive, and focus on helping the user develop a strong st
         # Determine which considerations might need updates based on user message
         potential_updates = {}
         
-        # Simple keyword-based mapping
-        message_lower = user_message.lower()
+        # Keyword matches, strongest first (the message is scanned once)
+        keyword_scores = self.keyword_classifier.score(user_message)
+        logger.debug("Keyword scores: %s", keyword_scores)
         
         # Track how many updates we've generated
         updates_generated = 0
         max_updates = 3  # Try to fill 2-3 considerations
         
-        if any(word in message_lower for word in ['problem', 'issue', 'challenge']):
-            if 'problem_definition' not in current_considerations or not self._has_content(current_considerations.get('problem_definition')):
-                potential_updates['problem_definition'] = f"Based on the conversation, the problem involves {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['market', 'customer', 'user', 'target']):
-            if 'target_market' not in current_considerations or not self._has_content(current_considerations.get('target_market')):
-                potential_updates['target_market'] = f"Target market analysis based on: {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['solution', 'approach', 'how', 'method']):
-            if 'solution_approach' not in current_considerations or not self._has_content(current_considerations.get('solution_approach')):
-                potential_updates['solution_approach'] = f"Solution approach considering: {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['competitor', 'competition', 'competitive']):
-            if 'competitive_analysis' not in current_considerations or not self._has_content(current_considerations.get('competitive_analysis')):
-                potential_updates['competitive_analysis'] = f"Competitive analysis based on: {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['business', 'revenue', 'money', 'model']):
-            if 'business_model' not in current_considerations or not self._has_content(current_considerations.get('business_model')):
-                potential_updates['business_model'] = f"Business model considerations: {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['technical', 'technology', 'feasibility', 'tech']):
-            if 'technical_feasibility' not in current_considerations or not self._has_content(current_considerations.get('technical_feasibility')):
-                potential_updates['technical_feasibility'] = f"Technical feasibility analysis: {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['team', 'people', 'hire', 'role']):
-            if 'team_structure' not in current_considerations or not self._has_content(current_considerations.get('team_structure')):
-                potential_updates['team_structure'] = f"Team structure considerations: {user_message[:100]}..."
-                updates_generated += 1
-        
-        if any(word in message_lower for word in ['growth', 'scale', 'expand', 'strategy']):
-            if 'growth_strategy' not in current_considerations or not self._has_content(current_considerations.get('growth_strategy')):
-                potential_updates['growth_strategy'] = f"Growth strategy based on: {user_message[:100]}..."
+        for consideration_id in self.keyword_classifier.order(keyword_scores):
+            template = self.fallback_templates.get(consideration_id)
+            if not template:
+                continue
+            if consideration_id not in current_considerations or not self._has_content(current_considerations.get(consideration_id)):
+                potential_updates[consideration_id] = template.format(snippet=user_message[:100])
                 updates_generated += 1
         
         # If we haven't generated enough updates, fill some empty considerations
@@ -328,10 +659,19 @@ Be conversational, supportive, and focus on helping the user develop a strong st
                     potential_updates[consideration_id] = f"Basic {consideration_id.replace('_', ' ')} considerations based on the startup idea..."
                     updates_generated += 1
         
-        logger.info(f"Generated {len(potential_updates)} fallback updates")
-        logger.info("=== FALLBACK UPDATES END ===")
+        logger.debug("Generated %s fallback updates", len(potential_updates))
+        logger.debug("=== FALLBACK UPDATES END ===")
         return potential_updates
     
+    @staticmethod
+    def _fallback_templates_from_config(config):
+        """Fallback text per consideration: its "fallback_template", the built-in default, or one from its title"""
+        templates = dict(DEFAULT_FALLBACK_TEMPLATES)
+        for cat in config.get('considerations', []):
+            template = cat.get('fallback_template') or DEFAULT_FALLBACK_TEMPLATES.get(cat['id'])
+            templates[cat['id']] = template or f"{cat.get('title', cat['id'])} considerations based on: {{snippet}}..."
+        return templates
+    
     def _has_content(self, consideration_data):
         """Check if consideration has meaningful content"""
         if isinstance(consideration_data, dict):
@@ -341,8 +681,11 @@ Be conversational, supportive, and focus on helping the user develop a strong st
         return len(content.strip()) > 50  # At least 50 characters
     
     def generate_equity_suggestion(self, team_structure, contribution_data):
-        """Generate equity split suggestions based on team structure and contributions"""
-        if not self.client:
+        """Generate equity split suggestions based on team structure and contributions
+        
+        Runs at background priority; raises LLMBackpressureError when capacity is exhausted.
+        """
+        if not self.available:
             return {"error": "AI assistant is not currently available. Please check that the OpenAI API key is properly configured."}
         
         try:
@@ -360,14 +703,16 @@ Provide a JSON response with:
 Focus on fairness, long-term sustainability, and alignment with startup best practices.
 """
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                response_format={"type": "json_object"}
+            completion = self._chat_completion(
+                [{"role": "user", "content": prompt}],
+                response_format={"type": "json_object"},
+                priority=BACKGROUND
             )
             
-            return json.loads(response.choices[0].message.content)
+            return json.loads(completion['content'])
             
+        except LLMBackpressureError:
+            raise
         except Exception as e:
             logging.error(f"Equity suggestion error: {str(e)}")
             return {"error": "Unable to generate equity suggestions at this time"}
@@ -0,0 +1,179 @@
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import cProfile
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Innermost open span of the request being profiled; None for normal requests
+_current_span = contextvars.ContextVar("profile_span", default=None)
+_span_lock = threading.Lock()
+
+
+class Span:
+    """A named, timed block with child spans"""
+
+    __slots__ = ("name", "start", "end", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration_ms(self):
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self):
+        return {"name": self.name, "ms": round(self.duration_ms, 3),
+                "children": [child.to_dict() for child in self.children]}
+
+    def compact(self):
+        """One-line rendering: name 12.3ms[child 1.0ms, child 4.2ms[...]]"""
+        text = f"{self.name} {self.duration_ms:.1f}ms"
+        if self.children:
+            text += "[" + ", ".join(child.compact() for child in self.children) + "]"
+        return text
+
+
+@contextmanager
+def span(name):
+    """Record a child span when the current request is being profiled (no-op otherwise)"""
+    parent = _current_span.get()
+    if parent is None:
+        yield
+        return
+    child = Span(name)
+    with _span_lock:
+        parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval and counts folded stacks"""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """Brendan Gregg's folded format, one `frame;frame;frame count` line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Opt-in profiling of a single request.
+
+    A request is profiled when it carries the secret in the X-Profile header or
+    the `_profile` query parameter; the secret comes from the PROFILE_SECRET
+    environment variable, and profiling is off when it is unset.
+    X-Profile-Mode (or `_profile_mode`) picks `cprofile` (default, saved as a
+    pstats `.prof` file for snakeviz/flameprof) or `sample` (a stack sampler
+    saving folded stacks for flamegraph.pl/speedscope). Stage timings are
+    returned as Server-Timing and X-Span-Tree headers.
+    """
+
+    def __init__(self, secret, output_dir="data/profiles", sample_interval=0.001, max_header_bytes=4000):
+        self.secret = secret
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.max_header_bytes = max_header_bytes
+
+    @classmethod
+    def from_config(cls, settings):
+        """Build a profiler from the "profiling" config section, or None when no secret is set"""
+        secret = os.environ.get(settings.get('secret_env', 'PROFILE_SECRET'))
+        if not settings.get('enabled', True) or not secret:
+            return None
+        return cls(secret,
+                   output_dir=settings.get('output_dir', 'data/profiles'),
+                   sample_interval=settings.get('sample_interval_ms', 1) / 1000.0,
+                   max_header_bytes=settings.get('max_header_bytes', 4000))
+
+    def requested_mode(self, request):
+        """Profiling mode if the request carries a valid secret, else None"""
+        supplied = request.headers.get('X-Profile') or request.args.get('_profile')
+        if not supplied or not hmac.compare_digest(supplied.encode(), self.secret.encode()):
+            return None
+        mode = request.headers.get('X-Profile-Mode') or request.args.get('_profile_mode') or 'cprofile'
+        return mode if mode in ('cprofile', 'sample') else 'cprofile'
+
+    def begin(self, mode, name):
+        """Start profiling the current thread; returns the state to pass to finish()"""
+        root = Span(name)
+        state = {"mode": mode, "root": root, "token": _current_span.set(root)}
+        if mode == 'sample':
+            state["sampler"] = StackSampler(threading.get_ident(), self.sample_interval)
+            state["sampler"].start()
+        else:
+            state["profile"] = cProfile.Profile()
+            state["profile"].enable()
+        return state
+
+    def finish(self, state):
+        """Stop profiling, save the capture and return the headers to add to the response"""
+        root = state["root"]
+        root.end = time.perf_counter()
+        _current_span.reset(state["token"])
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        capture_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        if state["mode"] == 'sample':
+            state["sampler"].stop()
+            path = os.path.join(self.output_dir, f"{capture_id}.folded")
+            with open(path, 'w') as f:
+                f.write(state["sampler"].folded())
+        else:
+            state["profile"].disable()
+            path = os.path.join(self.output_dir, f"{capture_id}.prof")
+            state["profile"].dump_stats(path)
+        with open(os.path.join(self.output_dir, f"{capture_id}.spans.json"), 'w') as f:
+            json.dump(root.to_dict(), f, indent=2)
+        logger.info(f"Saved request profile {path} ({root.duration_ms:.1f}ms)")
+
+        server_timing = ", ".join(
+            f'{child.name.replace(" ", "_")};dur={child.duration_ms:.2f}' for child in root.children
+        )
+        tree = root.compact()
+        if len(tree) > self.max_header_bytes:
+            tree = tree[:self.max_header_bytes - 3] + "..."
+        return {
+            "Server-Timing": f"total;dur={root.duration_ms:.2f}" + (f", {server_timing}" if server_timing else ""),
+            "X-Span-Tree": tree,
+            "X-Profile-File": os.path.basename(path),
+        }
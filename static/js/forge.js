@@ -159,7 +159,12 @@ class ForgeInterface {
                 body: JSON.stringify({ message: message })
             });
             
-            const data = await response.json();
+            let data = await response.json();
+            
+            // Queue mode: the turn runs in the background, long-poll for its result
+            if (response.status === 202 && data.job_id) {
+                data = await this.waitForChatResult(data.result_url);
+            }
             
             if (data.response) {
                 this.addMessageToChat(data.response, 'assistant');
@@ -172,6 +177,9 @@ class ForgeInterface {
                 
                 // Reload session status to get updated completion counts
                 await this.loadSessionStatus();
+            } else if (data.budget) {
+                // Session usage limit reached: show the server's explanation instead of a generic error
+                this.addMessageToChat(data.error, 'assistant');
             } else {
                 throw new Error(data.error || 'Failed to get response');
             }
@@ -185,6 +193,18 @@ class ForgeInterface {
         }
     }
     
+    async waitForChatResult(resultUrl) {
+        while (true) {
+            const response = await fetch(`${resultUrl}?wait=25`);
+            const data = await response.json();
+            
+            if (data.status === 'queued' || data.status === 'running') {
+                continue;
+            }
+            return data;
+        }
+    }
+    
     addMessageToChat(message, sender) {
         const messageDiv = document.createElement('div');
         messageDiv.className = `message ${sender}`;